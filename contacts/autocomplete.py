@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""
+Builds a prefix index for type-ahead over agency names, office names,
+abbreviations and USA Contacts synonyms. The index is a sorted array of
+normalized keys; every key points at a target, and targets are stored in
+rank order so the best k matches for a prefix are simply the k smallest
+target numbers in the matching slice of the array.
+"""
+
+import argparse
+from bisect import bisect_left
+import heapq
+import json
+import os
+import re
+
+from scraper import DATA_DIRECTORY
+from sharding import agency_paths, load_path, path_agency
+
+
+INDEX_FILENAME = 'autocomplete.json'
+USA_CONTACTS_FILENAME = 'layering_data/all_usa_data.json'
+INDEX_VERSION = 1
+# Results for prefixes up to this length are precomputed, as their slice of
+# the key array can cover a large part of the index.
+SHORT_PREFIX = 2
+MAX_RESULTS = 20
+
+AGENCY_WEIGHT = 3
+TOP_LEVEL_WEIGHT = 2
+OFFICE_WEIGHT = 1
+
+
+def normalize(text):
+    """ Lowercase, drop punctuation and collapse white space """
+    text = re.sub(r"[^\w\s]", '', text.lower())
+    return ' '.join(text.split())
+
+
+def keys_for(text):
+    """ A name can be found from the start of any of its words, so that
+    'justice' finds 'Department of Justice' """
+    words = normalize(text).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+def load_synonyms(filename=USA_CONTACTS_FILENAME):
+    """ Map USA Contacts ids to their synonyms, using the file saved by
+    usagov.py when it is available """
+    synonyms = {}
+    if os.path.isfile(filename):
+        with open(filename) as f:
+            for contact in json.load(f):
+                if contact.get('Synonym'):
+                    synonyms[str(contact['Id'])] = contact['Synonym']
+    return synonyms
+
+
+def record_terms(data, synonyms):
+    """ All of the strings a record can be found by """
+    terms = [data['name']]
+    if data.get('abbreviation'):
+        terms.append(data['abbreviation'])
+    terms.extend(synonyms.get(str(data.get('usa_id')), []))
+    return terms
+
+
+def collect_targets(data_directory=DATA_DIRECTORY, synonyms=None):
+    """ Yield (weight, target, terms) for each agency and office """
+    if synonyms is None:
+        synonyms = load_synonyms()
+    for path in agency_paths(data_directory):
+        agency_abbr = path_agency(path)
+        data = load_path(path)
+        terms = record_terms(data, synonyms) + [agency_abbr]
+        yield AGENCY_WEIGHT, {'name': data['name'], 'agency': agency_abbr,
+                              'department': None}, terms
+        for department in data.get('departments', []):
+            weight = OFFICE_WEIGHT
+            if department.get('top_level'):
+                weight = TOP_LEVEL_WEIGHT
+            target = {'name': department['name'], 'agency': agency_abbr,
+                      'department': department['name']}
+            yield weight, target, record_terms(department, synonyms)
+
+
+def build_index(targets):
+    """ Turn (weight, target, terms) into the index structure. Targets are
+    sorted by descending weight, then name, so a target's position is its
+    rank. """
+    targets = sorted(targets, key=lambda t: (-t[0], t[1]['name'],
+                                             t[1]['agency']))
+    entries = set()
+    for rank, (_, _, terms) in enumerate(targets):
+        for term in terms:
+            for key in keys_for(term):
+                entries.add((key, rank))
+    entries = sorted(entries)
+
+    short = {}
+    for key, rank in entries:
+        for length in range(1, min(SHORT_PREFIX, len(key)) + 1):
+            short.setdefault(key[:length], set()).add(rank)
+    short = dict((prefix, sorted(ranks)[:MAX_RESULTS])
+                 for prefix, ranks in short.items())
+
+    return {'version': INDEX_VERSION,
+            'targets': [t[1] for t in targets],
+            'keys': [e[0] for e in entries],
+            'ranks': [e[1] for e in entries],
+            'short': short}
+
+
+def save_index(index, filename=INDEX_FILENAME):
+    with open(filename, 'w') as f:
+        json.dump(index, f, separators=(',', ':'), sort_keys=True)
+
+
+def load_index(filename=INDEX_FILENAME):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def lookup(index, prefix, k=10):
+    """ Return the k best targets with a name, abbreviation or synonym
+    starting with (a word starting with) `prefix` """
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+    if len(prefix) <= SHORT_PREFIX and k <= MAX_RESULTS:
+        ranks = index['short'].get(prefix, [])[:k]
+    else:
+        keys = index['keys']
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\uffff', start)
+        ranks = heapq.nsmallest(k, set(index['ranks'][start:end]))
+    return [index['targets'][rank] for rank in ranks]
+
+
+if __name__ == "__main__":
+    """
+        python autocomplete.py
+        builds autocomplete.json from data/
+
+        python autocomplete.py --lookup "justice"
+        prints the best matches from an existing index
+    """
+    parser = argparse.ArgumentParser(
+        description='Build or query the agency/office autocomplete index.')
+    parser.add_argument('--lookup', help='print matches for this prefix')
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.lookup:
+        for target in lookup(load_index(), args.lookup, args.k):
+            print('%s (%s)' % (target['name'], target['agency']))
+    else:
+        save_index(build_index(collect_targets()))
@@ -0,0 +1,133 @@
+"""
+Machine-readable changesets between dataset builds, so that downstream
+systems can apply deltas rather than reloading every file. Each change names
+the agency, the department (None for the agency's own fields), the path of
+the field and its old and new values:
+
+    {"agency": "DOJ", "department": "Antitrust Division",
+     "path": ["address", "zip"], "old": "20530", "new": "20530-0001"}
+
+A missing value is None. A department that was added or removed has an
+empty path and None as its old or new value. When departments end up in a
+different order, the agency gets a change with the path ["departments"]
+whose old and new values are lists of department names.
+"""
+
+from copy import deepcopy
+import json
+
+
+CHANGESET_FILE = 'changeset.jsonl'
+DEPARTMENTS_PATH = ['departments']
+
+
+def diff_values(old, new, path=()):
+    """ Yield (path, old, new) for each difference, descending into dicts.
+    Lists and scalars are compared as a whole. """
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict):
+        for key in sorted(set(old) | set(new)):
+            for change in diff_values(old.get(key), new.get(key),
+                                      path + (key,)):
+                yield change
+    else:
+        yield list(path), old, new
+
+
+def without_departments(data):
+    return dict((k, v) for k, v in data.items() if k != 'departments')
+
+
+def departments_by_name(data):
+    return dict((d['name'], d) for d in data.get('departments', []))
+
+
+def agency_changes(agency_abbr, old, new):
+    """ All of the changes needed to turn `old` agency data into `new` """
+    old, new = old or {}, new or {}
+    changes = []
+
+    def change(department, path, old_value, new_value):
+        changes.append({'agency': agency_abbr, 'department': department,
+                        'path': path, 'old': old_value, 'new': new_value})
+
+    for path, old_value, new_value in diff_values(
+            without_departments(old), without_departments(new)):
+        change(None, path, old_value, new_value)
+
+    old_departments = departments_by_name(old)
+    new_departments = departments_by_name(new)
+    old_names = [d['name'] for d in old.get('departments', [])]
+    new_names = [d['name'] for d in new.get('departments', [])]
+    for name in new_names:
+        if name in old_departments:
+            for path, old_value, new_value in diff_values(
+                    old_departments[name], new_departments[name]):
+                change(name, path, old_value, new_value)
+        else:
+            change(name, [], None, new_departments[name])
+    for name in old_names:
+        if name not in new_departments:
+            change(name, [], old_departments[name], None)
+
+    # apply_changes keeps existing departments in place and appends new
+    # ones; record the order only if that doesn't give the new order.
+    applied = [n for n in old_names if n in new_departments]
+    applied += [n for n in new_names if n not in old_departments]
+    if applied != new_names:
+        change(None, DEPARTMENTS_PATH, old_names, new_names)
+    return changes
+
+
+def set_path(data, path, value):
+    """ Set (or, when value is None, delete) the field at `path` """
+    for key in path[:-1]:
+        data = data.setdefault(key, {})
+    if value is None:
+        data.pop(path[-1], None)
+    else:
+        data[path[-1]] = deepcopy(value)
+
+
+def apply_changes(data, changes):
+    """ Apply one agency's changes to its data, returning a new dict """
+    data = deepcopy(data or {})
+    order = None
+    for change in changes:
+        name, path = change['department'], change['path']
+        if name is None and path == DEPARTMENTS_PATH:
+            order = change['new']
+        elif name is None:
+            set_path(data, path, change['new'])
+        else:
+            departments = data.setdefault('departments', [])
+            names = [d['name'] for d in departments]
+            if not path:
+                if change['new'] is None:
+                    if name in names:
+                        del departments[names.index(name)]
+                elif name in names:
+                    departments[names.index(name)] = deepcopy(change['new'])
+                else:
+                    departments.append(deepcopy(change['new']))
+            else:
+                set_path(departments[names.index(name)], path, change['new'])
+    if order is not None:
+        departments = departments_by_name(data)
+        data['departments'] = [departments[name] for name in order]
+    return data
+
+
+def write_changeset(changes, filename=CHANGESET_FILE):
+    """ Append changes to a JSON Lines file """
+    if changes:
+        with open(filename, 'a', encoding='utf-8') as f:
+            for change in changes:
+                f.write(json.dumps(change, sort_keys=True,
+                                   ensure_ascii=False) + '\n')
+
+
+def read_changeset(filename=CHANGESET_FILE):
+    with open(filename, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -1,45 +1,194 @@
+"""
+Checks the website and request form URLs of every agency and department.
+The last result for each URL (its status, latency, when it was checked and
+where it redirects to) is kept in url_health.sqlite, and each run only
+checks, several at a time, the URLs that are new or whose result has
+outlived its TTL. URLs get a HEAD request, falling back to GET for servers
+that don't handle HEAD. Every URL's health is written to url_report.json.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import sqlite3
+import time
+
 import requests
-import yaml
-from glob import glob
-import os
 
+import http_client
+from scraper import DATA_DIRECTORY
+from sharding import agency_paths, path_agency
+import yaml_stream
 
-def check_url(data, url_field):
-    """ Actually check the URL and print out enough information to debug later.
-    """
+URL_FIELDS = ['name', 'website', 'request_form']
+CHECKED_FIELDS = ['website', 'request_form']
+
+HEALTH_DB = 'url_health.sqlite'
+REPORT_FILENAME = 'url_report.json'
+WORKERS = 16
+DAY = 24 * 60 * 60
+# URLs that worked are checked weekly, failing ones daily
+HEALTHY_TTL = 7 * DAY
+FAILING_TTL = DAY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS url_health (
+    url TEXT PRIMARY KEY,
+    status INTEGER,
+    latency REAL,
+    checked_at REAL,
+    redirect TEXT,
+    error TEXT
+);
+"""
+
+
+def connect(db_filename=HEALTH_DB):
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def url_records(data_directory=DATA_DIRECTORY):
+    """ Yield (agency, department, field, url) for every URL, department
+    being None for the agency's own """
+    for path in agency_paths(data_directory):
+        agency = path_agency(path)
+        for name, record in yaml_stream.records(path, URL_FIELDS):
+            for field in CHECKED_FIELDS:
+                url = (record.get(field) or '').strip()
+                if url:
+                    yield agency, name, field, url
+
+
+def healthy(status):
+    return status is not None and status < 400
+
+
+def is_due(row, now):
+    """ Whether the URL with health `row` (None if never checked) should be
+    checked again """
+    if row is None:
+        return True
+    ttl = HEALTHY_TTL if healthy(row['status']) else FAILING_TTL
+    return row['checked_at'] + ttl <= now
+
+
+def check_url(url):
+    """ Check a URL, returning a url_health row as a dict. Some servers
+    refuse or mishandle HEAD, so errors are tried again with a GET. """
+    started = time.time()
+    result = {'url': url, 'status': None, 'redirect': None, 'error': None,
+              'skipped': False}
     try:
-        r = requests.get(data[url_field], verify=False)
-        if r.status_code != 200:
-            print(r.status_code)
-            print(data[url_field])
-            print(data)
-    except Exception as e:
-        print(e)
-        print(data[url_field])
-        print(data)
+        try:
+            response = http_client.head(url, verify=False,
+                                        breaker=http_client.BREAKER)
+        except http_client.HostSkipped:
+            raise
+        except requests.exceptions.RequestException:
+            response = None
+        if response is None or response.status_code >= 400:
+            if response is not None:
+                response.close()
+            response = http_client.get(url, verify=False, stream=True,
+                                       breaker=http_client.BREAKER)
+        response.close()
+        result['status'] = response.status_code
+        if response.url != url:
+            result['redirect'] = response.url
+    except http_client.HostSkipped as e:
+        result['skipped'] = True
+        result['error'] = str(e)
+    except requests.exceptions.RequestException as e:
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    result['checked_at'] = time.time()
+    result['latency'] = result['checked_at'] - started
+    return result
+
 
+def save_result(conn, result):
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO url_health VALUES (?, ?, ?, ?, ?, ?)',
+            (result['url'], result['status'], result['latency'],
+             result['checked_at'], result['redirect'], result['error']))
 
-def check_urls(data):
-    """ Check the website and request form URLs."""
-    if 'website' in data:
-        check_url(data, 'website')
-    if 'request_form' in data:
-        check_url(data, 'request_form')
 
+def build_report(conn, records, checked, now):
+    """ Every URL's health, with the records it appears in """
+    health = dict((row['url'], dict(row)) for row in conn.execute(
+        'SELECT * FROM url_health'))
+    entries = []
+    for agency, department, field, url in records:
+        entry = {'agency': agency, 'department': department, 'field': field}
+        entry.update(health.get(url, {'url': url}))
+        entries.append(entry)
+    urls = set(url for agency, department, field, url in records)
+    return {
+        'generated_at': now,
+        'urls': len(urls),
+        'checked': checked,
+        'healthy': sum(1 for url in urls
+                       if healthy(health.get(url, {}).get('status'))),
+        'unchecked': sum(1 for url in urls if url not in health),
+        'records': entries,
+    }
 
-def check_all_urls(data):
-    """ Check URLs for each agency, as well as those for each department. """
-    check_urls(data)
-    if 'departments' in data:
-        for department in data['departments']:
-            check_urls(department)
 
+def check_all(conn, data_directory=DATA_DIRECTORY, workers=WORKERS,
+              only=None, now=None):
+    """ Check the URLs that are due, or only those in `only`, returning the
+    report. Results for hosts skipped by the circuit breaker aren't saved,
+    so they are due again next time. """
+    if now is None:
+        now = time.time()
+    records = list(url_records(data_directory))
+    known = dict((row['url'], row) for row in conn.execute(
+        'SELECT * FROM url_health'))
+    urls = sorted(set(url for agency, department, field, url in records))
+    if only is not None:
+        due = [url for url in urls if url in only]
+    else:
+        due = [url for url in urls if is_due(known.get(url), now)]
+    with ThreadPoolExecutor(workers) as executor:
+        for result in executor.map(check_url, due):
+            if not result['skipped']:
+                save_result(conn, result)
+    http_client.BREAKER.save_skipped()
+    return build_report(conn, records, len(due), now)
 
-def check_all():
-    for filename in glob('data' + os.sep + '*.yaml'):
-        yaml_data = yaml.load(open(filename, 'r'))
-        check_all_urls(yaml_data)
+
+def write_report(report, filename=REPORT_FILENAME):
+    with open(filename, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
 
 
 if __name__ == "__main__":
-    check_all()
+    """
+        python check_urls.py
+        checks the URLs that are new or due and writes url_report.json.
+
+        python check_urls.py --skipped
+        checks only the URLs on hosts that were skipped by the last run,
+        having failed too often.
+    """
+    parser = argparse.ArgumentParser(
+        description='Check the website and request form URLs.')
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--skipped', action='store_true',
+                        help='only check the URLs skipped last time')
+    parser.add_argument('--all', action='store_true',
+                        help='check every URL, however recently checked')
+    parser.add_argument('--report', default=REPORT_FILENAME)
+    args = parser.parse_args()
+
+    only = None
+    if args.skipped:
+        only = set(http_client.skipped_urls())
+    elif args.all:
+        only = set(url for agency, department, field, url in url_records())
+    report = check_all(connect(), workers=args.workers, only=only)
+    write_report(report, args.report)
+    print('%(urls)s URLs, %(checked)s checked, %(healthy)s healthy' % report)
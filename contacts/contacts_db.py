@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""
+Materializes the data/*.yaml files into an indexed SQLite database so that
+questions like "which offices lack a request form" don't require loading
+every YAML file. Files are only reprocessed when their digest changes.
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+
+from scraper import DATA_DIRECTORY
+from sharding import agency_paths, load_path, path_agency, path_digest
+
+
+DB_FILENAME = 'contacts.sqlite'
+
+# Scalar fields copied into columns of the agencies/departments tables. The
+# full record is always kept as JSON in the `data` column.
+SCALAR_FIELDS = [
+    'name', 'abbreviation', 'description', 'usa_id', 'website',
+    'request_form', 'phone', 'fax', 'notes']
+ADDRESS_FIELDS = ['street', 'city', 'state', 'zip']
+CONTACT_FIELDS = ['public_liaison', 'service_center', 'foia_officer']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    agency TEXT PRIMARY KEY,
+    filename TEXT,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS agencies (
+    agency TEXT PRIMARY KEY,
+    name TEXT, abbreviation TEXT, description TEXT, usa_id TEXT,
+    website TEXT, request_form TEXT, phone TEXT, fax TEXT, notes TEXT,
+    street TEXT, city TEXT, state TEXT, zip TEXT,
+    top_level INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS departments (
+    id INTEGER PRIMARY KEY,
+    agency TEXT,
+    position INTEGER,
+    name TEXT, abbreviation TEXT, description TEXT, usa_id TEXT,
+    website TEXT, request_form TEXT, phone TEXT, fax TEXT, notes TEXT,
+    street TEXT, city TEXT, state TEXT, zip TEXT,
+    top_level INTEGER,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS emails (
+    agency TEXT, department_id INTEGER, email TEXT
+);
+CREATE TABLE IF NOT EXISTS phones (
+    agency TEXT, department_id INTEGER, kind TEXT, number TEXT
+);
+CREATE TABLE IF NOT EXISTS keywords (
+    agency TEXT, department_id INTEGER, keyword TEXT
+);
+CREATE TABLE IF NOT EXISTS reading_rooms (
+    agency TEXT, department_id INTEGER, title TEXT, url TEXT
+);
+CREATE TABLE IF NOT EXISTS time_stats (
+    agency TEXT, department_id INTEGER, year TEXT, stat TEXT, value TEXT
+);
+CREATE INDEX IF NOT EXISTS departments_agency
+    ON departments (agency, position);
+CREATE INDEX IF NOT EXISTS departments_name ON departments (name);
+CREATE INDEX IF NOT EXISTS departments_state ON departments (state);
+CREATE INDEX IF NOT EXISTS departments_request_form
+    ON departments (request_form);
+CREATE INDEX IF NOT EXISTS departments_usa_id ON departments (usa_id);
+CREATE INDEX IF NOT EXISTS agencies_state ON agencies (state);
+CREATE INDEX IF NOT EXISTS emails_email ON emails (email);
+CREATE INDEX IF NOT EXISTS emails_owner ON emails (agency, department_id);
+CREATE INDEX IF NOT EXISTS phones_number ON phones (number);
+CREATE INDEX IF NOT EXISTS phones_owner ON phones (agency, department_id);
+CREATE INDEX IF NOT EXISTS keywords_keyword ON keywords (keyword);
+CREATE INDEX IF NOT EXISTS keywords_owner ON keywords (agency, department_id);
+CREATE INDEX IF NOT EXISTS reading_rooms_owner
+    ON reading_rooms (agency, department_id);
+CREATE INDEX IF NOT EXISTS time_stats_owner
+    ON time_stats (agency, department_id, year);
+"""
+
+CHILD_TABLES = ['emails', 'phones', 'keywords', 'reading_rooms', 'time_stats']
+
+
+def connect(db_filename=DB_FILENAME):
+    """ Open the database, creating the tables and indexes if needed. """
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_columns(data):
+    """ Pull the indexed columns out of an agency or department dict """
+    columns = dict((field, data.get(field)) for field in SCALAR_FIELDS)
+    address = data.get('address') or {}
+    for field in ADDRESS_FIELDS:
+        columns[field] = address.get(field)
+    columns['top_level'] = int(bool(data.get('top_level')))
+    return columns
+
+
+def phone_rows(data):
+    """ Yield (kind, number) for every phone number attached to a record """
+    for kind in ('phone', 'fax'):
+        if data.get(kind):
+            yield kind, data[kind]
+    for kind in CONTACT_FIELDS:
+        for number in (data.get(kind) or {}).get('phone', []):
+            yield kind, number
+    for contact in (data.get('misc') or {}).values():
+        for number in (contact or {}).get('phone', []):
+            yield 'misc', number
+
+
+def insert_children(conn, agency, department_id, data):
+    """ Fill in the one-to-many tables for an agency or department """
+    conn.executemany(
+        'INSERT INTO emails VALUES (?, ?, ?)',
+        [(agency, department_id, e) for e in data.get('emails', [])])
+    conn.executemany(
+        'INSERT INTO phones VALUES (?, ?, ?, ?)',
+        [(agency, department_id, kind, number)
+         for kind, number in phone_rows(data)])
+    conn.executemany(
+        'INSERT INTO keywords VALUES (?, ?, ?)',
+        [(agency, department_id, k) for k in data.get('keywords', [])])
+    conn.executemany(
+        'INSERT INTO reading_rooms VALUES (?, ?, ?, ?)',
+        [(agency, department_id, title, url)
+         for title, url in data.get('reading_rooms', [])])
+    conn.executemany(
+        'INSERT INTO time_stats VALUES (?, ?, ?, ?, ?)',
+        [(agency, department_id, year, stat, value)
+         for year, stats in sorted(data.get('request_time_stats', {}).items())
+         for stat, value in sorted(stats.items())])
+
+
+def insert_row(conn, table, values):
+    names = sorted(values.keys())
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        table, ', '.join(names), ', '.join('?' for _ in names))
+    return conn.execute(sql, [values[name] for name in names]).lastrowid
+
+
+def delete_agency(conn, agency):
+    """ Remove every row belonging to an agency """
+    for table in CHILD_TABLES + ['departments', 'agencies', 'files']:
+        conn.execute('DELETE FROM %s WHERE agency = ?' % table, (agency,))
+
+
+def materialize_agency(conn, agency, data):
+    """ Replace the rows for one agency with the contents of `data` """
+    delete_agency(conn, agency)
+    agency_only = dict(data)
+    departments = agency_only.pop('departments', [])
+    values = record_columns(data)
+    values.update({
+        'agency': agency, 'data': json.dumps(agency_only, sort_keys=True)})
+    insert_row(conn, 'agencies', values)
+    insert_children(conn, agency, None, data)
+    for position, department in enumerate(departments):
+        values = record_columns(department)
+        values.update({
+            'agency': agency, 'position': position,
+            'data': json.dumps(department, sort_keys=True)})
+        department_id = insert_row(conn, 'departments', values)
+        insert_children(conn, agency, department_id, department)
+
+
+def build_db(data_directory=DATA_DIRECTORY, db_filename=DB_FILENAME):
+    """ Bring the database up to date with the YAML files. Only files whose
+    digest differs from the one stored are parsed again. Returns the list of
+    agencies that were (re)materialized. """
+    conn = connect(db_filename)
+    known = dict((row['agency'], row['digest'])
+                 for row in conn.execute('SELECT agency, digest FROM files'))
+    updated, seen = [], set()
+    for path in agency_paths(data_directory):
+        agency = path_agency(path)
+        seen.add(agency)
+        digest = path_digest(path)
+        if known.get(agency) == digest:
+            continue
+        data = load_path(path)
+        with conn:
+            materialize_agency(conn, agency, data)
+            conn.execute('INSERT INTO files VALUES (?, ?, ?)',
+                         (agency, path, digest))
+        updated.append(agency)
+        logging.info('[%s] Materialized.', agency)
+    with conn:
+        for agency in set(known) - seen:
+            delete_agency(conn, agency)
+            logging.info('[%s] Removed.', agency)
+    conn.close()
+    return updated
+
+
+def load_agency(conn, agency):
+    """ Rebuild an agency dict, departments included, without touching the
+    YAML """
+    row = conn.execute(
+        'SELECT data FROM agencies WHERE agency = ?', (agency,)).fetchone()
+    if row:
+        data = json.loads(row['data'])
+        data['departments'] = [
+            json.loads(r['data']) for r in conn.execute(
+                'SELECT data FROM departments WHERE agency = ? '
+                'ORDER BY position', (agency,))]
+        return data
+
+
+def offices_missing(conn, field):
+    """ Departments which have no value for one of the indexed fields """
+    if field not in SCALAR_FIELDS + ADDRESS_FIELDS:
+        raise ValueError('Not an indexed field: %s' % field)
+    return conn.execute(
+        'SELECT agency, name FROM departments WHERE %s IS NULL '
+        'ORDER BY agency, position' % field).fetchall()
+
+
+def offices_in_state(conn, state):
+    """ Departments whose address is in the given state """
+    return conn.execute(
+        'SELECT agency, name FROM departments WHERE state = ? '
+        'ORDER BY agency, position', (state,)).fetchall()
+
+
+if __name__ == "__main__":
+    """
+        python contacts_db.py
+        brings contacts.sqlite up to date with data/.
+
+        python contacts_db.py --missing request_form
+        python contacts_db.py --state VA
+        also list the matching offices.
+    """
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(
+        description='Materialize data/*.yaml into an SQLite database.')
+    parser.add_argument('--db', default=DB_FILENAME)
+    parser.add_argument('--missing', help='list offices lacking this field')
+    parser.add_argument('--state', help='list offices in this state')
+    args = parser.parse_args()
+
+    build_db(db_filename=args.db)
+    conn = connect(args.db)
+    rows = []
+    if args.missing:
+        rows = offices_missing(conn, args.missing)
+    elif args.state:
+        rows = offices_in_state(conn, args.state)
+    for row in rows:
+        print('%s: %s' % (row['agency'], row['name']))
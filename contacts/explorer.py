@@ -1,46 +1,121 @@
-import os
+import argparse
+import csv
+import json
 import sys
-import yaml
-from foia_hub.settings.default import BASE_DIR
 
+import contacts_db
+from scraper import DATA_DIRECTORY
+from sharding import agency_paths, path_agency
+import yaml_stream
 
-DEFAULT_YAML_FOLDER = 'foia/contacts/data'
 
+DEFAULT_YAML_FOLDER = DATA_DIRECTORY
+ALL_AGENCIES = 'ALL'
+COLUMNS = ['agency', 'field', 'present', 'missing', 'total']
 
-def _get_yaml_folder():
-    return BASE_DIR.rstrip('/foia_hub').rstrip('foia-') + DEFAULT_YAML_FOLDER
 
+def agencies_from_yaml(folder=DEFAULT_YAML_FOLDER, agency_filter=None,
+                       fields=None):
+    """ Yield (agency abbreviation, agency data) for every YAML file. Files
+    for agencies outside of `agency_filter` aren't parsed. Departments are
+    read lazily, one at a time, with only `fields` if given. """
+    for data_file in agency_paths(folder):
+        agency = path_agency(data_file)
+        if agency_filter and agency not in agency_filter:
+            continue
+        yield agency, {
+            'departments': yaml_stream.departments(data_file, fields)}
 
-def process_yaml_data(data_key):
-    folder = _get_yaml_folder()
 
-    count = 0
-    for item in os.listdir(folder):
-        data_file = os.path.join(folder, item)
-        data = yaml.load(open(data_file))
-        for rec in data['departments']:
-            data_value = rec.get(data_key, None)
+def agencies_from_db(db_filename=contacts_db.DB_FILENAME):
+    """ Yield (agency abbreviation, agency data) from the database built by
+    contacts_db.py, avoiding YAML parsing entirely """
+    conn = contacts_db.connect(db_filename)
+    agencies = [row['agency'] for row in conn.execute(
+        'SELECT agency FROM agencies ORDER BY agency')]
+    for agency in agencies:
+        yield agency, contacts_db.load_agency(conn, agency)
+    conn.close()
 
-            if not data_value:
-                # Count how many records are missing this value
-                count += 1
+
+def field_coverage(agencies, agency_filter=None, field_filter=None):
+    """
+    Count, in a single pass, how many departments have a value for each
+    field. Returns rows of the form
+        {'agency': 'DOJ', 'field': 'request_form', 'present': 30,
+         'missing': 10, 'total': 40}
+    with one row per agency and field, plus totals under the agency 'ALL'.
+    """
+    present, totals = {}, {}
+    fields = set(field_filter or [])
+    for agency, data in agencies:
+        if agency_filter and agency not in agency_filter:
+            continue
+        totals[agency] = 0
+        counts = present.setdefault(agency, {})
+        for department in data.get('departments', []):
+            totals[agency] += 1
+            for field, value in department.items():
+                if field_filter and field not in field_filter:
+                    continue
+                fields.add(field)
+                if value:
+                    counts[field] = counts.get(field, 0) + 1
+
+    rows = []
+    for agency in sorted(totals) + [ALL_AGENCIES]:
+        for field in sorted(fields):
+            if agency == ALL_AGENCIES:
+                count = sum(c.get(field, 0) for c in present.values())
+                total = sum(totals.values())
             else:
-                # Print out the values to the variance in the information.
-                # print(data['name'])  # Get agency name
-                print(data_value)
+                count = present[agency].get(field, 0)
+                total = totals[agency]
+            rows.append({'agency': agency, 'field': field, 'present': count,
+                         'missing': total - count, 'total': total})
+    return rows
 
-    print('------------------------------------------------------')
-    print('Records without %s: %s' % (data_key, count))
+
+def write_json(rows, out):
+    json.dump(rows, out, indent=2, sort_keys=True)
+    out.write('\n')
+
+
+def write_csv(rows, out):
+    writer = csv.DictWriter(out, fieldnames=COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
 
 
 if __name__ == "__main__":
     """
     This is a simple script to give some insight into the data in the yaml
-    contacts folder. To run the script, pass the key at the dept level
-    to return the values.
+    contacts folder. It reports how many departments have or lack each
+    department-level field.
 
-        python explorer.py request_form
+        python explorer.py
+        python explorer.py request_form --agency DOJ --format csv
+        python explorer.py --db contacts.sqlite
 
     """
-    data_key = sys.argv[1]
-    process_yaml_data(data_key)
+    parser = argparse.ArgumentParser(
+        description='Report field coverage for the contacts data.')
+    parser.add_argument('fields', nargs='*',
+                        help='only report these department fields')
+    parser.add_argument('--agency', action='append',
+                        help='only report this agency (may be repeated)')
+    parser.add_argument('--db', help='read from a contacts_db.py database '
+                        'instead of the YAML files')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json')
+    args = parser.parse_args()
+
+    if args.db:
+        agencies = agencies_from_db(args.db)
+    else:
+        agencies = agencies_from_yaml(agency_filter=args.agency,
+                                      fields=args.fields or None)
+    rows = field_coverage(agencies, args.agency, args.fields)
+    if args.format == 'csv':
+        write_csv(rows, sys.stdout)
+    else:
+        write_json(rows, sys.stdout)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+Builds the contacts data in generations. Each build runs its stages against
+a new directory, generations/<number>, that starts out as hard links to the
+files of the current generation, so nothing is copied. Once every stage has
+succeeded the `current` symlink is switched to the new generation in one
+atomic rename. Readers run with FOIA_DATA_DIR=current never see a half
+written dataset, and rolling back only switches the link back.
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import subprocess
+
+from scraper import DATA_DIRECTORY
+
+
+GENERATIONS_DIRECTORY = 'generations'
+CURRENT_LINK = 'current'
+
+
+def generation_names(generations_directory=GENERATIONS_DIRECTORY):
+    """ Generations, oldest first """
+    if not os.path.isdir(generations_directory):
+        return []
+    return sorted(name for name in os.listdir(generations_directory)
+                  if name.isdigit())
+
+
+def current_generation(link=CURRENT_LINK):
+    """ The name of the generation `link` points at, or None """
+    if not os.path.islink(link):
+        return None
+    return os.path.basename(os.path.normpath(os.readlink(link)))
+
+
+def new_generation(source, generations_directory=GENERATIONS_DIRECTORY):
+    """ Create the next generation as hard links to the files in `source`,
+    returning its path """
+    names = generation_names(generations_directory)
+    number = int(names[-1]) + 1 if names else 1
+    path = os.path.join(generations_directory, '%04d' % number)
+    os.makedirs(path)
+    for directory, subdirectories, filenames in os.walk(source):
+        target = os.path.join(path, os.path.relpath(directory, source))
+        for subdirectory in subdirectories:
+            os.makedirs(os.path.join(target, subdirectory))
+        for filename in filenames:
+            if not filename.endswith('.tmp'):
+                os.link(os.path.join(directory, filename),
+                        os.path.join(target, filename))
+    return path
+
+
+def publish(path, link=CURRENT_LINK):
+    """ Atomically point `link` at the generation in `path` """
+    temporary = link + '.tmp'
+    if os.path.lexists(temporary):
+        os.remove(temporary)
+    os.symlink(os.path.relpath(path, os.path.dirname(os.path.abspath(link))),
+               temporary)
+    os.replace(temporary, link)
+    logging.info('%s -> %s', link, path)
+
+
+def build(commands, generations_directory=GENERATIONS_DIRECTORY,
+          link=CURRENT_LINK, source=None):
+    """ Run each of the shell `commands` with FOIA_DATA_DIR set to a new
+    generation and publish it if they all succeed. If one fails the new
+    generation is removed and the exception raised. """
+    if source is None:
+        source = link if os.path.exists(link) else DATA_DIRECTORY
+    path = new_generation(source, generations_directory)
+    env = dict(os.environ, FOIA_DATA_DIR=path)
+    try:
+        for command in commands:
+            logging.info('Running %s', command)
+            subprocess.check_call(command, shell=True, env=env)
+    except Exception:
+        shutil.rmtree(path)
+        raise
+    publish(path, link)
+    return path
+
+
+def rollback(generations_directory=GENERATIONS_DIRECTORY,
+             link=CURRENT_LINK):
+    """ Point `link` at the generation before the current one """
+    names = generation_names(generations_directory)
+    current = current_generation(link)
+    older = [name for name in names if current is None or name < current]
+    if not older:
+        raise ValueError('No generation before %s' % current)
+    path = os.path.join(generations_directory, older[-1])
+    publish(path, link)
+    return path
+
+
+def prune(keep, generations_directory=GENERATIONS_DIRECTORY,
+          link=CURRENT_LINK):
+    """ Remove all but the newest `keep` generations, never removing the
+    current one """
+    current = current_generation(link)
+    names = generation_names(generations_directory)
+    removed = [name for name in names[:max(len(names) - keep, 0)]
+               if name != current]
+    for name in removed:
+        shutil.rmtree(os.path.join(generations_directory, name))
+    return removed
+
+
+if __name__ == "__main__":
+    """
+        python generations.py build "python scraper.py" "python layers.py"
+        runs the stages against a new generation and publishes it.
+
+        python generations.py rollback
+        python generations.py list
+        python generations.py prune --keep 5
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Build and publish generations of the contacts data.')
+    subparsers = parser.add_subparsers(dest='action')
+    build_parser = subparsers.add_parser(
+        'build', help='run commands against a new generation')
+    build_parser.add_argument('commands', nargs='+')
+    subparsers.add_parser('rollback', help='publish the previous generation')
+    subparsers.add_parser('list', help='list the generations')
+    prune_parser = subparsers.add_parser(
+        'prune', help='remove old generations')
+    prune_parser.add_argument('--keep', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.action == 'build':
+        build(args.commands)
+    elif args.action == 'rollback':
+        rollback()
+    elif args.action == 'prune':
+        for name in prune(args.keep):
+            print('Removed %s' % name)
+    elif args.action == 'list':
+        current = current_generation()
+        for name in generation_names():
+            print('%s%s' % (name, ' (current)' if name == current else ''))
+    else:
+        parser.print_help()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+
+"""
+Keeps the history of the contacts data without copying data/ for every
+build. Each recorded build stores, per agency, only the changes from the
+previous build (in the format of changeset.py), with a full copy of the
+agency, a keyframe, when it first appears and after every KEYFRAME_INTERVAL
+builds in which it changed. Any past version of an agency is rebuilt from
+its latest keyframe and at most that many sets of changes, and the changes
+of a single field can be listed directly.
+
+    python history.py record --label "March scrape"
+    python history.py field DOJ --department "Antitrust Division" phone
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+import zlib
+
+from changeset import agency_changes, apply_changes
+from scraper import DATA_DIRECTORY, save_agency_data
+from sharding import agency_paths, load_path, path_agency, path_digest
+
+
+HISTORY_DB = 'history.sqlite'
+KEYFRAME_INTERVAL = 10
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    build INTEGER PRIMARY KEY,
+    recorded_at REAL,
+    label TEXT
+);
+CREATE TABLE IF NOT EXISTS agencies (
+    build INTEGER,
+    agency TEXT,
+    digest TEXT,
+    PRIMARY KEY (build, agency)
+);
+CREATE TABLE IF NOT EXISTS keyframes (
+    agency TEXT,
+    build INTEGER,
+    data BLOB,
+    PRIMARY KEY (agency, build)
+);
+CREATE TABLE IF NOT EXISTS changes (
+    agency TEXT,
+    build INTEGER,
+    department TEXT,
+    path TEXT,
+    old TEXT,
+    new TEXT
+);
+CREATE INDEX IF NOT EXISTS changes_agency ON changes (agency, build);
+"""
+
+# The agency's own fields are stored under department ''
+AGENCY = ''
+
+
+def connect(db_filename=HISTORY_DB):
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def builds(conn):
+    return conn.execute('SELECT * FROM builds ORDER BY build').fetchall()
+
+
+def latest_build(conn):
+    return conn.execute('SELECT MAX(build) FROM builds').fetchone()[0]
+
+
+def keyframe(conn, agency, build):
+    """ (build, data) of the agency's latest keyframe at `build` """
+    row = conn.execute(
+        'SELECT build, data FROM keyframes WHERE agency = ? AND build <= ? '
+        'ORDER BY build DESC LIMIT 1', (agency, build)).fetchone()
+    if row is None:
+        return None, None
+    return row['build'], json.loads(zlib.decompress(row['data']).decode())
+
+
+def change_rows(conn, agency, after, build):
+    return conn.execute(
+        'SELECT * FROM changes WHERE agency = ? AND build > ? AND build <= ? '
+        'ORDER BY build, rowid', (agency, after, build)).fetchall()
+
+
+def row_change(agency, row):
+    return {'agency': agency, 'department': row['department'] or None,
+            'path': json.loads(row['path']), 'old': json.loads(row['old']),
+            'new': json.loads(row['new'])}
+
+
+def agency_at(conn, agency, build=None):
+    """ The agency's data as of `build` (by default the latest), or None if
+    it wasn't part of that build """
+    if build is None:
+        build = latest_build(conn)
+    present = conn.execute(
+        'SELECT 1 FROM agencies WHERE build = ? AND agency = ?',
+        (build, agency)).fetchone()
+    if build is None or present is None:
+        return None
+    keyframe_build, data = keyframe(conn, agency, build)
+    changes = [row_change(agency, row)
+               for row in change_rows(conn, agency, keyframe_build, build)]
+    return apply_changes(data, changes)
+
+
+def dataset_at(conn, build=None):
+    """ {agency abbreviation: data} for every agency in `build` """
+    if build is None:
+        build = latest_build(conn)
+    agencies = [row['agency'] for row in conn.execute(
+        'SELECT agency FROM agencies WHERE build = ? ORDER BY agency',
+        (build,))]
+    return dict((agency, agency_at(conn, agency, build))
+                for agency in agencies)
+
+
+def needs_keyframe(conn, agency, build):
+    """ Whether the agency has changed in KEYFRAME_INTERVAL builds since its
+    last keyframe """
+    keyframe_build = conn.execute(
+        'SELECT MAX(build) FROM keyframes WHERE agency = ? AND build <= ?',
+        (agency, build)).fetchone()[0]
+    changed = conn.execute(
+        'SELECT COUNT(DISTINCT build) FROM changes '
+        'WHERE agency = ? AND build > ?', (agency, keyframe_build)).fetchone()
+    return changed[0] >= KEYFRAME_INTERVAL
+
+
+def record_build(conn, data_directory=DATA_DIRECTORY, label=None,
+                 recorded_at=None):
+    """ Record the data in `data_directory` as a new build, returning the
+    build number. Agencies whose files haven't changed aren't parsed. """
+    if recorded_at is None:
+        recorded_at = time.time()
+    previous = latest_build(conn)
+    digests = {}
+    if previous is not None:
+        digests = dict(conn.execute(
+            'SELECT agency, digest FROM agencies WHERE build = ?',
+            (previous,)).fetchall())
+    with conn:
+        build = conn.execute(
+            'INSERT INTO builds (recorded_at, label) VALUES (?, ?)',
+            (recorded_at, label)).lastrowid
+        for path in agency_paths(data_directory):
+            agency, digest = path_agency(path), path_digest(path)
+            conn.execute('INSERT INTO agencies VALUES (?, ?, ?)',
+                         (build, agency, digest))
+            if digests.get(agency) == digest:
+                continue
+            data = load_path(path)
+            if agency not in digests:
+                # New, or back after being dropped: start from a keyframe
+                conn.execute('INSERT INTO keyframes VALUES (?, ?, ?)', (
+                    agency, build, zlib.compress(json.dumps(data).encode())))
+                continue
+            changes = agency_changes(agency, agency_at(conn, agency, previous),
+                                     data)
+            conn.executemany(
+                'INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?)',
+                [(agency, build, change['department'] or AGENCY,
+                  json.dumps(change['path']), json.dumps(change['old']),
+                  json.dumps(change['new'])) for change in changes])
+            if changes and needs_keyframe(conn, agency, build):
+                conn.execute('INSERT INTO keyframes VALUES (?, ?, ?)', (
+                    agency, build, zlib.compress(json.dumps(data).encode())))
+    return build
+
+
+def field_value(data, department, path):
+    """ The value at `path` in the agency's data, or in its department named
+    `department`; None if it isn't there """
+    value = data
+    if department is not None:
+        value = dict((d['name'], d) for d in (data or {}).get(
+            'departments', [])).get(department)
+    for key in path:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def field_history(conn, agency, department, path):
+    """ When did a field change? Yields (build row, old value, new value)
+    for each build that changed the field at `path` of the agency, or of
+    one of its departments. Changes to an enclosing or enclosed field, or to
+    the whole department, count too. """
+    path = list(path)
+    rows = conn.execute(
+        'SELECT DISTINCT build, path FROM changes '
+        'WHERE agency = ? AND department = ? ORDER BY build',
+        (agency, department or AGENCY)).fetchall()
+    changed = []
+    for row in rows:
+        change_path = json.loads(row['path'])
+        shortest = min(len(path), len(change_path))
+        if change_path[:shortest] == path[:shortest] and \
+                row['build'] not in changed:
+            changed.append(row['build'])
+    for build in changed:
+        old = field_value(agency_at(conn, agency, build - 1), department,
+                          path)
+        new = field_value(agency_at(conn, agency, build), department, path)
+        if old != new:
+            yield conn.execute('SELECT * FROM builds WHERE build = ?',
+                               (build,)).fetchone(), old, new
+
+
+def export(conn, build, data_directory):
+    """ Write the data of a past build to `data_directory` """
+    for agency, data in sorted(dataset_at(conn, build).items()):
+        save_agency_data(agency, data, data_directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Record builds of the contacts data and look back '
+                    'through them.')
+    subparsers = parser.add_subparsers(dest='action')
+    record_parser = subparsers.add_parser(
+        'record', help='record the data directory as a new build')
+    record_parser.add_argument('--label')
+    subparsers.add_parser('list', help='list the recorded builds')
+    field_parser = subparsers.add_parser(
+        'field', help='list the changes of one field')
+    field_parser.add_argument('agency')
+    field_parser.add_argument('path', nargs='+')
+    field_parser.add_argument('--department')
+    export_parser = subparsers.add_parser(
+        'export', help='write out the data of a past build')
+    export_parser.add_argument('build', type=int)
+    export_parser.add_argument('directory')
+    args = parser.parse_args()
+
+    conn = connect()
+    if args.action == 'record':
+        print('Recorded build %s' % record_build(conn, label=args.label))
+    elif args.action == 'list':
+        for row in builds(conn):
+            print('%s %s %s' % (row['build'], time.strftime(
+                '%Y-%m-%d %H:%M', time.localtime(row['recorded_at'])),
+                row['label'] or ''))
+    elif args.action == 'field':
+        for row, old, new in field_history(
+                conn, args.agency, args.department, args.path):
+            print('%s %s: %r -> %r' % (row['build'], time.strftime(
+                '%Y-%m-%d', time.localtime(row['recorded_at'])), old, new))
+    elif args.action == 'export':
+        export(conn, args.build, args.directory)
+    else:
+        parser.print_help()
@@ -0,0 +1,306 @@
+"""
+The HTTP client every script that fetches from the web goes through. A
+single session is shared, so connections to each host are pooled and kept
+alive between requests; every request has connect and read timeouts; and
+connection errors, timeouts and overloaded-server responses are retried
+with jittered exponential backoff, within an overall deadline. Responses
+are accepted gzip compressed.
+
+Scripts that fetch from many agency sites, rather than from a few primary
+sources, pass a circuit breaker, which keeps track of the failures and
+latency of each host. Once most of the recent requests to a host have
+failed or been too slow, further requests to it raise HostSkipped, without
+being sent, for a cooling off period, so a few dead agency sites can't
+dominate a run. Skipped hosts and URLs are saved to skipped_hosts.json so
+they can be retried later.
+
+If FOIA_STAND_IN is set to the address of a stand_in.py server, every
+request is sent to it instead, for running the scripts offline.
+
+    response = http_client.get(url)
+"""
+
+from collections import deque
+import json
+import logging
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests_cache.core import CachedSession
+
+
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+# No request, retries included, starts after this many seconds
+DEADLINE = 120
+RETRIES = 3
+BACKOFF = 1
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# Number of hosts to keep a connection pool for, and connections per host
+POOL_HOSTS = 100
+POOL_SIZE = 10
+CHUNK_SIZE = 16 * 1024
+
+HEADERS = {'Accept-Encoding': 'gzip, deflate'}
+
+# A host's circuit opens once at least FAILURE_RATE of its last WINDOW
+# requests (and at least MIN_REQUESTS of them) failed or took more than
+# SLOW_SECONDS. It stays open for COOLDOWN seconds, after which requests are
+# let through again until one fails.
+WINDOW = 10
+MIN_REQUESTS = 4
+FAILURE_RATE = 0.5
+SLOW_SECONDS = 20
+COOLDOWN = 10 * 60
+SKIPPED_HOSTS = 'skipped_hosts.json'
+
+# Address of a stand_in.py server to send every request to instead
+STAND_IN = os.environ.get('FOIA_STAND_IN')
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class HostSkipped(requests.exceptions.RequestException):
+    """ Not sent, as the host's circuit is open """
+
+
+class CircuitBreaker(object):
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outcomes = {}
+        self.latency = {}
+        self.open_until = {}
+        self.skipped = {}
+
+    def check(self, url):
+        """ Raise HostSkipped if `url`'s host shouldn't be sent requests """
+        host = urlparse(url).netloc
+        with self.lock:
+            if self.open_until.get(host, 0) > time.time():
+                self.skipped.setdefault(host, []).append(url)
+                raise HostSkipped('%s skipped, too many failures' % host)
+
+    def record(self, url, ok, latency=None):
+        """ Note the outcome of a request to `url` """
+        host = urlparse(url).netloc
+        with self.lock:
+            if latency is not None:
+                # Exponentially weighted, for reporting
+                self.latency[host] = latency if host not in self.latency \
+                    else 0.8 * self.latency[host] + 0.2 * latency
+                ok = ok and latency <= SLOW_SECONDS
+            outcomes = self.outcomes.setdefault(host, deque(maxlen=WINDOW))
+            if host in self.open_until:
+                # Let through after the cool off: one failure reopens it
+                if ok:
+                    del self.open_until[host]
+                    outcomes.clear()
+                else:
+                    self.open(host)
+            outcomes.append(ok)
+            failures = outcomes.count(False)
+            if len(outcomes) >= MIN_REQUESTS and \
+                    failures >= FAILURE_RATE * len(outcomes):
+                self.open(host)
+
+    def open(self, host):
+        if host not in self.open_until:
+            logging.warning('Skipping %s for %ss', host, COOLDOWN)
+        self.open_until[host] = time.time() + COOLDOWN
+
+    def report(self):
+        """ {host: {'urls': skipped URLs, 'latency': seconds}} """
+        with self.lock:
+            return dict((host, {'urls': sorted(set(urls)),
+                                'latency': self.latency.get(host)})
+                        for host, urls in self.skipped.items())
+
+    def save_skipped(self, filename=SKIPPED_HOSTS):
+        """ Save the skipped hosts and URLs, so they can be retried """
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2, sort_keys=True)
+
+
+def skipped_urls(filename=SKIPPED_HOSTS):
+    """ The URLs skipped by an earlier run """
+    with open(filename) as f:
+        report = json.load(f)
+    return [url for host in sorted(report) for url in report[host]['urls']]
+
+
+BREAKER = CircuitBreaker()
+
+
+class StandInAdapter(HTTPAdapter):
+    """ Sends every request to the stand-in server at `address`, with the
+    URL asked for in the X-Stand-In-URL header. Responses keep that URL, so
+    redirects and relative links are resolved as they would be. """
+
+    def __init__(self, address, **kwargs):
+        super(StandInAdapter, self).__init__(**kwargs)
+        self.address = address.rstrip('/')
+
+    def send(self, request, **kwargs):
+        url = request.url
+        request.url = self.address + '/'
+        request.headers['X-Stand-In-URL'] = url
+        try:
+            response = super(StandInAdapter, self).send(request, **kwargs)
+        finally:
+            request.url = url
+        response.url = url
+        return response
+
+
+def use_stand_in(address):
+    """ Send the requests of sessions configured from now on, the shared
+    one included, to the stand-in server at `address` (None for the real
+    sites) """
+    global STAND_IN, _session
+    with _session_lock:
+        STAND_IN = address
+        _session = None
+
+
+def configure(session):
+    """ Give `session` the pooled adapters and headers """
+    if STAND_IN:
+        adapter = StandInAdapter(STAND_IN, pool_connections=POOL_HOSTS,
+                                 pool_maxsize=POOL_SIZE)
+    else:
+        adapter = HTTPAdapter(pool_connections=POOL_HOSTS,
+                              pool_maxsize=POOL_SIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+def shared_session():
+    """ The session used when none is given """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = configure(requests.Session())
+        return _session
+
+
+def cached_session(cache_name):
+    """ A session whose responses are cached by requests_cache in
+    `cache_name`.sqlite """
+    return configure(CachedSession(cache_name))
+
+
+def backoff(attempt, response=None):
+    """ Seconds to wait before retry number `attempt`: a random time up to
+    a limit that doubles with each retry, or what the server asked for """
+    delay = random.uniform(0, BACKOFF * 2 ** (attempt - 1))
+    if response is not None and \
+            response.headers.get('Retry-After', '').isdigit():
+        delay = max(delay, int(response.headers['Retry-After']))
+    return delay
+
+
+def send(method, url, session, retries, deadline, **kwargs):
+    """ Send a request, retrying it if it fails in a way that might not
+    last. Returns the last response and how long it took, or raises the
+    last exception. """
+    started = time.time()
+    attempt = 0
+    while True:
+        response = None
+        sent = time.time()
+        try:
+            response = session.request(method, url, **kwargs)
+        except requests.exceptions.SSLError:
+            raise
+        except (requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as e:
+            error = e
+        else:
+            if response.status_code not in RETRY_STATUSES:
+                return response, time.time() - sent
+            error = 'status %s' % response.status_code
+        attempt += 1
+        delay = backoff(attempt, response)
+        if attempt > retries or time.time() + delay - started > deadline:
+            if response is not None:
+                return response, time.time() - sent
+            raise error
+        logging.info('%s %s failed (%s), retrying in %.1fs', method, url,
+                     error, delay)
+        if response is not None:
+            response.close()
+        time.sleep(delay)
+
+
+def request(method, url, session=None, retries=RETRIES, deadline=DEADLINE,
+            breaker=None, **kwargs):
+    """ Send a request, retrying it if it fails in a way that might not
+    last. Once out of retries, or if the next one couldn't start within
+    `deadline` seconds, the last response is returned or exception raised.
+    With a `breaker` (such as BREAKER), HostSkipped is raised if it has
+    given up on the host, and otherwise the outcome of the request, after
+    any retries, is recorded with it. Only the host's failures count:
+    errors in the request itself, such as a URL without a host, don't.
+    Other arguments are passed to requests. """
+    if session is None:
+        session = shared_session()
+    kwargs.setdefault('timeout', (CONNECT_TIMEOUT, READ_TIMEOUT))
+    if breaker is None or not urlparse(url).netloc:
+        return send(method, url, session, retries, deadline, **kwargs)[0]
+    breaker.check(url)
+    try:
+        response, latency = send(method, url, session, retries, deadline,
+                                 **kwargs)
+    except (requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout):
+        # SSLError is a ConnectionError
+        breaker.record(url, False)
+        raise
+    breaker.record(url, response.status_code < 500, latency)
+    return response
+
+
+def read_capped(response, max_bytes):
+    """ At most `max_bytes` of the body of a response requested with
+    stream=True; the rest isn't downloaded """
+    chunks, size = [], 0
+    for chunk in response.iter_content(CHUNK_SIZE):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= max_bytes:
+            break
+    response.close()
+    return b''.join(chunks)[:max_bytes]
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault('allow_redirects', True)
+    return request('HEAD', url, **kwargs)
+
+
+class Client(object):
+    """ `get` and `head` with a session of its own, for code that takes a
+    client object """
+
+    def __init__(self, session):
+        self.session = session
+
+    def get(self, url, **kwargs):
+        return get(url, session=self.session, **kwargs)
+
+    def head(self, url, **kwargs):
+        return head(url, session=self.session, **kwargs)
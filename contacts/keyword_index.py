@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""
+Builds an inverted index from terms to the agencies and offices whose
+keywords, common requests, names or descriptions contain them, so that
+"which office handles X" can be answered without reading every YAML file.
+Postings carry precomputed BM25 weights, with matches in keywords and
+common requests counting for more than matches in descriptions.
+"""
+
+import argparse
+import json
+import math
+import re
+import time
+
+from scraper import DATA_DIRECTORY
+from sharding import agency_paths, load_path, path_agency
+
+
+INDEX_FILENAME = 'keyword_index.json'
+INDEX_VERSION = 1
+
+# Field weights; the weighted term frequencies of all fields are combined
+# before BM25 saturation is applied.
+FIELD_WEIGHTS = {
+    'keywords': 3.0,
+    'common_requests': 3.0,
+    'name': 2.0,
+    'description': 1.0,
+}
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = set([
+    'a', 'an', 'and', 'are', 'as', 'at', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'that', 'the', 'to', 'with'])
+
+
+def tokenize(text):
+    return [word for word in re.findall(r'[a-z0-9]+', text.lower())
+            if word not in STOPWORDS]
+
+
+def field_text(data, field):
+    value = data.get(field) or ''
+    if isinstance(value, list):
+        value = ' '.join(value)
+    return value
+
+
+def documents(data_directory=DATA_DIRECTORY):
+    """ Yield (document, data) for each agency and office """
+    for path in agency_paths(data_directory):
+        agency_abbr = path_agency(path)
+        data = load_path(path)
+        yield {'agency': agency_abbr, 'department': None,
+               'name': data['name']}, data
+        for department in data.get('departments', []):
+            yield {'agency': agency_abbr, 'department': department['name'],
+                   'name': department['name']}, department
+
+
+def weighted_term_frequencies(data):
+    """ Combine the term frequencies of each field, scaled by the field's
+    weight """
+    frequencies = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in tokenize(field_text(data, field)):
+            frequencies[term] = frequencies.get(term, 0) + weight
+    return frequencies
+
+
+def build_index(docs):
+    """ Compute BM25 postings for (document, data) pairs """
+    docs = list(docs)
+    frequencies = [weighted_term_frequencies(data) for _, data in docs]
+    lengths = [sum(tf.values()) for tf in frequencies]
+    average_length = (sum(lengths) / len(lengths)) if lengths else 0
+
+    doc_frequency = {}
+    for tf in frequencies:
+        for term in tf:
+            doc_frequency[term] = doc_frequency.get(term, 0) + 1
+
+    total = len(docs)
+    postings = {}
+    for doc_id, tf in enumerate(frequencies):
+        norm = K1 * (1 - B + B * lengths[doc_id] / average_length)
+        for term, freq in tf.items():
+            df = doc_frequency[term]
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            weight = idf * freq * (K1 + 1) / (freq + norm)
+            postings.setdefault(term, []).append([doc_id, round(weight, 4)])
+    for term_postings in postings.values():
+        term_postings.sort(key=lambda p: (-p[1], p[0]))
+
+    return {'version': INDEX_VERSION,
+            'docs': [doc for doc, _ in docs],
+            'postings': postings}
+
+
+def save_index(index, filename=INDEX_FILENAME):
+    with open(filename, 'w') as f:
+        json.dump(index, f, separators=(',', ':'), sort_keys=True)
+
+
+def load_index(filename=INDEX_FILENAME):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def query(index, text, k=10):
+    """ Return up to k (score, document) pairs, best first """
+    scores = {}
+    for term in set(tokenize(text)):
+        for doc_id, weight in index['postings'].get(term, []):
+            scores[doc_id] = scores.get(doc_id, 0) + weight
+    best = sorted(scores.items(), key=lambda s: (-s[1], s[0]))[:k]
+    return [(round(score, 4), index['docs'][doc_id])
+            for doc_id, score in best]
+
+
+def benchmark_queries(data_directory=DATA_DIRECTORY):
+    """ Every distinct keyword and common request in the dataset """
+    queries = set()
+    for _, data in documents(data_directory):
+        for field in ('keywords', 'common_requests'):
+            queries.update(data.get(field) or [])
+    return sorted(queries)
+
+
+def benchmark(index, queries, k=10):
+    """ Time each query; return latency statistics in microseconds """
+    timings = []
+    for text in queries:
+        start = time.perf_counter()
+        query(index, text, k)
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    if not timings:
+        return {'queries': 0}
+    return {
+        'queries': len(timings),
+        'mean_us': round(sum(timings) / len(timings), 1),
+        'median_us': round(timings[len(timings) // 2], 1),
+        'p95_us': round(timings[int(len(timings) * 0.95)], 1),
+        'max_us': round(timings[-1], 1),
+    }
+
+
+if __name__ == "__main__":
+    """
+        python keyword_index.py
+        builds keyword_index.json from data/
+
+        python keyword_index.py --query "immigration records"
+        prints the best matching agencies and offices
+
+        python keyword_index.py --benchmark
+        times a query for every keyword in the dataset
+    """
+    parser = argparse.ArgumentParser(
+        description='Build or query the keyword to office index.')
+    parser.add_argument('--query', help='print matches for this text')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.query:
+        for score, doc in query(load_index(), args.query, args.k):
+            print('%.2f %s: %s' % (score, doc['agency'], doc['name']))
+    elif args.benchmark:
+        stats = benchmark(load_index(), benchmark_queries(), args.k)
+        print(json.dumps(stats, indent=2, sort_keys=True))
+    else:
+        save_index(build_index(documents()))
@@ -3,16 +3,16 @@
 # Fetch and build keywords from the "subject" field of federal register data
 
 from datetime import date, timedelta
-from glob import glob
 import itertools
 import logging
 import re
-import os
 import string
 
-import requests
-from requests_cache.core import CachedSession
-import yaml
+from changeset import CHANGESET_FILE
+import http_client
+import provenance
+from scraper import DATA_DIRECTORY, save_agency_data
+from sharding import agency_paths, load_path, path_agency
 
 
 FR_BASE = "https://www.federalregister.gov"
@@ -20,7 +20,7 @@ API_BASE = FR_BASE + "/api/v1/"
 FR_ARTICLES = API_BASE + "articles"
 
 
-def fetch_page(year, month, page_num, client=requests):
+def fetch_page(year, month, page_num, client=http_client):
     """Download a single page of 1000 results; return the results dict"""
     # Don't use a dict as we need the same order with each request (for
     # caching)
@@ -47,7 +47,7 @@ def fetch_page(year, month, page_num, client=requests):
         return {'results': []}
 
 
-def results_from_month(year, month, client=requests):
+def results_from_month(year, month, client=http_client):
     """Download a month of documents and emit any agency-topic pairs via a
     generator"""
     page_num = 1
@@ -138,7 +138,7 @@ def build_keywords():
     #    keywords[agency].add(topic)
 
     # Now, step back until 1999 - there are no topics before 2000
-    client = CachedSession('fr')
+    client = http_client.Client(http_client.cached_session('fr'))
     cursor = subtract_month(today)
     while cursor.year > 1999:
         num_distinct = sum(len(words) for words in keywords.values())
@@ -166,21 +166,28 @@ def new_keywords(agency_data, fr_keywords):
     return 0, agency_data
 
 
-def patch_yaml():
+OWNED_FIELDS = ('keywords',)
+
+
+def updated_agencies(fr_keywords):
     """Go through the YAML files; for all agencies, check if we have some new
-    keywords based on FR data. If so, update the YAML"""
-    fr_keywords = normalize_and_map(build_keywords())
+    keywords based on FR data. Yields (agency abbreviation, original data,
+    updated data) for each agency that has new keywords"""
+    conn = provenance.connect()
 
-    for filename in glob("data" + os.sep + "*.yaml"):
+    for filename in agency_paths(DATA_DIRECTORY):
         num_new_keywords = 0
-        with open(filename) as f:
-            yaml_data = yaml.load(f.read())
+        yaml_data = load_path(filename)
+        original = yaml_data
+        agency_abbr = path_agency(filename)
+        matched = []
         # First, check if keywords need to be added to the root
         num_new, modified = new_keywords(yaml_data, fr_keywords)
         if num_new:
             del fr_keywords[normalize_name(yaml_data['name'])]
             yaml_data = modified
             num_new_keywords += num_new
+            matched.append(None)
 
         # Next, check the children
         departments = []
@@ -190,20 +197,34 @@ def patch_yaml():
                 del fr_keywords[normalize_name(yaml_office['name'])]
                 departments.append(modified)
                 num_new_keywords += num_new
+                matched.append(yaml_office['name'])
             else:
                 departments.append(yaml_office)
 
+        for department in matched:
+            provenance.record(conn, agency_abbr, department, ['keywords'],
+                              'keywords_from_fr')
         if num_new_keywords:
-            yaml_data = dict(yaml_data, departments=departments)
-            with open(filename, 'w') as f:
-                f.write(yaml.dump(yaml_data, default_flow_style=False,
-                                  allow_unicode=True))
-                logging.info('Rewrote %s with %d new keywords', filename,
-                             num_new_keywords)
+            logging.info('%s has %d new keywords', filename,
+                         num_new_keywords)
+            yield (agency_abbr, original,
+                   dict(yaml_data, departments=departments))
     for name in fr_keywords:
         logging.warning('Could not find this agency: %s', name)
 
 
+def layer_updates():
+    """The updates this layer makes, for layers.py"""
+    return updated_agencies(normalize_and_map(build_keywords()))
+
+
+def patch_yaml():
+    """Update the YAML of every agency with new keywords from FR data"""
+    for agency_abbr, original, yaml_data in layer_updates():
+        save_agency_data(agency_abbr, yaml_data,
+                         changeset_file=CHANGESET_FILE, original=original)
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     patch_yaml()
@@ -2,14 +2,20 @@
 
 """Fill in any blanks in the YAML files by investigating a XLS"""
 from copy import deepcopy
-from glob import glob
-from scraper import extract_numbers, clean_phone_number
+from scraper import extract_numbers, clean_phone_number, save_agency_data
+from scraper import DATA_DIRECTORY, file_digest
 import logging
 import os
-from urllib.request import urlopen
 
 import xlrd
-import yaml
+
+from changeset import agency_changes, CHANGESET_FILE
+import http_client
+import provenance
+from sharding import agency_paths, load_path, path_agency
+
+XLS_URL = "http://www.foia.gov/full-foia-contacts.xls"
+XLS_PATH = "layering_data" + os.sep + "full-foia-contacts.xls"
 
 
 def organize_address(row):
@@ -110,11 +116,12 @@ def contacts_from_xls():
     Look in local directories before pulling down the data."""
     contacts = {}
 
-    xls_path = "layering_data" + os.sep + "full-foia-contacts.xls"
+    xls_path = XLS_PATH
     if not os.path.isfile(xls_path):
+        response = http_client.get(XLS_URL)
+        response.raise_for_status()
         with open(xls_path, 'wb') as f:
-            data = urlopen("http://www.foia.gov/full-foia-contacts.xls")
-            f.write(data.read())
+            f.write(response.content)
     workbook = xlrd.open_workbook(xls_path)
     for sheet in workbook.sheet_names():
         sheet = workbook.sheet_by_name(sheet)
@@ -149,9 +156,10 @@ def patch_yaml():
     """Compare YAML files with fields in the XLS. Update the YAML files with
     any information they are missing."""
     contacts = contacts_from_xls()
-    for filename in glob("data" + os.sep + "*.yaml"):
-        with open(filename) as f:
-            yaml_data = yaml.load(f.read())
+    conn = provenance.connect()
+    digest = file_digest(XLS_PATH)
+    for filename in agency_paths(DATA_DIRECTORY):
+        yaml_data = load_path(filename)
         if yaml_data['name'] in contacts:
             contact_data = contacts[yaml_data['name']]
             departments, new_dept_count = [], 0
@@ -169,12 +177,19 @@ def patch_yaml():
                                     yaml_data['name'], yaml_office['name'])
                     departments.append(yaml_office)
             if new_dept_count > 0:
+                original = dict(yaml_data)
                 yaml_data['departments'] = departments
-                with open(filename, 'w') as f:
-                    f.write(yaml.dump(yaml_data, default_flow_style=False,
-                                      allow_unicode=True))
-                    logging.info('Rewrote %s with %s updated departments',
-                                 filename, new_dept_count)
+                agency_abbr = path_agency(filename)
+                save_agency_data(
+                    agency_abbr, yaml_data, DATA_DIRECTORY,
+                    changeset_file=CHANGESET_FILE, original=original)
+                for change in agency_changes(agency_abbr, original,
+                                             yaml_data):
+                    provenance.record(
+                        conn, agency_abbr, change['department'],
+                        change['path'][:1], 'layer_with_csv', digest)
+                logging.info('Rewrote %s with %s updated departments',
+                             filename, new_dept_count)
         else:
             logging.warning('Not in XLS: %s', yaml_data['name'])
 
@@ -1,17 +1,18 @@
 #!/usr/bin/env python
 
-import yaml
-
+import changeset
 import scraper
+import sharding
 
 
 def layer_manual_data(agency_abbr):
-    filename = scraper.agency_yaml_filename('data', agency_abbr)
-    with open(filename, 'r') as f:
-        print(filename)
-        agency_data = yaml.load(f)
-        data = scraper.apply_manual_data(agency_abbr, agency_data)
-        scraper.save_agency_data(agency_abbr, data)
+    path = sharding.agency_path(scraper.DATA_DIRECTORY, agency_abbr)
+    print(path)
+    agency_data = sharding.load_path(path)
+    data = scraper.apply_manual_data(agency_abbr, agency_data)
+    scraper.save_agency_data(
+        agency_abbr, data, changeset_file=changeset.CHANGESET_FILE,
+        original=agency_data)
 
 if __name__ == "__main__":
     for agency_abbr in scraper.AGENCIES:
@@ -1,20 +1,85 @@
 import os
+import re
+import sqlite3
 import sys
-from urllib.parse import urljoin, urlparse
+import time
+from urllib.parse import unquote, urljoin, urlparse, urlunparse
+from xml.etree import ElementTree
 
 import requests
-import yaml
-from bs4 import BeautifulSoup
-
-from scraper import agency_yaml_filename, AGENCIES
-from scraper import save_agency_data
+import urllib3
+from bs4 import BeautifulSoup, SoupStrainer
+
+from changeset import CHANGESET_FILE
+import http_client
+import provenance
+from scraper import AGENCIES, DATA_DIRECTORY, save_agency_data
+from sharding import agency_path, load_path
+
+SOURCE = 'layer_with_reading_room'
+# Reading room links are in the first part of any sensible page
+MAX_PAGE_BYTES = 1024 * 1024
+READING_ROOM_TEXT = re.compile(
+    'foia library|freedom of information library|reading room|vault')
+# The same, for the path of a URL listed in a sitemap
+READING_ROOM_PATH = re.compile(
+    r'foia[-_]?library|freedom[-_]of[-_]information[-_]library|'
+    r'reading[-_]?room|vault')
+# A sitemap listing more reading rooms than this under a website is too
+# broad to tell which are its own, so its links are scanned instead
+MAX_SITEMAP_LINKS = 10
+
+# Where each link was found to end up, kept between runs
+LINK_CACHE = 'reading_room_links.sqlite'
+LINK_TTL = 14 * provenance.DAY
+BROKEN_LINK_TTL = provenance.DAY
+LINK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS links (
+    url TEXT PRIMARY KEY,
+    final_url TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    checked_at REAL
+);
+"""
 
 
 def read_yaml_file(agency_abbr):
-    yaml_filename = agency_yaml_filename('data', agency_abbr)
-    if os.path.exists(yaml_filename):
-        agency_data = yaml.load(open(yaml_filename, 'r'))
-        return agency_data
+    path = agency_path(DATA_DIRECTORY, agency_abbr)
+    if os.path.exists(path):
+        return load_path(path)
+
+
+class FetchMemo(object):
+    """ The pages and redirects fetched during one run, keyed by normalized
+    URL, so that a page shared by several departments, or a link listed by
+    several of them, is only fetched once. With a `link_cache` connection,
+    links are also looked up in, and saved to, the persistent cache. """
+
+    def __init__(self, link_cache=None):
+        # normalized website URL -> reading room links found on it
+        self.pages = {}
+        # normalized link URL -> URL it ends up at, None if it's broken
+        self.redirects = {}
+        # normalized base URL -> reading room links in the domain's sitemap
+        self.sitemaps = {}
+        self.link_cache = link_cache
+
+
+def connect_link_cache(db_filename=LINK_CACHE):
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(LINK_SCHEMA)
+    return conn
+
+
+def normalize_url(url):
+    """ Lowercase the scheme and host, and drop any fragment and trailing
+    slash, so that spellings of the same page share a key """
+    parsed = urlparse(url.strip())
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(),
+                       parsed.path.rstrip('/'), parsed.params, parsed.query,
+                       ''))
 
 
 def get_base_url(url):
@@ -58,61 +123,221 @@ def get_absolute_url(link, url):
             return [clean_link_text(link.text), href]
 
 
-def unique_links(links):
+def request_link(url, headers):
+    """ HEAD `url`, falling back to GET for servers that refuse HEAD """
+    response = http_client.head(url, verify=False, headers=headers,
+                                breaker=http_client.BREAKER)
+    if response.status_code >= 400:
+        response.close()
+        response = http_client.get(url, verify=False, stream=True,
+                                   headers=headers,
+                                   breaker=http_client.BREAKER)
+    response.close()
+    return response
+
+
+def validate_link(url, link_cache=None, now=None):
+    """ The URL that `url` redirects to, or None if it doesn't work. With a
+    link cache, results younger than LINK_TTL (BROKEN_LINK_TTL for broken
+    links) are reused, and older ones are revalidated with a conditional
+    request when the server gave an ETag or Last-Modified date. """
+    if now is None:
+        now = time.time()
+    key = normalize_url(url)
+    row = None
+    if link_cache is not None:
+        row = link_cache.execute(
+            'SELECT * FROM links WHERE url = ?', (key,)).fetchone()
+    if row is not None:
+        ttl = LINK_TTL if row['final_url'] else BROKEN_LINK_TTL
+        if row['checked_at'] + ttl > now:
+            return row['final_url']
+    headers = {}
+    if row is not None and row['final_url']:
+        if row['etag']:
+            headers['If-None-Match'] = row['etag']
+        if row['last_modified']:
+            headers['If-Modified-Since'] = row['last_modified']
+
+    final_url, etag, last_modified = None, None, None
+    try:
+        response = request_link(url, headers)
+        if response.status_code == 304:
+            final_url, etag, last_modified = (
+                row['final_url'], row['etag'], row['last_modified'])
+        elif response.status_code < 400:
+            final_url = response.url
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+    except http_client.HostSkipped:
+        raise
+    # Ignore the link, as it clearly doesn't work.
+    except requests.exceptions.RequestException:
+        pass
+    if link_cache is not None:
+        with link_cache:
+            link_cache.execute(
+                'INSERT OR REPLACE INTO links VALUES (?, ?, ?, ?, ?)',
+                (key, final_url, etag, last_modified, now))
+    return final_url
+
+
+def resolve_link(url, memo):
+    """ The URL that `url` redirects to, or None if it doesn't work """
+    key = normalize_url(url)
+    if key not in memo.redirects:
+        memo.redirects[key] = validate_link(url, memo.link_cache)
+    return memo.redirects[key]
+
+
+def unique_links(links, memo=None):
     """ We sometimes get the same URI with different link texts. Squash those.
     """
+    if memo is None:
+        memo = FetchMemo()
     redirected = []
     for l in links:
         try:
-            response = requests.get(l[1], verify=False)
-            if response.status_code < 400:
-                redirected.append([l[0], response.url])
-        # Ignore the link, as it clearly doesn't work.
-        except requests.exceptions.RequestException:
-            pass
+            url = resolve_link(l[1], memo)
+        # Not checked, so keep it as it is
+        except http_client.HostSkipped:
+            redirected.append(l)
+            continue
+        if url:
+            redirected.append([l[0], url])
     uniques = uniquefy(redirected)
     return uniques
 
 
 def scrape_reading_room_links(content, website_url):
-    doc = BeautifulSoup(content)
-    all_as = doc.find_all('a')
+    """ Only the page's links are parsed """
+    doc = BeautifulSoup(content, parse_only=SoupStrainer('a'))
     links = []
-    for link in all_as:
-        for keyword in [
-                'foia library',
-                'freedom of information library',
-                'reading room', 'vault']:
-            if keyword in link.text.lower()\
-                    and 'certification' not in link.text.lower():
-                url_pair = get_absolute_url(link, website_url)
-                if url_pair:
-                    links.append(url_pair)
+    for link in doc.find_all('a'):
+        text = link.text.lower()
+        if READING_ROOM_TEXT.search(text) and 'certification' not in text:
+            url_pair = get_absolute_url(link, website_url)
+            if url_pair:
+                links.append(url_pair)
     return links
 
 
 def reading_room_links(response):
-    """ Call the scraper with the appropriate parts of the response. """
-    return scrape_reading_room_links(response.content, response.url)
+    """ Call the scraper with the appropriate parts of the response, which
+    must have been requested with stream=True. Only the first
+    MAX_PAGE_BYTES of the page are downloaded. """
+    content = http_client.read_capped(response, MAX_PAGE_BYTES)
+    return scrape_reading_room_links(content, response.url)
 
 
-def process(data):
-    """ Actually scrape and clean up the reading room or library links. """
+def process(data, memo=None):
+    """ Actually scrape and clean up the reading room or library links. They
+    are taken from the domain's sitemap when it lists any under the website,
+    otherwise from the links on the website. Each website, and each
+    domain's sitemap, is only fetched once per `memo`. """
 
+    if memo is None:
+        memo = FetchMemo()
     if 'website' in data and data['website'].strip():
+        key = normalize_url(data['website'])
+        if key not in memo.pages:
+            memo.pages[key] = sitemap_links(data['website'], memo) or \
+                website_links(data['website'])
+        return memo.pages[key]
+
+
+def sitemap_urls(response):
+    """ Yield the page URLs in a sitemap as it is downloaded, so that large
+    sitemaps are never held in memory. Sitemap indexes aren't followed.
+    Errors reading the stream are raised as requests' ConnectionError. """
+    response.raw.decode_content = True
+    try:
+        for event, element in ElementTree.iterparse(response.raw):
+            if element.tag.rsplit('}', 1)[-1] == 'url':
+                for child in element:
+                    if child.tag.rsplit('}', 1)[-1] == 'loc' and child.text:
+                        yield child.text.strip()
+                element.clear()
+    except ElementTree.ParseError:
+        return
+    # The raw stream raises urllib3's errors, which requests would wrap
+    except urllib3.exceptions.HTTPError as e:
+        raise requests.exceptions.ConnectionError(e)
+    finally:
+        response.close()
+
+
+def link_text_from_url(url):
+    """ A name for a link found in a sitemap, from the end of its path """
+    name = [part for part in urlparse(url).path.split('/') if part][-1]
+    name = unquote(os.path.splitext(name)[0])
+    return re.sub(r'[-_]+', ' ', name).strip().title()
+
+
+def domain_sitemap_links(base_url):
+    """ [link text, url] for each reading room listed in the sitemap.xml of
+    the domain at `base_url` """
+    response = http_client.get(urljoin(base_url, 'sitemap.xml'),
+                               verify=False, stream=True,
+                               breaker=http_client.BREAKER)
+    if response.status_code != 200 or 'xml' not in response.headers.get(
+            'Content-Type', 'xml'):
+        response.close()
+        return []
+    links = []
+    for url in sitemap_urls(response):
+        path = urlparse(url).path.lower()
+        if READING_ROOM_PATH.search(path) and 'certification' not in path \
+                and domains_match(base_url, url):
+            links.append([link_text_from_url(url), url])
+    return links
+
+
+def sitemap_links(website, memo):
+    """ The reading room links in the website's domain sitemap that are
+    under the website, or None if there are none or too many """
+    if '://' not in website:
+        website = 'http://%s' % website.strip()
+    base_url = get_base_url(website)
+    key = normalize_url(base_url)
+    if key not in memo.sitemaps:
         try:
-            response = requests.get(data['website'], verify=False)
-        except requests.exceptions.MissingSchema:
-            with_schema = 'http://%s' % data['website']
-            response = requests.get(with_schema, verify=False)
-        except:
-            return None
-
-        if response.status_code == 200:
-            links = reading_room_links(response)
-            if len(links) == 0:
-                return None
-            return links
+            memo.sitemaps[key] = domain_sitemap_links(base_url)
+        except http_client.HostSkipped:
+            raise
+        except requests.exceptions.RequestException:
+            memo.sitemaps[key] = []
+    prefix = urlparse(normalize_url(website)).path + '/'
+    links = [link for link in memo.sitemaps[key]
+             if (urlparse(link[1]).path + '/').startswith(prefix)]
+    if len(links) > MAX_SITEMAP_LINKS:
+        return None
+    return links or None
+
+
+def website_links(website):
+    """ The reading room links on an agency or department website """
+    try:
+        response = http_client.get(website, verify=False, stream=True,
+                                   breaker=http_client.BREAKER)
+    except requests.exceptions.MissingSchema:
+        with_schema = 'http://%s' % website
+        response = http_client.get(with_schema, verify=False, stream=True,
+                                   breaker=http_client.BREAKER)
+    except http_client.HostSkipped:
+        raise
+    except:
+        return None
+
+    try:
+        if response.status_code == 200 and 'html' in response.headers.get(
+                'Content-Type', 'html'):
+            # The body is only read here, so errors reading it are too
+            return reading_room_links(response) or None
+    except requests.exceptions.RequestException:
+        return None
+    finally:
+        response.close()
 
 
 def uniquefy(links):
@@ -126,56 +351,104 @@ def uniquefy(links):
     return uniques
 
 
-def update_links(agency_data, links):
+def update_links(agency_data, links, memo=None):
     """ Update the reading rooms links for a particular agency. """
 
     agency_data = dict(agency_data)
 
     original_links = agency_data.get('reading_rooms', [])
     all_links = original_links + links
-    uniques = unique_links(all_links)
+    uniques = unique_links(all_links, memo)
     sorted_uniques = sorted(uniques, key=lambda x: x[0])
 
     agency_data['reading_rooms'] = sorted_uniques
     return agency_data
 
 
-def reading_room(agency_abbr):
+def reading_room(agency_abbr, provenance_conn=None, refresh=False,
+                 memo=None):
     """ Get the reading room links for the agency, and also for each of the
-    departments. """
+    departments. When a provenance connection is given, each lookup is
+    recorded in it and, with `refresh`, records whose reading rooms were
+    looked up within the TTL are skipped. Records on hosts the circuit
+    breaker has given up on are left alone, and not recorded, so that the
+    next refresh retries them. Pass the same FetchMemo for every agency in
+    a run to fetch each page only once. """
+
+    if memo is None:
+        memo = FetchMemo()
+
+    def lookup(data, department):
+        if provenance_conn is not None:
+            if refresh and not provenance.is_stale(
+                    provenance_conn, agency_abbr, department,
+                    'reading_rooms', SOURCE):
+                return data
+        try:
+            links = process(data, memo)
+        except http_client.HostSkipped:
+            return data
+        if links:
+            data = update_links(data, links, memo)
+        if provenance_conn is not None:
+            provenance.record(provenance_conn, agency_abbr, department,
+                              ['reading_rooms'], SOURCE)
+        return data
 
     agency_data = read_yaml_file(agency_abbr)
     if agency_data:
-        links = process(agency_data)
-        if links:
-            agency_data = update_links(agency_data, links)
+        agency_data = lookup(agency_data, None)
         departments = []
         if 'departments' in agency_data:
             for department in agency_data['departments']:
-                links = process(department)
-                if links:
-                    department = update_links(department, links)
-                departments.append(department)
+                departments.append(lookup(department, department['name']))
             agency_data['departments'] = departments
         return agency_data
 
 
-def all_reading_rooms():
-    """ Get reading room links for ALL agencies. """
+OWNED_FIELDS = ('reading_rooms',)
+
 
+def layer_updates(refresh=False):
+    """ Yields (agency abbreviation, original data, data with reading room
+    links) for ALL agencies, for layers.py """
+
+    conn = provenance.connect()
+    memo = FetchMemo(connect_link_cache())
     for agency in AGENCIES:
+        original = read_yaml_file(agency)
+        if original:
+            yield agency, original, reading_room(agency, conn, refresh, memo)
+
+
+def all_reading_rooms(refresh=False):
+    """ Get reading room links for ALL agencies. """
+
+    for agency, original, agency_data in layer_updates(refresh):
         print(agency)
-        agency_data = reading_room(agency)
-        save_agency_data(agency, agency_data)
+        save_agency_data(agency, agency_data, changeset_file=CHANGESET_FILE,
+                         original=original)
+    http_client.BREAKER.save_skipped()
 
 
 if __name__ == "__main__":
+    """
+        python layer_with_reading_room.py [--refresh] [agency_abbreviation]
+        With --refresh, only records whose reading rooms have outlived
+        their TTL are looked up again.
+    """
+    refresh = '--refresh' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--refresh']
     agency_abbr = None
-    if len(sys.argv) > 1:
-        agency_abbr = sys.argv[1]
+    if args:
+        agency_abbr = args[0]
 
     if agency_abbr:
-        agency_data = reading_room(agency_abbr)
-        save_agency_data(agency_abbr, agency_data)
+        agency_data = reading_room(
+            agency_abbr, provenance.connect(), refresh,
+            FetchMemo(connect_link_cache()))
+        save_agency_data(
+            agency_abbr, agency_data, changeset_file=CHANGESET_FILE)
+        http_client.BREAKER.save_skipped()
     else:
-        all_reading_rooms()
+        all_reading_rooms(refresh)
@@ -1,16 +1,34 @@
+import argparse
+import hashlib
+import json
+import logging
 import os
 import re
-import yaml
+import sqlite3
 
 from glob import glob
-from requests_cache.core import CachedSession
+
+from changeset import CHANGESET_FILE
+import http_client
+import provenance
+from scraper import DATA_DIRECTORY, save_agency_data
+from sharding import agency_paths, load_path, path_agency, path_digest
+import yaml_stream
 
 """
 This script updates the yaml files with usa_id, description, and acronyms.
+
+A snapshot of the contacts, keyed by usa_id with a digest of each, and of
+the digest of each agency's file when it was last synced, is kept in
+usa_contacts_snapshot.sqlite. Each run compares the API's contacts with it
+and only patches the agencies with an office named after a contact that was
+added, changed or removed, and the agencies whose files were changed by
+something else since. Removed contacts' usa_ids are dropped.
 """
 
 
 USA_CONTACTS_API = 'http://www.usa.gov/api/USAGovAPI/contacts.json/contacts'
+SNAPSHOT_DB = 'usa_contacts_snapshot.sqlite'
 ACRONYM = re.compile('\((.*?)\)')
 
 # The tuples below are used to normalize the names between the naming
@@ -116,52 +134,262 @@ def update_dict(old_data, new_data):
     return old_data
 
 
-def write_yaml(filename, data):
+def write_yaml(filename, data, changeset_file=None):
     """ Exports the updated yaml file """
 
-    with open(filename, 'w') as f:
-        f.write(yaml.dump(
-            data, default_flow_style=False, allow_unicode=True))
+    save_agency_data(
+        path_agency(filename), data,
+        os.path.dirname(os.path.normpath(filename)) or os.curdir,
+        changeset_file=changeset_file)
 
 
-def patch_yamls(data, directory):
+def patch_agency(agency, data, removed=()):
     """
-    Loops through yaml files and matches them to USA contacts API data
+    Updates an agency and its offices with the USA contacts API data they
+    match, dropping usa_ids in `removed`
     """
 
-    for filename in glob(directory):
-        with open(filename) as f:
-            agency = yaml.load(f.read())
-        agency_name = clean_name(agency.get('name'))
-        if agency_name in data:
-            agency = update_dict(agency, data[agency_name])
-        for office in agency['departments']:
-            office_name = clean_name(office['name'])
-            if office_name in data:
-                office = update_dict(office, data[office_name])
-        yield agency, filename
+    for record in [agency] + agency['departments']:
+        name = clean_name(record.get('name'))
+        if name in data:
+            update_dict(record, data[name])
+        elif str(record.get('usa_id')) in removed:
+            del record['usa_id']
+    return agency
 
 
-def get_api_data(url, cache):
-    """ Retrives data from USA Gov Contacts API """
+def patch_yamls(data, directory):
+    """
+    Loops through yaml files and matches them to USA contacts API data.
+    `directory` is either a data directory or a glob of yaml files.
+    """
 
-    client = CachedSession(cache)
-    request = client.get(url)
+    if os.path.isdir(directory):
+        filenames = agency_paths(directory)
+    else:
+        filenames = glob(directory)
+    for filename in filenames:
+        yield patch_agency(load_path(filename), data), filename
+
+
+def record_provenance(conn, filename, agency, data):
+    """ Attribute the fields taken from the USA Contacts API to it, with a
+    digest of the API entry each record was matched to """
+
+    agency_abbr = path_agency(filename)
+    records = [(None, agency)] + [
+        (office['name'], office) for office in agency['departments']]
+    for department, record in records:
+        contact = data.get(clean_name(record['name']))
+        if contact:
+            digest = hashlib.sha1(json.dumps(
+                contact, sort_keys=True).encode('utf-8')).hexdigest()
+            # An existing abbreviation is kept, so not every field is ours
+            fields = [f for f in sorted(contact)
+                      if record.get(f) == contact[f]]
+            provenance.record(conn, agency_abbr, department, fields,
+                              'layer_with_usa_contacts', digest)
+
+
+def get_contacts(url, cache):
+    """ Retrives the contacts from USA Gov Contacts API """
+
+    client = http_client.cached_session(cache)
+    request = http_client.get(url, session=client)
     data = request.json().get('Contact')
     if not data:
         data = [request.json()]
-    data = transform_json_data(data)
     return data
 
 
-def layer_with_data():
+def get_api_data(url, cache):
+    """ Retrives data from USA Gov Contacts API """
+
+    return transform_json_data(get_contacts(url, cache))
+
+
+SNAPSHOT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS contacts (
+    usa_id TEXT PRIMARY KEY,
+    digest TEXT,
+    names TEXT
+);
+CREATE TABLE IF NOT EXISTS agency_files (
+    agency TEXT PRIMARY KEY,
+    digest TEXT
+);
+"""
+
+
+def connect_snapshot(db_filename=SNAPSHOT_DB):
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SNAPSHOT_SCHEMA)
+    return conn
+
+
+def contact_names(contact):
+    """ The cleaned names a contact is matched under """
+
+    return [clean_name(name) for name in
+            [contact['Name']] + (contact.get('Synonym') or [])]
+
+
+def snapshot_changes(conn, contacts):
+    """
+    Compares the English contacts with the snapshot. Returns the usa_ids
+    that were added, changed and removed, as {kind: sorted ids}; the
+    names, old and new, of those contacts; and the rows of the new snapshot.
+    """
+
+    old = dict((row['usa_id'], row) for row in conn.execute(
+        'SELECT * FROM contacts'))
+    rows = {}
+    for contact in contacts:
+        if contact['Language'] == "en":
+            digest = hashlib.sha1(json.dumps(
+                contact, sort_keys=True).encode('utf-8')).hexdigest()
+            rows[str(contact['Id'])] = (
+                str(contact['Id']), digest, json.dumps(contact_names(contact)))
+    changes = {
+        'added': sorted(set(rows) - set(old)),
+        'changed': sorted(usa_id for usa_id in set(rows) & set(old)
+                          if rows[usa_id][1] != old[usa_id]['digest']),
+        'removed': sorted(set(old) - set(rows)),
+    }
+    names = set()
+    for usa_id in changes['added'] + changes['changed']:
+        names.update(json.loads(rows[usa_id][2]))
+    for usa_id in changes['changed'] + changes['removed']:
+        names.update(json.loads(old[usa_id]['names']))
+    return changes, names, sorted(rows.values())
+
+
+def save_snapshot(conn, rows):
+    with conn:
+        conn.execute('DELETE FROM contacts')
+        conn.executemany('INSERT INTO contacts VALUES (?, ?, ?)', rows)
+
+
+def mark_synced(conn, filename):
+    """ Notes the digest of an agency's file as it is after syncing """
+
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO agency_files VALUES (?, ?)',
+                     (path_agency(filename), path_digest(filename)))
+
+
+def affected_files(conn, directory, names, removed):
+    """
+    The agency files in `directory` changed since they were last synced or
+    with a record named in `names` or whose usa_id was `removed`
+    """
+
+    synced = dict((row['agency'], row['digest']) for row in conn.execute(
+        'SELECT * FROM agency_files'))
+    for filename in agency_paths(directory):
+        if synced.get(path_agency(filename)) != path_digest(filename):
+            yield filename
+            continue
+        for name, record in yaml_stream.records(filename, ['name', 'usa_id']):
+            if clean_name(record.get('name', '')) in names or \
+                    str(record.get('usa_id')) in removed:
+                yield filename
+                break
+
+
+def plan_sync(conn, contacts, directory, full=False):
+    """
+    Compares the contacts with the snapshot, returning the rows of the new
+    snapshot, the usa_ids removed since and the agency files to patch: those
+    affected by the changes, or all of them if `full`. Nothing is saved
+    until the patched files are written (see sync_done).
+    """
+
+    changes, names, rows = snapshot_changes(conn, contacts)
+    logging.info('USA Contacts: %s added, %s changed, %s removed',
+                 len(changes['added']), len(changes['changed']),
+                 len(changes['removed']))
+    removed = set(changes['removed'])
+    if full:
+        filenames = list(agency_paths(directory))
+    else:
+        filenames = list(affected_files(conn, directory, names, removed))
+    return rows, removed, filenames
+
+
+def sync_done(conn, rows, filenames):
+    """ Once the patched files are written, notes them and the contacts as
+    synced """
+
+    for filename in filenames:
+        mark_synced(conn, filename)
+    save_snapshot(conn, rows)
+
+
+OWNED_FIELDS = ('usa_id', 'description', 'abbreviation')
+
+# What layer_updates patched, until layers.py has written it and calls
+# commit(): {'rows': snapshot rows, 'filenames': [agency files]}
+PENDING = {}
+
+
+def layer_updates():
+    """ Yields (agency abbreviation, original data, updated data) for each
+    affected agency, for layers.py """
+
+    contacts = get_contacts(url=USA_CONTACTS_API, cache='usa_contacts')
+    data = transform_json_data(contacts)
+    conn = provenance.connect()
+    rows, removed, filenames = plan_sync(connect_snapshot(), contacts,
+                                         DATA_DIRECTORY)
+    PENDING.clear()
+    for filename in filenames:
+        original = load_path(filename)
+        updated_yaml = patch_agency(load_path(filename), data, removed)
+        record_provenance(conn, filename, updated_yaml, data)
+        yield path_agency(filename), original, updated_yaml
+    PENDING.update(rows=rows, filenames=filenames)
+
+
+def commit():
+    """ Called by layers.py once the changes from layer_updates have been
+    written. Until then, they are found again by the next run. """
+
+    if PENDING:
+        sync_done(connect_snapshot(), PENDING['rows'], PENDING['filenames'])
+        PENDING.clear()
+
+
+def layer_with_data(full=False):
     """ This function layers the data/yaml files with USA Contacts API data """
 
-    data = get_api_data(url=USA_CONTACTS_API, cache='usa_contacts')
-    for updated_yaml, filename in patch_yamls(
-            data=data, directory="data" + os.sep + "*.yaml"):
-        write_yaml(filename=filename, data=updated_yaml)
+    contacts = get_contacts(url=USA_CONTACTS_API, cache='usa_contacts')
+    data = transform_json_data(contacts)
+    conn = provenance.connect()
+    snapshot = connect_snapshot()
+    rows, removed, filenames = plan_sync(snapshot, contacts, DATA_DIRECTORY,
+                                         full=full)
+    for filename in filenames:
+        updated_yaml = patch_agency(load_path(filename), data, removed)
+        write_yaml(filename=filename, data=updated_yaml,
+                   changeset_file=CHANGESET_FILE)
+        record_provenance(conn, filename, updated_yaml, data)
+    sync_done(snapshot, rows, filenames)
 
 
 if __name__ == "__main__":
-    layer_with_data()
+    """
+        python layer_with_usa_contacts.py
+        patches the agencies affected by changes since the last run.
+
+        python layer_with_usa_contacts.py --full
+        patches every agency.
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Layer the yaml files with USA Contacts API data.')
+    parser.add_argument('--full', action='store_true',
+                        help='patch every agency, not only those affected')
+    args = parser.parse_args()
+    layer_with_data(full=args.full)
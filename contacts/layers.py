@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+Runs the network bound layers concurrently. Each layer declares the fields
+it owns (its OWNED_FIELDS) and yields updated agency data from
+`layer_updates()`; rather than each layer rewriting whole files, the
+changes each one makes to its own fields are collected as changesets and
+merged per agency, so every file is written once.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+from changeset import agency_changes, apply_changes, CHANGESET_FILE
+import http_client
+import keywords_from_fr
+import layer_with_reading_room
+import layer_with_usa_contacts
+import processing_time_scraper
+from scraper import DATA_DIRECTORY, save_agency_data
+from sharding import agency_path, load_path
+
+
+LAYERS = {
+    'keywords_from_fr': keywords_from_fr,
+    'layer_with_reading_room': layer_with_reading_room,
+    'layer_with_usa_contacts': layer_with_usa_contacts,
+    'processing_time_scraper': processing_time_scraper,
+}
+
+
+def field_owners(layers):
+    """ {field: layer name}; two layers may not own the same field """
+    owners = {}
+    for name in sorted(layers):
+        for field in layers[name].OWNED_FIELDS:
+            if field in owners:
+                raise ValueError('%s is owned by both %s and %s' % (
+                    field, owners[field], name))
+            owners[field] = name
+    return owners
+
+
+def layer_patch(name, owned_fields, updates):
+    """ The changes a layer makes, as {agency abbreviation: changes}. A
+    layer that changes anything but its own fields is an error. """
+    patch = {}
+    for agency_abbr, original, data in updates:
+        changes = agency_changes(agency_abbr, original, data)
+        for change in changes:
+            if not change['path'] or change['path'][0] not in owned_fields:
+                raise ValueError('%s changed %s [%s] %s, which it does not '
+                                 'own' % (name, agency_abbr,
+                                          change['department'],
+                                          change['path']))
+        if changes:
+            patch[agency_abbr] = changes
+    return patch
+
+
+def run_layer(name, module):
+    logging.info('Running %s', name)
+    return layer_patch(name, module.OWNED_FIELDS, module.layer_updates())
+
+
+def collect_patches(layers, workers=None):
+    """ Run the layers in a thread pool, returning {layer name: patch} """
+    field_owners(layers)
+    with ThreadPoolExecutor(max_workers=workers or len(layers)) as executor:
+        futures = dict((name, executor.submit(run_layer, name, layers[name]))
+                       for name in layers)
+        return dict((name, futures[name].result()) for name in futures)
+
+
+def merge_patches(patches):
+    """ {agency abbreviation: changes} combining every layer's patch """
+    merged = {}
+    for name in sorted(patches):
+        for agency_abbr, changes in patches[name].items():
+            merged.setdefault(agency_abbr, []).extend(changes)
+    return merged
+
+
+def apply_patches(merged, data_directory=DATA_DIRECTORY,
+                  changeset_file=CHANGESET_FILE):
+    """ Apply the merged changes, writing each agency's file once """
+    for agency_abbr in sorted(merged):
+        original = load_path(agency_path(data_directory, agency_abbr))
+        data = apply_changes(original, merged[agency_abbr])
+        save_agency_data(agency_abbr, data, data_directory,
+                         changeset_file=changeset_file, original=original)
+        logging.info('Rewrote %s with %s changes', agency_abbr,
+                     len(merged[agency_abbr]))
+
+
+def commit_layers(layers):
+    """ Once the changes are written, lets each layer with a commit()
+    function record that they were """
+    for name in sorted(layers):
+        commit = getattr(layers[name], 'commit', None)
+        if commit is not None:
+            commit()
+
+
+if __name__ == "__main__":
+    """
+        python layers.py
+        runs all of the layers concurrently and merges their changes.
+
+        python layers.py keywords_from_fr layer_with_reading_room
+        runs only the named layers.
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Run layers concurrently and merge their changes.')
+    parser.add_argument('layers', nargs='*',
+                        help='Layers to run (default: all of %s)' %
+                        ', '.join(sorted(LAYERS)))
+    parser.add_argument('--workers', type=int,
+                        help='Number of layers to run at once')
+    args = parser.parse_args()
+
+    names = args.layers or sorted(LAYERS)
+    for name in names:
+        if name not in LAYERS:
+            parser.error('unknown layer %s' % name)
+    layers = dict((name, LAYERS[name]) for name in names)
+    apply_patches(merge_patches(collect_patches(layers, args.workers)))
+    commit_layers(layers)
+    http_client.BREAKER.save_skipped()
@@ -0,0 +1,364 @@
+"""
+Micro-benchmarks for the functions the scripts spend their time in, run on
+inputs taken from data/ and the cached pages. Results are saved per commit
+to benchmark_results/<commit>.json, and each run is compared with the
+results saved for another commit: a benchmark that got slower by more than
+its threshold is a regression, and the run exits with an error.
+
+    python micro_benchmarks.py
+    python micro_benchmarks.py clean_name yaml_load --baseline 1a2b3c4
+"""
+
+import argparse
+from glob import glob
+import json
+import logging
+import os
+import platform
+import subprocess
+import time
+from urllib.parse import parse_qsl, urlparse
+
+from bs4 import BeautifulSoup
+import yaml
+
+import keywords_from_fr
+import layer_with_csv
+import layer_with_usa_contacts
+import processing_time_scraper
+import scraper
+from sharding import agency_paths, load_path, path_agency
+import stand_in
+import yaml_writer
+
+
+RESULTS_DIRECTORY = 'benchmark_results'
+# Each timing runs a benchmark enough times to take at least MIN_SECONDS;
+# the best of REPEAT timings is kept
+MIN_SECONDS = 0.2
+REPEAT = 5
+# A benchmark regresses when it takes this many times as long as before
+THRESHOLD = 1.2
+THRESHOLDS = {
+    # Dominated by BeautifulSoup, whose timings vary more
+    'parse_agency': 1.3,
+    'parse_html': 1.3,
+}
+
+
+def agencies(data_directory):
+    return [(path_agency(path), load_path(path))
+            for path in agency_paths(data_directory)]
+
+
+def records(data_directory):
+    for abb, agency in agencies(data_directory):
+        yield agency
+        for department in agency['departments']:
+            yield department
+
+
+def agency_pages(data_directory):
+    """ The scraper's cached page for each agency, or the page foia.gov
+    would serve for it """
+    pages = []
+    for abb, agency in agencies(data_directory):
+        filename = os.path.join('html', '%s.html' % abb)
+        if os.path.exists(filename):
+            with open(filename) as f:
+                pages.append((abb, f.read()))
+        else:
+            pages.append((abb, stand_in.agency_page(agency)))
+    return pages
+
+
+def time_data_pages(html_directory='html', cassettes=stand_in.CASSETTES):
+    """ (page, year) for the cached and recorded processing time pages """
+    pages = []
+    for filename in sorted(glob(os.path.join(html_directory,
+                                             '*_timedata.html'))):
+        with open(filename) as f:
+            pages.append((f.read(), filename.split('_')[-2]))
+    for filename in sorted(glob(cassettes)):
+        with open(filename) as f:
+            cassette = yaml.load(f)
+        for interaction in cassette.get('interactions', []):
+            url = interaction['request']['uri']
+            if url.startswith(processing_time_scraper.PROCESSING_TIMES_URL):
+                year = dict(parse_qsl(urlparse(url).query))['requestYear']
+                pages.append((interaction['response']['body']['string'],
+                              year))
+    return pages
+
+
+def bench_parse_agency(data_directory):
+    pages = agency_pages(data_directory)
+
+    def run():
+        for abb, text in pages:
+            scraper.parse_agency(
+                abb, BeautifulSoup(scraper.fix_known_typos(text)))
+    return run, len(pages)
+
+
+def bench_clean_phone_number(data_directory):
+    phones = [record[field] for record in records(data_directory)
+              for field in ('phone', 'fax') if record.get(field)]
+
+    def run():
+        for phone in phones:
+            scraper.clean_phone_number(phone)
+    return run, len(phones)
+
+
+def bench_extract_numbers(data_directory):
+    lines = [', '.join(record[field]['phone'])
+             for record in records(data_directory)
+             for field in ('service_center', 'public_liaison')
+             if (record.get(field) or {}).get('phone')]
+
+    def run():
+        for line in lines:
+            scraper.extract_numbers(line)
+    return run, len(lines)
+
+
+def bench_address_list_to_dict(data_directory):
+    address_lists = []
+    for record in records(data_directory):
+        address = record.get('address')
+        if address and address.get('street'):
+            address_lists.append(address.get('address_lines', []) + [
+                address['street'], '%s, %s %s' % (
+                    address.get('city'), address.get('state'),
+                    address.get('zip'))])
+
+    def run():
+        for address_list in address_lists:
+            scraper.address_list_to_dict(address_list)
+    return run, len(address_lists)
+
+
+def bench_patch_dict(data_directory):
+    """ Only run when the XLS has been downloaded """
+    if not os.path.exists(layer_with_csv.XLS_PATH):
+        return None
+    contacts = layer_with_csv.contacts_from_xls()
+    pairs = []
+    for abb, agency in agencies(data_directory):
+        offices = contacts.get(agency['name'], {})
+        for department in agency['departments']:
+            if department['name'] in offices:
+                pairs.append((department, offices[department['name']]))
+
+    def run():
+        for old_dict, new_dict in pairs:
+            layer_with_csv.patch_dict(old_dict, new_dict)
+    return run, len(pairs)
+
+
+def record_names(data_directory):
+    return [record['name'] for record in records(data_directory)]
+
+
+def bench_clean_name(data_directory):
+    names = record_names(data_directory)
+
+    def run():
+        for name in names:
+            layer_with_usa_contacts.clean_name(name)
+    return run, len(names)
+
+
+def bench_normalize_name(data_directory):
+    names = record_names(data_directory)
+
+    def run():
+        for name in names:
+            keywords_from_fr.normalize_name(name)
+    return run, len(names)
+
+
+def bench_parse_html(data_directory):
+    pages = time_data_pages()
+
+    def run():
+        for html, year in pages:
+            processing_time_scraper.parse_html(
+                html, {'requestYear': year}, {})
+    return run, len(pages)
+
+
+def bench_yaml_load(data_directory):
+    paths = list(agency_paths(data_directory))
+
+    def run():
+        for path in paths:
+            load_path(path)
+    return run, len(paths)
+
+
+def bench_yaml_dump(data_directory):
+    data = [agency for abb, agency in agencies(data_directory)]
+
+    def run():
+        for agency in data:
+            yaml_writer.dump(agency)
+    return run, len(data)
+
+
+BENCHMARKS = [
+    ('parse_agency', bench_parse_agency),
+    ('clean_phone_number', bench_clean_phone_number),
+    ('extract_numbers', bench_extract_numbers),
+    ('address_list_to_dict', bench_address_list_to_dict),
+    ('patch_dict', bench_patch_dict),
+    ('clean_name', bench_clean_name),
+    ('normalize_name', bench_normalize_name),
+    ('parse_html', bench_parse_html),
+    ('yaml_load', bench_yaml_load),
+    ('yaml_dump', bench_yaml_dump),
+]
+
+
+def measure(run, min_seconds=MIN_SECONDS, repeat=REPEAT):
+    """ Time `run`; return the best and median microseconds per run """
+    start = time.perf_counter()
+    run()
+    once = time.perf_counter() - start
+    loops = max(1, int(min_seconds / once)) if once else 1000
+    timings = []
+    for attempt in range(repeat):
+        start = time.perf_counter()
+        for loop in range(loops):
+            run()
+        timings.append((time.perf_counter() - start) / loops * 1e6)
+    timings.sort()
+    return {
+        'loops': loops,
+        'best_us': round(timings[0], 1),
+        'median_us': round(timings[len(timings) // 2], 1),
+    }
+
+
+def run_benchmarks(names=None, data_directory=scraper.DATA_DIRECTORY,
+                   min_seconds=MIN_SECONDS, repeat=REPEAT):
+    """ {benchmark: timings and number of inputs} for the benchmarks in
+    `names` (by default, all) whose inputs are available """
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+        prepared = setup(data_directory)
+        if prepared is None:
+            logging.warning('Skipping %s, its inputs are missing', name)
+            continue
+        run, inputs = prepared
+        results[name] = measure(run, min_seconds, repeat)
+        results[name]['inputs'] = inputs
+    return results
+
+
+def current_commit():
+    """ The checked out commit, marked -dirty if there are changes """
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(results, commit, directory=RESULTS_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    filename = os.path.join(directory, '%s.json' % commit)
+    with open(filename, 'w') as f:
+        json.dump({'commit': commit, 'recorded_at': time.time(),
+                   'python': platform.python_version(),
+                   'benchmarks': results}, f, indent=2, sort_keys=True)
+    return filename
+
+
+def load_results(commit, directory=RESULTS_DIRECTORY):
+    with open(os.path.join(directory, '%s.json' % commit)) as f:
+        return json.load(f)
+
+
+def latest_results(exclude=None, directory=RESULTS_DIRECTORY):
+    """ The most recently saved results not for commit `exclude` """
+    saved = []
+    for filename in glob(os.path.join(directory, '*.json')):
+        with open(filename) as f:
+            results = json.load(f)
+        if results['commit'] != exclude:
+            saved.append((results['recorded_at'], results))
+    if saved:
+        return max(saved, key=lambda item: item[0])[1]
+
+
+def compare(baseline, results, threshold=None, thresholds=THRESHOLDS):
+    """ [(benchmark, ratio to the baseline, regressed)] for the benchmarks
+    in both. A `threshold` applies to every benchmark; without one, each
+    has its own in `thresholds`, or THRESHOLD. """
+    comparison = []
+    for name in sorted(results):
+        if name in baseline:
+            ratio = results[name]['best_us'] / baseline[name]['best_us']
+            limit = threshold or thresholds.get(name, THRESHOLD)
+            comparison.append((name, round(ratio, 3), ratio > limit))
+    return comparison
+
+
+if __name__ == "__main__":
+    """
+        python micro_benchmarks.py
+        runs every benchmark, saves the results for the current commit and
+        compares them with the last results saved for another commit.
+
+        python micro_benchmarks.py parse_agency --baseline 1a2b3c4 --no-save
+        runs one benchmark and compares it with commit 1a2b3c4's results.
+    """
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(
+        description='Run the micro-benchmarks and check for regressions.')
+    parser.add_argument('benchmarks', nargs='*',
+                        help='Benchmarks to run (default: all of %s)' %
+                        ', '.join(name for name, setup in BENCHMARKS))
+    parser.add_argument('--baseline', help='commit to compare with')
+    defaults = ', '.join('%s for %s' % (limit, name)
+                         for name, limit in sorted(THRESHOLDS.items()))
+    parser.add_argument('--threshold', type=float,
+                        help='Slowdown that is a regression, applied to '
+                        'every benchmark (default: %s, or %s)' % (
+                            THRESHOLD, defaults))
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    known = [name for name, setup in BENCHMARKS]
+    for name in args.benchmarks:
+        if name not in known:
+            parser.error('unknown benchmark %s' % name)
+    results = run_benchmarks(args.benchmarks)
+    commit = current_commit()
+    for name in sorted(results):
+        print('%(name)-22s %(best_us)12.1fus %(median_us)12.1fus '
+              '%(inputs)6d inputs' % dict(results[name], name=name))
+    if not args.no_save:
+        print('Saved %s' % save_results(results, commit))
+
+    if args.baseline:
+        baseline = load_results(args.baseline)
+    else:
+        baseline = latest_results(exclude=commit)
+    if baseline is None:
+        print('No results to compare with')
+    else:
+        regressed = False
+        print('Compared with %s:' % baseline['commit'])
+        for name, ratio, slower in compare(baseline['benchmarks'], results,
+                                           args.threshold):
+            print('%-22s %6.2fx%s' % (name, ratio,
+                                      '  REGRESSION' if slower else ''))
+            regressed = regressed or slower
+        if regressed:
+            raise SystemExit(1)
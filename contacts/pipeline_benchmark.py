@@ -0,0 +1,150 @@
+"""
+Runs the whole pipeline, as listed in the README, against a stand_in.py
+server and reports each stage's wall time and the requests it made and
+bytes it downloaded. The pipeline runs in a scratch directory holding a
+copy of data/ and manual_data/ but none of the scripts' caches, so every
+stage fetches all it needs.
+
+    python pipeline_benchmark.py --latency 0.05 --error-rate 0.01
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import http_client
+import keywords_from_fr
+import layer_with_csv
+import layer_with_reading_room
+import layer_with_usa_contacts
+import processing_time_scraper
+import scraper
+import stand_in
+
+
+STAGES = [
+    ('scraper', scraper.save_agencies),
+    ('layer_with_csv', layer_with_csv.patch_yaml),
+    ('layer_with_usa_contacts', layer_with_usa_contacts.layer_with_data),
+    ('processing_time_scraper', processing_time_scraper.scrape_times),
+    ('keywords_from_fr', keywords_from_fr.patch_yaml),
+    ('layer_with_reading_room', layer_with_reading_room.all_reading_rooms),
+]
+COPIED = ['manual_data', 'layering_data/foiadata_to_yaml_mapping.yaml']
+
+
+def prepare(workdir, data_directory=scraper.DATA_DIRECTORY):
+    """ Copy the data and the files the scripts read, but not their
+    caches, into `workdir` """
+    shutil.copytree(data_directory,
+                    os.path.join(workdir, scraper.DATA_DIRECTORY))
+    for path in COPIED:
+        target = os.path.join(workdir, path)
+        if os.path.isdir(path):
+            shutil.copytree(path, target)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy(path, target)
+    os.makedirs(os.path.join(workdir, 'html'))
+
+
+def run_stage(name, function, server):
+    """ Run a stage, returning its timings and the traffic it caused. A
+    failing stage is reported rather than stopping the run. """
+    before = server.stats()
+    started = time.time()
+    error = None
+    try:
+        function()
+    except Exception as e:
+        logging.exception('%s failed', name)
+        error = '%s: %s' % (type(e).__name__, e)
+    seconds = time.time() - started
+    after = server.stats()
+    result = dict((key, after[key] - before[key]) for key in after)
+    result.update({'stage': name, 'seconds': seconds, 'error': error})
+    return result
+
+
+def run_pipeline(server, stages=STAGES):
+    """ Run `stages` in a scratch directory against `server` """
+    if os.path.isabs(scraper.DATA_DIRECTORY):
+        raise ValueError('FOIA_DATA_DIR must be relative, the pipeline '
+                         'runs on a copy')
+    cwd = os.getcwd()
+    breaker = http_client.BREAKER
+    workdir = tempfile.mkdtemp()
+    try:
+        prepare(workdir)
+        os.chdir(workdir)
+        http_client.use_stand_in(server.address)
+        http_client.BREAKER = http_client.CircuitBreaker()
+        return [run_stage(name, function, server)
+                for name, function in stages]
+    finally:
+        http_client.use_stand_in(None)
+        http_client.BREAKER = breaker
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+
+
+def print_results(results):
+    for result in results:
+        print('%(stage)-26s %(seconds)8.2fs %(requests)7d requests '
+              '%(bytes)11d bytes %(errors)5d errors' % result)
+        if result['error']:
+            print('    failed: %s' % result['error'])
+    print('%-26s %8.2fs %7d requests %11d bytes' % (
+        'total', sum(r['seconds'] for r in results),
+        sum(r['requests'] for r in results),
+        sum(r['bytes'] for r in results)))
+
+
+if __name__ == "__main__":
+    """
+        python pipeline_benchmark.py
+        runs every stage against a stand-in with no latency or errors.
+
+        python pipeline_benchmark.py scraper layer_with_csv --latency 0.1
+        runs only the named stages, with each response taking 0.1s.
+    """
+    parser = argparse.ArgumentParser(
+        description='Time the pipeline against a local stand-in server.')
+    parser.add_argument('stages', nargs='*',
+                        help='Stages to run (default: all, in order)')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds to delay each response by')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='share of requests to fail with a 503')
+    parser.add_argument('--seed', type=int, help='for the failures')
+    parser.add_argument('--fixtures', default=stand_in.FIXTURES)
+    parser.add_argument('--json', help='also write the results here')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING)
+
+    names = [name for name, function in STAGES]
+    for name in args.stages:
+        if name not in names:
+            parser.error('unknown stage %s' % name)
+    stages = [(name, function) for name, function in STAGES
+              if not args.stages or name in args.stages]
+    fixtures = stand_in.Fixtures(args.fixtures)
+    if not fixtures.index:
+        fixtures = stand_in.import_fixtures(args.fixtures)
+    server = stand_in.StandIn(('localhost', 0), fixtures, stand_in.Site(),
+                              args.latency, args.error_rate, args.seed)
+    server.start()
+    results = run_pipeline(server, stages)
+    server.shutdown()
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'latency': args.latency,
+                       'error_rate': args.error_rate,
+                       'stages': results}, f, indent=2, sort_keys=True)
@@ -2,13 +2,17 @@
 from bs4 import BeautifulSoup
 from copy import deepcopy
 import logging
-from glob import glob
 import os
 import csv
 import re
-import requests
 import yaml
 
+from changeset import CHANGESET_FILE
+import http_client
+import provenance
+from scraper import DATA_DIRECTORY, save_agency_data
+from sharding import agency_paths, load_path, path_agency
+
 """ This script scrapes processing times data from foia.gov and dumps
     the data in both the yaml files and `request_time_data.csv`."""
 
@@ -87,14 +91,21 @@ def append_time_stats(yaml_data, data, yaml_key, year):
     return yaml_data
 
 
-def patch_yamls(top_level_data, dept_level_data):
-    """ Patches yaml files with average times """
+OWNED_FIELDS = ('request_time_stats',)
+
+
+def updated_agencies(top_level_data, dept_level_data):
+    """ Adds average times to the yaml data, yielding (agency abbreviation,
+    original data, updated data) for each agency """
 
     years = get_years()
-    for filename in glob("data" + os.sep + "*.yaml"):
-        short_filename = '_%s' % filename.strip('.yaml').strip('/data')
-        with open(filename) as f:
-            yaml_data = yaml.load(f.read())
+    conn = provenance.connect()
+    for filename in agency_paths(DATA_DIRECTORY):
+        short_filename = '_%s' % (path_agency(filename) + '.yaml').strip(
+            '.yaml').strip('/data')
+        yaml_data = load_path(filename)
+        original = deepcopy(yaml_data)
+        matched = set()
         for year in years:
             year = "_%s" % year
             agency_key = yaml_data['name'] + short_filename + year
@@ -102,16 +113,30 @@ def patch_yamls(top_level_data, dept_level_data):
             if agency_key in top_level_data.keys():
                 yaml_data = append_time_stats(
                     yaml_data, top_level_data, agency_key, year)
+                matched.add(None)
             for internal_data in yaml_data['departments']:
                 office_key = internal_data['name'] + short_filename + year
                 office_key = office_key.lower()
                 if office_key in dept_level_data.keys():
                     internal_data = append_time_stats(
                         internal_data, dept_level_data, office_key, year)
+                    matched.add(internal_data['name'])
 
-        with open(filename, 'w') as f:
-            f.write(yaml.dump(
-                yaml_data, default_flow_style=False, allow_unicode=True))
+        agency_abbr = path_agency(filename)
+        for department in matched:
+            provenance.record(conn, agency_abbr, department,
+                              ['request_time_stats'],
+                              'processing_time_scraper')
+        yield agency_abbr, original, yaml_data
+
+
+def patch_yamls(top_level_data, dept_level_data):
+    """ Patches yaml files with average times """
+
+    for agency_abbr, original, yaml_data in updated_agencies(
+            top_level_data, dept_level_data):
+        save_agency_data(agency_abbr, yaml_data,
+                         changeset_file=CHANGESET_FILE, original=original)
 
 
 def make_column_names():
@@ -190,7 +215,7 @@ def fetch_page(url, params):
         with open(filename, 'r') as f:
             return f.read()
     else:
-        response = requests.get(url, params=params)
+        response = http_client.get(url, params=params)
         with open(filename, 'w') as f:
             f.write(response.text)
         return response.text
@@ -239,7 +264,7 @@ def get_years(html=None):
     """ Gets year data by scraping the data page """
 
     if html is None:
-        r = requests.get(YEARS_URL)
+        r = http_client.get(YEARS_URL)
         html = r.text
 
     soup = BeautifulSoup(html)
@@ -260,8 +285,9 @@ def all_years(url, params, data):
     return data
 
 
-def scrape_times():
-    """ Loops through foia.gov data for processing time """
+def fetch_times():
+    """ Loops through foia.gov data for processing time, returning the top
+    level and department level data mapped to yaml names """
 
     url = PROCESSING_TIMES_URL
     params = {"advanceSearch": "71001.gt.-999999"}
@@ -281,8 +307,19 @@ def scrape_times():
 
     top_level_data = apply_mapping(top_level_data)
     dept_level_data = apply_mapping(dept_level_data)
+    return top_level_data, dept_level_data
+
+
+def layer_updates():
+    """ The updates this layer makes, for layers.py """
+
+    return updated_agencies(*fetch_times())
+
+
+def scrape_times():
+    """ Loops through foia.gov data for processing time """
 
-    patch_yamls(top_level_data, dept_level_data,)
+    patch_yamls(*fetch_times())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+Tracks where each field of the contacts data came from: the source that
+produced it, when it was fetched and a digest of the source document. This
+is kept in a sidecar SQLite database next to data/ so the YAML stays as it
+is. Scripts run in refresh mode use it to skip fields that were fetched
+more recently than their source's time to live.
+"""
+
+import argparse
+import sqlite3
+import time
+
+
+PROVENANCE_DB = 'provenance.sqlite'
+DAY = 24 * 60 * 60
+
+# Time to live, in seconds, for fields produced by each source
+SOURCE_TTLS = {
+    'scraper': 30 * DAY,
+    'layer_with_csv': 30 * DAY,
+    'layer_with_usa_contacts': 7 * DAY,
+    'processing_time_scraper': 90 * DAY,
+    'keywords_from_fr': 30 * DAY,
+    'layer_with_reading_room': 14 * DAY,
+}
+DEFAULT_TTL = 30 * DAY
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS provenance (
+    agency TEXT,
+    department TEXT,
+    field TEXT,
+    source TEXT,
+    fetched_at REAL,
+    source_digest TEXT,
+    PRIMARY KEY (agency, department, field)
+);
+CREATE INDEX IF NOT EXISTS provenance_source
+    ON provenance (source, fetched_at);
+"""
+
+# Departments are stored under their name; the agency's own fields under ''
+AGENCY = ''
+
+
+def connect(db_filename=PROVENANCE_DB):
+    conn = sqlite3.connect(db_filename)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record(conn, agency, department, fields, source, source_digest=None,
+           fetched_at=None):
+    """ Note that `fields` of one agency or department were just fetched
+    from `source` """
+    if fetched_at is None:
+        fetched_at = time.time()
+    with conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO provenance VALUES (?, ?, ?, ?, ?, ?)',
+            [(agency, department or AGENCY, field, source, fetched_at,
+              source_digest) for field in fields])
+
+
+def record_agency(conn, agency, data, source, fields=None,
+                  source_digest=None, fetched_at=None):
+    """ Record provenance for the agency and all of its departments. Without
+    `fields`, every field present in each record other than its name is
+    attributed to the source. """
+    if fetched_at is None:
+        fetched_at = time.time()
+    records = [(AGENCY, data)] + [
+        (d['name'], d) for d in data.get('departments', [])]
+    for department, record_data in records:
+        record_fields = fields
+        if record_fields is None:
+            record_fields = [f for f in record_data
+                             if f not in ('name', 'departments')]
+        record(conn, agency, department, record_fields, source,
+               source_digest, fetched_at)
+
+
+def lookup(conn, agency, department, field):
+    return conn.execute(
+        'SELECT * FROM provenance WHERE agency = ? AND department = ? '
+        'AND field = ?', (agency, department or AGENCY, field)).fetchone()
+
+
+def is_stale(conn, agency, department, field, source, now=None):
+    """ True if the field was never fetched from `source` or was fetched
+    longer ago than the source's TTL """
+    row = lookup(conn, agency, department, field)
+    if row is None or row['source'] != source:
+        return True
+    if now is None:
+        now = time.time()
+    return row['fetched_at'] + SOURCE_TTLS.get(source, DEFAULT_TTL) < now
+
+
+def agency_is_stale(conn, agency, source, now=None):
+    """ True if nothing of the agency's was fetched from `source` within
+    the source's TTL """
+    fetched_at = conn.execute(
+        'SELECT MAX(fetched_at) FROM provenance WHERE agency = ? '
+        'AND source = ?', (agency, source)).fetchone()[0]
+    if fetched_at is None:
+        return True
+    if now is None:
+        now = time.time()
+    return fetched_at + SOURCE_TTLS.get(source, DEFAULT_TTL) < now
+
+
+def stale_fields(conn, source, now=None):
+    """ (agency, department, field) rows attributed to `source` that have
+    outlived its TTL """
+    if now is None:
+        now = time.time()
+    cutoff = now - SOURCE_TTLS.get(source, DEFAULT_TTL)
+    return conn.execute(
+        'SELECT agency, department, field, fetched_at FROM provenance '
+        'WHERE source = ? AND fetched_at < ? ORDER BY agency, department, '
+        'field', (source, cutoff)).fetchall()
+
+
+if __name__ == "__main__":
+    """
+        python provenance.py layer_with_reading_room
+        lists the fields from that source which are due for a refresh
+    """
+    parser = argparse.ArgumentParser(
+        description='List fields that have outlived their source TTL.')
+    parser.add_argument('source', choices=sorted(SOURCE_TTLS))
+    args = parser.parse_args()
+
+    conn = connect()
+    for row in stale_fields(conn, args.source):
+        print('%s [%s] %s: %s' % (
+            row['agency'], row['department'], row['field'],
+            time.strftime('%Y-%m-%d', time.localtime(row['fetched_at']))))
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 
+import hashlib
 from itertools import takewhile
 import logging
 import os
@@ -7,14 +8,22 @@ from random import randint
 import re
 import sys
 from urllib.parse import urlencode
-from urllib.request import urlopen
 
 from bs4 import BeautifulSoup
 import yaml
 
+import changeset
+import http_client
+import provenance
+import sharding
 import typos
 
 
+# Where the agency YAML files are read from and written to. Set
+# FOIA_DATA_DIR to work on another copy, such as a generation built by
+# generations.py.
+DATA_DIRECTORY = os.environ.get('FOIA_DATA_DIR', 'data')
+
 # http://www.foia.gov/foiareport.js
 # Excludes "ALL" (All agencies, though it's not, really).
 # Excludes " ", which in `agenciesAb` is "SIGIR", the Special Inspector
@@ -329,6 +338,13 @@ def agency_yaml_filename(data_directory, agency_abbr):
     return os.path.join(data_directory, '%s.yaml' % agency_abbr)
 
 
+def file_digest(filename):
+    """ SHA1 of a file's contents, used to tell whether it has changed since
+    it was last processed. """
+    with open(filename, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
 def read_manual_data(agency_abbr, manual_data_dir='manual_data'):
     if os.path.isdir(manual_data_dir):
         filename = agency_yaml_filename(manual_data_dir, agency_abbr)
@@ -417,11 +433,26 @@ def populate_parent(agency_data):
     return agency_data
 
 
-def save_agency(abb):
+def save_agency(abb, refresh=False, conn=None):
     """For a given agency, download (if not already present) their HTML,
-    process it, and save the resulting YAML"""
+    process it, and save the resulting YAML. With `refresh`, agencies whose
+    scraped data has outlived its TTL are downloaded again and the others
+    are left alone. Provenance is recorded with `conn`, or a connection
+    opened for this agency."""
+    if conn is None:
+        conn = provenance.connect()
+        try:
+            return save_agency(abb, refresh, conn)
+        finally:
+            conn.close()
     os.makedirs('html', exist_ok=True)
     html_path = "html" + os.sep + "%s.html" % abb
+    if refresh:
+        if not provenance.agency_is_stale(conn, abb, 'scraper'):
+            logging.info("[%s] Fresh, skipping.", abb)
+            return
+        if os.path.isfile(html_path):
+            os.remove(html_path)
     if not os.path.isfile(html_path):
         body = ""
         body = download_agency(abb)
@@ -440,27 +471,50 @@ def save_agency(abb):
     text = fix_known_typos(text)
     data = parse_agency(abb, BeautifulSoup(text))
     data = populate_parent(data)
+    digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    provenance.record_agency(conn, abb, data, 'scraper', source_digest=digest)
+    manual_data = read_manual_data(abb)
+    if manual_data:
+        provenance.record_agency(conn, abb, manual_data, 'manual_data')
     data = apply_manual_data(abb, data)
-    save_agency_data(abb, data)
+    save_agency_data(abb, data, changeset_file=changeset.CHANGESET_FILE)
 
 
-def save_agency_data(agency_abbr, data, data_directory='data'):
-    """ Actually do the save. """
+def save_agency_data(agency_abbr, data, data_directory=DATA_DIRECTORY,
+                     changeset_file=None, original=None):
+    """ Actually do the save, in whichever layout the agency already has
+    (see sharding.py). If a `changeset_file` is given, the differences from
+    `original` (by default, the data being replaced) are appended to it.
+    """
     os.makedirs(data_directory, exist_ok=True)
 
     if data:
-        with open(data_directory + os.sep + "%s.yaml" % agency_abbr, 'w') as f:
-            f.write(yaml.dump(data, default_flow_style=False,
-                    allow_unicode=True))
-            logging.info("[%s] Parsed.", agency_abbr)
+        path = sharding.agency_path(data_directory, agency_abbr)
+        if changeset_file:
+            if original is None and os.path.exists(path):
+                original = sharding.load_path(path)
+            changeset.write_changeset(
+                changeset.agency_changes(agency_abbr, original, data),
+                changeset_file)
+        # Files are replaced in one step, so readers never see half of one
+        # and hard linked copies are left alone
+        if os.path.isdir(path):
+            sharding.save_sharded(path, data)
+        else:
+            sharding.write_file(path, data)
+        logging.info("[%s] Parsed.", agency_abbr)
     else:
         logging.warning("[%s] DID NOT PARSE, NO.", agency_abbr)
 
 
-def save_agencies():
+def save_agencies(refresh=False):
     """Save all agencies"""
-    for agency in AGENCIES:
-        save_agency(agency)
+    conn = provenance.connect()
+    try:
+        for agency in AGENCIES:
+            save_agency(agency, refresh, conn)
+    finally:
+        conn.close()
 
 
 def agency_url(abb):
@@ -472,7 +526,9 @@ def agency_url(abb):
 def download_agency(abb):
     """Agency HTML files"""
     url = agency_url(abb)
-    return urlopen(url).read().decode("utf-8")
+    response = http_client.get(url)
+    response.raise_for_status()
+    return response.content.decode("utf-8")
 
 
 if __name__ == "__main__":
@@ -481,14 +537,19 @@ if __name__ == "__main__":
         will only scrape and save the data for the provided agency.
 
         python scraper.py will scrape and save data for all the agencies.
+
+        python scraper.py --refresh only downloads again the agencies
+        whose scraped data has outlived its TTL.
     """
     logging.basicConfig(level=logging.INFO)
 
+    refresh = '--refresh' in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg != '--refresh']
     agency_abbr = None
-    if len(sys.argv) > 1:
-        agency_abbr = sys.argv[1]
+    if args:
+        agency_abbr = args[0]
 
     if agency_abbr:
-        save_agency(agency_abbr)
+        save_agency(agency_abbr, refresh)
     else:
-        save_agencies()
+        save_agencies(refresh)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+An optional layout for the largest agencies. Instead of data/DOJ.yaml, each
+department is kept in its own file under data/DOJ/, next to a manifest,
+agency.yaml, that holds the agency's own fields and lists its department
+files in order. Saving a sharded agency only rewrites the files of the
+departments that changed. Every loader in this directory reads both
+layouts through `agency_paths` and `load_path`.
+
+    python sharding.py shard DOJ DoD USDA
+    python sharding.py unshard DOJ
+"""
+
+import argparse
+from glob import glob
+import hashlib
+import os
+import re
+import shutil
+
+import yaml
+
+import yaml_writer
+
+
+SHARDED_AGENCIES = ['DOJ', 'DoD', 'USDA']
+MANIFEST = 'agency.yaml'
+
+
+def agency_path(data_directory, agency_abbr):
+    """ The agency's directory if it is sharded, otherwise its file """
+    directory = os.path.join(data_directory, agency_abbr)
+    if os.path.isdir(directory):
+        return directory
+    return directory + '.yaml'
+
+
+def path_agency(path):
+    """ The agency abbreviation for a path from `agency_paths` """
+    name = os.path.basename(os.path.normpath(path))
+    if name.endswith('.yaml'):
+        return name[:-len('.yaml')]
+    return name
+
+
+def agency_paths(data_directory):
+    """ The file or directory of every agency, sorted by abbreviation """
+    paths = glob(data_directory + os.sep + '*.yaml')
+    paths.extend(os.path.dirname(manifest) for manifest in glob(
+        os.path.join(data_directory, '*', MANIFEST)))
+    return sorted(paths, key=path_agency)
+
+
+def department_filenames(departments):
+    """ A file name for each department, based on its name """
+    filenames, seen = [], set()
+    for department in departments:
+        name = department['name']
+        slug = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')[:60]
+        if not slug or slug + '.yaml' in seen or slug + '.yaml' == MANIFEST:
+            slug += '-' + hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]
+        filename, count = slug + '.yaml', 1
+        while filename in seen:
+            count += 1
+            filename = '%s-%s.yaml' % (slug, count)
+        filenames.append(filename)
+        seen.add(filename)
+    return filenames
+
+
+def load_file(filename):
+    with open(filename) as f:
+        return yaml.load(f)
+
+
+def load_path(path):
+    """ An agency's data, from either layout """
+    if not os.path.isdir(path):
+        return load_file(path)
+    data = load_file(os.path.join(path, MANIFEST))
+    data['departments'] = [load_file(os.path.join(path, filename))
+                           for filename in data.get('departments', [])]
+    return data
+
+
+def write_file(filename, data):
+    """ Write `data` unless the file already holds it, replacing the file in
+    one step. Returns whether it was written. """
+    text = yaml_writer.dump(data)
+    if os.path.isfile(filename):
+        with open(filename) as f:
+            if f.read() == text:
+                return False
+    with open(filename + '.tmp', 'w') as f:
+        f.write(text)
+    os.replace(filename + '.tmp', filename)
+    return True
+
+
+def save_sharded(directory, data):
+    """ Save an agency in the sharded layout, writing only the files that
+    changed. Returns the number of files written. """
+    os.makedirs(directory, exist_ok=True)
+    departments = data.get('departments', [])
+    filenames = department_filenames(departments)
+    written = 0
+    for filename, department in zip(filenames, departments):
+        written += write_file(os.path.join(directory, filename), department)
+    manifest = dict(data, departments=filenames)
+    written += write_file(os.path.join(directory, MANIFEST), manifest)
+    for filename in os.listdir(directory):
+        if filename != MANIFEST and filename not in filenames:
+            os.remove(os.path.join(directory, filename))
+    return written
+
+
+def path_digest(path):
+    """ SHA1 of an agency's file or, if it is sharded, of the names and
+    contents of all of its files """
+    digest = hashlib.sha1()
+    if not os.path.isdir(path):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+        return digest.hexdigest()
+    for name in sorted(os.listdir(path)):
+        digest.update(name.encode('utf-8'))
+        with open(os.path.join(path, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def shard(data_directory, agency_abbr):
+    """ Move an agency from data/ABBR.yaml to data/ABBR/ """
+    filename = os.path.join(data_directory, agency_abbr + '.yaml')
+    save_sharded(os.path.join(data_directory, agency_abbr),
+                 load_file(filename))
+    os.remove(filename)
+
+
+def unshard(data_directory, agency_abbr):
+    """ Move an agency from data/ABBR/ back to data/ABBR.yaml """
+    directory = os.path.join(data_directory, agency_abbr)
+    write_file(directory + '.yaml', load_path(directory))
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    from scraper import DATA_DIRECTORY
+
+    parser = argparse.ArgumentParser(
+        description='Switch agencies between the single file and per '
+                    'department layouts.')
+    parser.add_argument('action', choices=['shard', 'unshard'])
+    parser.add_argument('agencies', nargs='*',
+                        help='default: %s' % ' '.join(SHARDED_AGENCIES))
+    args = parser.parse_args()
+
+    for agency_abbr in args.agencies or SHARDED_AGENCIES:
+        sharded = os.path.isdir(os.path.join(DATA_DIRECTORY, agency_abbr))
+        if args.action == 'shard' and not sharded:
+            shard(DATA_DIRECTORY, agency_abbr)
+        elif args.action == 'unshard' and sharded:
+            unshard(DATA_DIRECTORY, agency_abbr)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+"""
+A binary snapshot of the data/ files for services that only need to look
+up a few offices. The file starts with a header and a fixed width offset
+table sorted by (agency abbreviation, department index), followed by one
+JSON record per agency and per department. Readers mmap the file, binary
+search the offset table and decode only the record they ask for.
+
+Layout:
+    header: magic, format version, number of entries
+    entries: agency (32 bytes, NUL padded), department index (-1 for the
+             agency itself, without its departments), offset, length
+    records: UTF-8 JSON
+"""
+
+import argparse
+from contextlib import contextmanager
+import json
+import mmap
+import os
+import struct
+
+from scraper import DATA_DIRECTORY
+from sharding import agency_paths, load_path, path_agency
+
+
+SNAPSHOT_FILENAME = 'contacts.snapshot'
+MAGIC = b'FOIASNAP'
+SNAPSHOT_VERSION = 1
+HEADER = struct.Struct('<8sHI')
+ENTRY = struct.Struct('<32siQI')
+AGENCY_INDEX = -1
+
+
+def encode(data):
+    return json.dumps(data, sort_keys=True, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
+
+def agency_key(agency_abbr):
+    key = agency_abbr.encode('utf-8')
+    if len(key) > 32:
+        raise ValueError('Agency abbreviation too long: %s' % agency_abbr)
+    return key.ljust(32, b'\0')
+
+
+def build_snapshot(data_directory=DATA_DIRECTORY,
+                   filename=SNAPSHOT_FILENAME):
+    """ Write a snapshot of every file in `data_directory` """
+    records = []
+    for path in agency_paths(data_directory):
+        agency_abbr = path_agency(path)
+        data = load_path(path)
+        departments = data.pop('departments', [])
+        key = agency_key(agency_abbr)
+        records.append((key, AGENCY_INDEX, encode(data)))
+        for index, department in enumerate(departments):
+            records.append((key, index, encode(department)))
+    records.sort(key=lambda r: (r[0], r[1]))
+
+    offset = HEADER.size + ENTRY.size * len(records)
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, SNAPSHOT_VERSION, len(records)))
+        for key, index, body in records:
+            f.write(ENTRY.pack(key, index, offset, len(body)))
+            offset += len(body)
+        for _, _, body in records:
+            f.write(body)
+    return len(records)
+
+
+class Snapshot(object):
+    """ Read-only, memory mapped access to a snapshot file """
+
+    def __init__(self, filename=SNAPSHOT_FILENAME):
+        self.file = open(filename, 'rb')
+        self.map = None
+        if os.fstat(self.file.fileno()).st_size < HEADER.size:
+            self.close()
+            raise ValueError('Not a snapshot: %s' % filename)
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError('Not a version %s snapshot: %s' % (
+                SNAPSHOT_VERSION, filename))
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def entry(self, position):
+        return ENTRY.unpack_from(self.map, HEADER.size + ENTRY.size * position)
+
+    def find(self, agency_abbr, index):
+        """ Binary search the offset table; return the entry position or
+        None """
+        target = (agency_key(agency_abbr), index)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key, mid_index, _, _ = self.entry(mid)
+            if (key, mid_index) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self.entry(lo)[:2] == target:
+            return lo
+        return None
+
+    def span(self, agency_abbr, index):
+        """ (offset, length) of the encoded record, or None """
+        position = self.find(agency_abbr, index)
+        if position is not None:
+            return self.entry(position)[2:]
+
+    @contextmanager
+    def view(self, agency_abbr, index=AGENCY_INDEX):
+        """ A zero-copy view of the encoded record (or None) onto the mapped
+        file, released on exit so the snapshot can be closed """
+        span = self.span(agency_abbr, index)
+        if span is None:
+            yield None
+            return
+        offset, length = span
+        view = memoryview(self.map)[offset:offset + length]
+        try:
+            yield view
+        finally:
+            view.release()
+
+    def raw(self, agency_abbr, index=AGENCY_INDEX):
+        """ A copy of the encoded record, or None, that outlives the
+        snapshot """
+        span = self.span(agency_abbr, index)
+        if span is not None:
+            offset, length = span
+            return self.map[offset:offset + length]
+
+    def record(self, agency_abbr, index=AGENCY_INDEX):
+        with self.view(agency_abbr, index) as view:
+            if view is not None:
+                return json.loads(str(view, 'utf-8'))
+
+    def agency(self, agency_abbr):
+        """ The agency's own fields, without its departments """
+        return self.record(agency_abbr, AGENCY_INDEX)
+
+    def department(self, agency_abbr, index):
+        return self.record(agency_abbr, index)
+
+    def department_count(self, agency_abbr):
+        position = self.find(agency_abbr, AGENCY_INDEX)
+        if position is None:
+            return 0
+        count = 0
+        key = agency_key(agency_abbr)
+        while position + count + 1 < self.count \
+                and self.entry(position + count + 1)[0] == key:
+            count += 1
+        return count
+
+
+if __name__ == "__main__":
+    """
+        python snapshot.py
+        writes contacts.snapshot from data/
+
+        python snapshot.py --agency DOJ --department 3
+        prints a single record from an existing snapshot
+    """
+    parser = argparse.ArgumentParser(
+        description='Build or read a random-access contacts snapshot.')
+    parser.add_argument('--agency')
+    parser.add_argument('--department', type=int, default=AGENCY_INDEX)
+    args = parser.parse_args()
+
+    if args.agency:
+        with Snapshot() as snapshot:
+            print(json.dumps(snapshot.record(args.agency, args.department),
+                             indent=2, sort_keys=True))
+    else:
+        build_snapshot()
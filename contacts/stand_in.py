@@ -0,0 +1,389 @@
+"""
+A local stand-in for the sites the contacts scripts fetch from: foia.gov,
+usa.gov, federalregister.gov and the agencies' own websites, so the
+pipeline can be run, and timed, without touching any of them.
+
+Responses are served from a fixtures directory of recorded responses,
+imported from the vcr cassettes the tests use and from the html/ and
+layering_data/ caches. Anything that wasn't recorded is generated from
+data/: foia.gov contact pages, the USA Contacts API's contacts, Federal
+Register articles carrying each agency's keywords and agency websites
+linking to their reading rooms. Other pages with a recorded page at the
+same path get that page. Every response can be delayed, and a share of
+them fail, to stand in for slow or flaky sites.
+
+The scripts are pointed at it by setting FOIA_STAND_IN (see
+http_client.py), or, in process, with http_client.use_stand_in.
+
+    python stand_in.py import
+    python stand_in.py serve --port 8000 --latency 0.05 --error-rate 0.01
+    FOIA_STAND_IN=http://localhost:8000 python scraper.py
+"""
+
+import argparse
+from glob import glob
+import hashlib
+from html import escape
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import logging
+import os
+import random
+from socketserver import ThreadingMixIn
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlparse, urlunparse
+
+import yaml
+
+from layer_with_csv import XLS_PATH, XLS_URL
+from layer_with_usa_contacts import USA_CONTACTS_API
+from keywords_from_fr import FR_ARTICLES
+import scraper
+from sharding import agency_paths, load_path, path_agency
+
+
+FIXTURES = 'stand_in_fixtures'
+INDEX = 'index.json'
+CASSETTES = 'tests/fixtures/cassettes/*.yaml'
+# Query parameters that only bust caches
+IGNORED_PARAMS = ('Random',)
+AGENCY_PAGE_URL = 'http://www.foia.gov/foia/FoiaMakeRequest'
+STAND_IN_HEADER = 'X-Stand-In-URL'
+
+
+def fixture_key(url):
+    """ `url` without cache busting parameters, with the rest sorted """
+    parts = urlparse(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query)
+                   if k not in IGNORED_PARAMS)
+    return urlunparse(parts._replace(query=urlencode(query), fragment=''))
+
+
+def path_key(url):
+    """ `url` without its query, for falling back on a page recorded with
+    other parameters """
+    return urlunparse(urlparse(url)._replace(query='', fragment=''))
+
+
+class Fixtures(object):
+    """ Recorded responses, stored as one file per body and an index of
+    {key: {'file', 'status', 'content_type'}} """
+
+    def __init__(self, directory=FIXTURES):
+        # Absolute, as the server may be serving from another directory
+        self.directory = os.path.abspath(directory)
+        self.index = {}
+        if os.path.exists(os.path.join(self.directory, INDEX)):
+            with open(os.path.join(self.directory, INDEX)) as f:
+                self.index = json.load(f)
+        self.paths = {}
+        for key in sorted(self.index):
+            self.paths.setdefault(path_key(key), key)
+
+    def add(self, url, body, status=200, content_type='text/html'):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        key = fixture_key(url)
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), 'wb') as f:
+            f.write(body)
+        self.index[key] = {'file': name, 'status': status,
+                           'content_type': content_type}
+        self.paths.setdefault(path_key(key), key)
+
+    def save(self):
+        with open(os.path.join(self.directory, INDEX), 'w') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+
+    def get(self, url, same_path=False):
+        """ (status, content type, body) recorded for `url` or, if
+        `same_path`, for another URL with its path; else None """
+        key = fixture_key(url)
+        if key not in self.index and same_path:
+            key = self.paths.get(path_key(url))
+        if key not in self.index:
+            return None
+        entry = self.index[key]
+        with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+            return entry['status'], entry['content_type'], f.read()
+
+
+def import_cassette(fixtures, filename):
+    """ Add the responses recorded in a vcr cassette; other yaml files are
+    ignored """
+    with open(filename) as f:
+        cassette = yaml.load(f)
+    for interaction in cassette.get('interactions', []):
+        response = interaction['response']
+        content_type = response['headers'].get('Content-Type', ['text/html'])
+        fixtures.add(interaction['request']['uri'],
+                     response['body']['string'], response['status']['code'],
+                     content_type[0])
+
+
+def import_caches(fixtures, html_directory='html', xls_path=XLS_PATH):
+    """ Add the agency pages in the scraper's cache and the XLS """
+    for filename in glob(os.path.join(html_directory, '*.html')):
+        abb = os.path.splitext(os.path.basename(filename))[0]
+        if abb in scraper.AGENCIES:
+            with open(filename, 'rb') as f:
+                fixtures.add(scraper.agency_url(abb), f.read())
+    if os.path.exists(xls_path):
+        with open(xls_path, 'rb') as f:
+            fixtures.add(XLS_URL, f.read(), content_type='application/'
+                         'vnd.ms-excel')
+
+
+def department_html(index, department):
+    """ A department's div, as foia.gov lays it out for the scraper """
+    lines = ['<p><strong>FOIA Contact:</strong></p>']
+    address = department.get('address') or {}
+    address_lines = address.get('address_lines', []) + [
+        address.get('street', department['name']),
+        '%s, %s %s' % (address.get('city', 'Washington'),
+                       address.get('state', 'DC'),
+                       address.get('zip', '20500'))]
+    lines.extend('<p>%s</p>' % escape(line) for line in address_lines)
+    # The scraper needs a phone or fax line to find the end of the address
+    lines.append('<p>%s (Telephone)</p>' % department.get(
+        'phone', '000-000-0000'))
+    if department.get('fax'):
+        lines.append('<p>%s (Fax)</p>' % department['fax'])
+    if department.get('emails'):
+        lines.append('<p><a href="mailto:%s">%s</a> (Request via Email)</p>'
+                     % (escape(';'.join(department['emails'])),
+                        escape(department['emails'][0])))
+    for field, label in [('service_center', 'FOIA Requester Service Center'),
+                         ('public_liaison', 'FOIA Public Liaison')]:
+        contact = department.get(field) or {}
+        if contact.get('phone'):
+            name = '%s, ' % contact['name'] if contact.get('name') else ''
+            lines.append('<p><strong>%s:</strong> %sPhone: %s</p>' % (
+                label, escape(name), ', '.join(contact['phone'])))
+    for field, label in [('website', 'Website'),
+                         ('request_form', 'Request Form')]:
+        if department.get(field):
+            lines.append('<p><strong>%s: </strong><a href="%s">%s</a></p>'
+                         % (label, escape(department[field]),
+                            escape(department[field])))
+    return '<div id="%s"><blockquote>%s</blockquote></div>' % (
+        index, '\n'.join(lines))
+
+
+def agency_page(agency):
+    """ An agency's contact page, as served by foia.gov """
+    departments = agency['departments']
+    options = ['<option value="0">Select an Office</option>'] + [
+        '<option value="%s">%s</option>' % (i, escape(d['name']))
+        for i, d in enumerate(departments, 1)]
+    divs = [department_html(i, d) for i, d in enumerate(departments, 1)]
+    return ('<html><body><h1>%s</h1>\n<select id="ComponentsList">%s'
+            '</select>\n%s\n<h2>About the agency</h2>%s</body></html>' % (
+                escape(agency['name']), '\n'.join(options), '\n'.join(divs),
+                escape(agency.get('description', ''))))
+
+
+def records(agency):
+    return [agency] + agency['departments']
+
+
+class Site(object):
+    """ The pages generated from a data directory """
+
+    def __init__(self, data_directory=scraper.DATA_DIRECTORY):
+        self.agencies = dict((path_agency(path), load_path(path))
+                             for path in agency_paths(data_directory))
+        self.reading_rooms = {}
+        for agency in self.agencies.values():
+            for record in records(agency):
+                host = urlparse(record.get('website', '')).netloc
+                if host:
+                    self.reading_rooms.setdefault(host, []).extend(
+                        record.get('reading_rooms', []))
+
+    def contacts(self):
+        """ The USA Contacts API's response """
+        contacts = []
+        for agency in self.agencies.values():
+            for record in records(agency):
+                if record.get('usa_id'):
+                    contacts.append({
+                        'Id': record['usa_id'], 'Name': record['name'],
+                        'Description': record.get('description', ''),
+                        'Language': 'en'})
+        return {'Contact': contacts}
+
+    def articles(self, query):
+        """ A page of Federal Register articles; each agency with keywords
+        gets an article in one month of the year """
+        month = int(query.get('conditions[publication_date][gte]',
+                              '2000-01-01').split('-')[1])
+        results = []
+        for agency in self.agencies.values():
+            for record in records(agency):
+                name = record['name']
+                if record.get('keywords') and \
+                        int(hashlib.sha1(name.encode('utf-8')).hexdigest(),
+                            16) % 12 == month - 1:
+                    results.append({'agency_names': [name],
+                                    'topics': record['keywords']})
+        return {'count': len(results), 'results': results}
+
+    def website(self, host):
+        """ An agency home page, linking to its reading rooms """
+        links = ['<a href="/">Home</a>', '<a href="/contact">Contact Us</a>']
+        for text, url in self.reading_rooms.get(host, []):
+            links.append('<a href="%s">%s</a>' % (escape(url), escape(text)))
+        return '<html><body>%s</body></html>' % '\n'.join(links)
+
+
+def respond(fixtures, site, url):
+    """ (status, content type, body) for a request for `url` """
+    recorded = fixtures.get(url)
+    if recorded:
+        return recorded
+    parts = urlparse(url)
+    query = dict(parse_qsl(parts.query))
+    base = path_key(url)
+    if base == AGENCY_PAGE_URL and query.get('agency') in site.agencies:
+        return 200, 'text/html', agency_page(
+            site.agencies[query['agency']]).encode('utf-8')
+    if base == USA_CONTACTS_API:
+        return 200, 'application/json', json.dumps(
+            site.contacts()).encode('utf-8')
+    if base == FR_ARTICLES:
+        return 200, 'application/json', json.dumps(
+            site.articles(query)).encode('utf-8')
+    recorded = fixtures.get(url, same_path=True)
+    if recorded:
+        return recorded
+    if parts.netloc in site.reading_rooms and \
+            not parts.path.endswith('.xml'):
+        return 200, 'text/html', site.website(parts.netloc).encode('utf-8')
+    return 404, 'text/html', b'Not Found'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    def url(self):
+        """ The URL asked for, as passed by http_client, or this server's
+        own for a plain request """
+        return self.headers.get(STAND_IN_HEADER) or \
+            'http://%s%s' % (self.headers.get('Host', ''), self.path)
+
+    def send(self, body_wanted):
+        server = self.server
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail():
+            status, content_type, body = 503, 'text/plain', b'Unavailable'
+        else:
+            status, content_type, body = respond(
+                server.fixtures, server.site, self.url())
+        # Counted before it is sent, so a client that has the response
+        # also sees it in the stats
+        server.count(len(body) if body_wanted else 0, status == 503)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body_wanted:
+            self.wfile.write(body)
+
+    def do_GET(self):
+        self.send(True)
+
+    def do_HEAD(self):
+        self.send(False)
+
+    def log_message(self, format, *args):
+        logging.debug(format, *args)
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    """ The stand-in server: every response is delayed by `latency` seconds
+    and `error_rate` of them are 503s. It counts the requests it has served,
+    the bytes of their bodies and the errors it made up. """
+
+    daemon_threads = True
+
+    def __init__(self, address, fixtures, site, latency=0, error_rate=0,
+                 seed=None):
+        HTTPServer.__init__(self, address, StandInHandler)
+        self.fixtures = fixtures
+        self.site = site
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.totals = {'requests': 0, 'bytes': 0, 'errors': 0}
+
+    @property
+    def address(self):
+        return 'http://%s:%s' % self.server_address[:2]
+
+    def fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def count(self, size, error):
+        with self.lock:
+            self.totals['requests'] += 1
+            self.totals['bytes'] += size
+            self.totals['errors'] += int(error)
+
+    def stats(self):
+        with self.lock:
+            return dict(self.totals)
+
+    def start(self):
+        """ Serve from a background thread """
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+def import_fixtures(directory=FIXTURES, cassettes=CASSETTES):
+    fixtures = Fixtures(directory)
+    for filename in sorted(glob(cassettes)):
+        import_cassette(fixtures, filename)
+    import_caches(fixtures)
+    fixtures.save()
+    return fixtures
+
+
+if __name__ == "__main__":
+    """
+        python stand_in.py import
+        records the cassettes and cached pages as fixtures.
+
+        python stand_in.py serve [--port 8000] [--latency 0.05]
+            [--error-rate 0.01]
+        serves them, and pages generated from data/, until interrupted.
+    """
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description='Stand in for the sites the scripts fetch from.')
+    parser.add_argument('command', choices=['import', 'serve'])
+    parser.add_argument('--fixtures', default=FIXTURES)
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds to delay each response by')
+    parser.add_argument('--error-rate', type=float, default=0,
+                        help='share of requests to fail with a 503')
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        fixtures = import_fixtures(args.fixtures)
+        print('%s fixtures in %s' % (len(fixtures.index), args.fixtures))
+    else:
+        server = StandIn(('localhost', args.port), Fixtures(args.fixtures),
+                         Site(), args.latency, args.error_rate)
+        print('Serving on %s' % server.address)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print('%(requests)s requests, %(bytes)s bytes' % server.stats())
@@ -0,0 +1,77 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import autocomplete
+import scraper
+
+
+class AutocompleteTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        scraper.save_agency_data('U.S. DOL', {
+            'name': 'Department of Labor',
+            'usa_id': '1',
+            'departments': [
+                {'name': 'Job Corps', 'usa_id': '2'},
+                {'name': 'Office of the Solicitor', 'top_level': True},
+            ]}, data_directory=self.data_dir)
+        scraper.save_agency_data('DOJ', {
+            'name': 'Department of Justice',
+            'abbreviation': 'DOJ',
+            'departments': [{'name': 'Office of Justice Programs'}]
+        }, data_directory=self.data_dir)
+        synonyms = {'2': ['Youth Job Training']}
+        self.index = autocomplete.build_index(
+            autocomplete.collect_targets(self.data_dir, synonyms))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def names(self, prefix, k=10):
+        return [t['name'] for t in
+                autocomplete.lookup(self.index, prefix, k)]
+
+    def test_keys_for(self):
+        self.assertEqual(
+            ['us dol', 'dol'], autocomplete.keys_for('U.S. DOL'))
+
+    def test_lookup_ranking(self):
+        """ Agencies outrank top level offices, which outrank other
+        offices """
+        self.assertEqual(
+            ['Department of Justice', 'Department of Labor',
+             'Office of the Solicitor', 'Office of Justice Programs'],
+            self.names('o'))
+        self.assertEqual(
+            ['Department of Justice', 'Department of Labor'],
+            self.names('dep', k=2))
+        self.assertEqual(
+            ['Department of Justice', 'Office of Justice Programs'],
+            self.names('justice'))
+
+    def test_lookup_abbreviations_and_synonyms(self):
+        self.assertEqual(['Department of Labor'], self.names('u.s. dol'))
+        self.assertEqual(['Department of Justice'], self.names('doj'))
+        self.assertEqual(['Job Corps'], self.names('youth job'))
+        self.assertEqual([], self.names('nasa'))
+        self.assertEqual([], self.names(' '))
+
+    def test_short_prefixes_match_full_scan(self):
+        """ Precomputed results must agree with scanning the key array """
+        for prefix, ranks in self.index['short'].items():
+            scanned = sorted(set(
+                r for key, r in zip(self.index['keys'], self.index['ranks'])
+                if key.startswith(prefix)))
+            self.assertEqual(scanned[:autocomplete.MAX_RESULTS], ranks)
+
+    def test_save_and_load_index(self):
+        filename = os.path.join(self.tmp, 'autocomplete.json')
+        autocomplete.save_index(self.index, filename)
+        self.assertEqual(
+            json.loads(json.dumps(self.index)),
+            autocomplete.load_index(filename))
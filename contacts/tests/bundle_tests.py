@@ -0,0 +1,59 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import bundle
+import scraper
+
+
+AGENCIES = {
+    'TB': {'name': 'Second Agency', 'departments': []},
+    'TA': {'name': 'Test Agency – Émigré', 'top_level': False,
+           'departments': [{'name': 'Office', 'emails': ['a@ta.gov']}]},
+}
+
+
+class BundleTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'contacts.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        data_dir = os.path.join(self.tmp, 'data')
+        for abbr, data in AGENCIES.items():
+            scraper.save_agency_data(abbr, data, data_directory=data_dir)
+        agencies = bundle.load_agencies(data_dir)
+        self.assertEqual(AGENCIES, agencies)
+
+        manifest = bundle.export_bundle(agencies, self.filename)
+        self.assertEqual(2, manifest['count'])
+        self.assertEqual(['TA', 'TB'], [a[0] for a in manifest['agencies']])
+        self.assertEqual(manifest, bundle.read_manifest(self.filename))
+        self.assertEqual(AGENCIES, bundle.load_bundle(self.filename))
+
+    def test_export_is_deterministic(self):
+        bundle.export_bundle(AGENCIES, self.filename)
+        with open(self.filename, 'rb') as f:
+            first = f.read()
+        bundle.export_bundle(dict(reversed(list(AGENCIES.items()))),
+                             self.filename)
+        with open(self.filename, 'rb') as f:
+            self.assertEqual(first, f.read())
+
+    def test_load_bundle_checksums(self):
+        bundle.export_bundle(AGENCIES, self.filename)
+        with gzip.open(self.filename, 'rb') as f:
+            content = f.read()
+        with gzip.open(self.filename, 'wb') as f:
+            f.write(content.replace(b'a@ta.gov', b'b@ta.gov'))
+        self.assertRaises(ValueError, bundle.load_bundle, self.filename)
+        self.assertEqual(
+            'b@ta.gov',
+            bundle.load_bundle(self.filename, verify=False)
+            ['TA']['departments'][0]['emails'][0])
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import changeset
+import scraper
+
+
+OLD = {
+    'name': 'Test Agency',
+    'keywords': ['a'],
+    'departments': [
+        {'name': 'One', 'address': {'street': '1 Main St', 'zip': '20001'}},
+        {'name': 'Two', 'phone': '202-555-1111'},
+        {'name': 'Three'},
+    ]
+}
+
+NEW = {
+    'name': 'Test Agency',
+    'keywords': ['a', 'b'],
+    'departments': [
+        {'name': 'One', 'address': {'street': '1 Main St', 'zip': '20002'}},
+        {'name': 'Three', 'usa_id': '3'},
+        {'name': 'Four'},
+    ]
+}
+
+
+class ChangesetTests(TestCase):
+
+    def test_diff_values(self):
+        self.assertEqual(
+            [(['b', 'c'], 1, 2), (['d'], None, [1])],
+            list(changeset.diff_values(
+                {'a': 0, 'b': {'c': 1}}, {'a': 0, 'b': {'c': 2}, 'd': [1]})))
+        self.assertEqual([], list(changeset.diff_values({'a': 1}, {'a': 1})))
+
+    def test_agency_changes(self):
+        changes = changeset.agency_changes('TA', OLD, NEW)
+        self.assertEqual([
+            {'agency': 'TA', 'department': None, 'path': ['keywords'],
+             'old': ['a'], 'new': ['a', 'b']},
+            {'agency': 'TA', 'department': 'One', 'path': ['address', 'zip'],
+             'old': '20001', 'new': '20002'},
+            {'agency': 'TA', 'department': 'Three', 'path': ['usa_id'],
+             'old': None, 'new': '3'},
+            {'agency': 'TA', 'department': 'Four', 'path': [],
+             'old': None, 'new': {'name': 'Four'}},
+            {'agency': 'TA', 'department': 'Two', 'path': [],
+             'old': {'name': 'Two', 'phone': '202-555-1111'}, 'new': None},
+        ], changes)
+        self.assertEqual([], changeset.agency_changes('TA', OLD, OLD))
+
+    def test_apply_changes(self):
+        """ Applying a changeset to the old data gives the new data """
+        changes = changeset.agency_changes('TA', OLD, NEW)
+        self.assertEqual(NEW, changeset.apply_changes(OLD, changes))
+        self.assertEqual('20001', OLD['departments'][0]['address']['zip'])
+
+        reordered = dict(OLD, departments=list(reversed(OLD['departments'])))
+        changes = changeset.agency_changes('TA', OLD, reordered)
+        self.assertEqual([['One', 'Two', 'Three'], ['Three', 'Two', 'One']],
+                         [changes[0]['old'], changes[0]['new']])
+        self.assertEqual(reordered, changeset.apply_changes(OLD, changes))
+
+        changes = changeset.agency_changes('TA', None, NEW)
+        self.assertEqual(NEW, changeset.apply_changes(None, changes))
+
+    def test_save_agency_data_writes_changeset(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmp, 'changeset.jsonl')
+            data_dir = os.path.join(tmp, 'data')
+            scraper.save_agency_data('TA', OLD, data_dir)
+            scraper.save_agency_data('TA', OLD, data_dir,
+                                     changeset_file=filename)
+            self.assertFalse(os.path.exists(filename))
+
+            scraper.save_agency_data('TA', NEW, data_dir,
+                                     changeset_file=filename)
+            self.assertEqual(changeset.agency_changes('TA', OLD, NEW),
+                             changeset.read_changeset(filename))
+        finally:
+            shutil.rmtree(tmp)
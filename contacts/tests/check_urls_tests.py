@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from mock import Mock, patch
+
+import check_urls
+import http_client
+from scraper import save_agency_data
+
+
+AGENCY = {
+    'name': 'Test Agency',
+    'website': 'http://ta.gov/',
+    'departments': [
+        {'name': 'One', 'website': 'http://ta.gov/',
+         'request_form': 'http://ta.gov/form'},
+        {'name': 'Two', 'website': 'http://old.ta.gov/'},
+    ]
+}
+
+
+def response(url, status_code, final_url=None):
+    r = Mock()
+    r.status_code = status_code
+    r.url = final_url or url
+    return r
+
+
+def head(url, **kwargs):
+    return {
+        'http://ta.gov/': response(url, 200),
+        'http://ta.gov/form': response(url, 405),
+        'http://old.ta.gov/': response(url, 200, 'http://new.ta.gov/'),
+    }[url]
+
+
+class CheckUrlsTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        save_agency_data('TA', AGENCY, self.tmp)
+        self.conn = check_urls.connect(os.path.join(self.tmp, 'h.sqlite'))
+        for name, side_effect in [('head', head), ('get', None)]:
+            patcher = patch('check_urls.http_client.' + name,
+                            side_effect=side_effect)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.get.return_value = response('http://ta.gov/form', 200)
+        patcher = patch('check_urls.http_client.BREAKER')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def check(self, later):
+        """ Run as if `later` seconds from now """
+        return check_urls.check_all(self.conn, self.tmp,
+                                    now=time.time() + later)
+
+    def test_check_all(self):
+        report = self.check(0)
+        self.assertEqual(3, self.head.call_count)
+        self.get.assert_called_once_with('http://ta.gov/form', verify=False,
+                                         stream=True,
+                                         breaker=http_client.BREAKER)
+        self.assertEqual((3, 3, 3, 0), (
+            report['urls'], report['checked'], report['healthy'],
+            report['unchecked']))
+        self.assertEqual(
+            [('TA', 'One', 'website', 200, None),
+             ('TA', 'One', 'request_form', 200, None),
+             ('TA', 'Two', 'website', 200, 'http://new.ta.gov/'),
+             ('TA', None, 'website', 200, None)],
+            [(r['agency'], r['department'], r['field'], r['status'],
+              r['redirect']) for r in report['records']])
+
+        # Nothing is due until the TTL has passed
+        self.head.reset_mock()
+        self.assertEqual(0, self.check(check_urls.DAY)['checked'])
+        self.assertEqual(0, self.head.call_count)
+        self.assertEqual(3, self.check(check_urls.HEALTHY_TTL)['checked'])
+
+    def test_due(self):
+        self.check(0)
+        self.conn.execute("UPDATE url_health SET status = 500 "
+                          "WHERE url = 'http://ta.gov/'")
+
+        # A changed URL, and failing URLs after a day, are checked again
+        data = dict(AGENCY, website='http://www.ta.gov/')
+        save_agency_data('TA', data, self.tmp)
+        self.head.side_effect = lambda url, **kwargs: response(url, 200)
+        self.head.reset_mock()
+        self.check(check_urls.DAY)
+        self.assertEqual(['http://ta.gov/', 'http://www.ta.gov/'],
+                         sorted(c[0][0] for c in self.head.call_args_list))
+
+    def test_errors(self):
+        self.head.side_effect = http_client.HostSkipped('skipped')
+        report = self.check(0)
+        self.assertEqual((3, 0, 3), (report['checked'], report['healthy'],
+                                     report['unchecked']))
+
+        # Errors from HEAD are tried again with a GET
+        self.head.side_effect = check_urls.requests.exceptions.Timeout('t')
+        report = self.check(0)
+        self.assertEqual((3, 0), (report['healthy'], report['unchecked']))
+        self.assertEqual(3, self.get.call_count)
+
+        self.get.side_effect = check_urls.requests.exceptions.Timeout('t')
+        report = self.check(check_urls.HEALTHY_TTL)
+        self.assertEqual((0, 0), (report['healthy'], report['unchecked']))
+        self.assertEqual('Timeout: t', report['records'][0]['error'])
+
+    def test_url_records(self):
+        save_agency_data('TA', dict(AGENCY, website=None), self.tmp)
+        self.assertEqual(
+            ['http://ta.gov/', 'http://ta.gov/form', 'http://old.ta.gov/'],
+            [url for agency, department, field, url
+             in check_urls.url_records(self.tmp)])
@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import contacts_db
+import scraper
+
+
+AGENCY = {
+    'abbreviation': 'TA',
+    'name': 'Test Agency',
+    'keywords': ['Spaceships'],
+    'departments': [
+        {
+            'name': 'Office One',
+            'top_level': True,
+            'address': {'street': '1 Main St', 'city': 'Arlington',
+                        'state': 'VA', 'zip': '22201'},
+            'emails': ['one@test.gov'],
+            'phone': '202-555-1111',
+            'public_liaison': {'name': 'Jane', 'phone': ['202-555-2222']},
+            'reading_rooms': [['Reading Room', 'http://test.gov/rr']],
+            'request_time_stats': {'2013': {'simple_median_days': '3'}},
+        },
+        {
+            'name': 'Office Two',
+            'top_level': False,
+            'request_form': 'http://test.gov/form',
+            'address': {'street': '2 Main St', 'city': 'Washington',
+                        'state': 'DC', 'zip': '20001'},
+        },
+    ]
+}
+
+
+class ContactsDBTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        self.db = os.path.join(self.tmp, 'contacts.sqlite')
+        scraper.save_agency_data('TA', AGENCY, data_directory=self.data_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_build_db_queries(self):
+        """ Indexed queries should answer without reading the YAML """
+        contacts_db.build_db(self.data_dir, self.db)
+        conn = contacts_db.connect(self.db)
+
+        missing = contacts_db.offices_missing(conn, 'request_form')
+        self.assertEqual([('TA', 'Office One')], [tuple(r) for r in missing])
+        in_va = contacts_db.offices_in_state(conn, 'VA')
+        self.assertEqual([('TA', 'Office One')], [tuple(r) for r in in_va])
+        self.assertRaises(
+            ValueError, contacts_db.offices_missing, conn, 'departments')
+
+        phones = conn.execute(
+            'SELECT kind, number FROM phones ORDER BY number').fetchall()
+        self.assertEqual(
+            [('phone', '202-555-1111'), ('public_liaison', '202-555-2222')],
+            [tuple(r) for r in phones])
+        stats = conn.execute('SELECT year, stat, value FROM time_stats')
+        self.assertEqual(
+            [('2013', 'simple_median_days', '3')],
+            [tuple(r) for r in stats])
+        self.assertEqual(AGENCY, contacts_db.load_agency(conn, 'TA'))
+        conn.close()
+
+    def test_build_db_incremental(self):
+        """ Unchanged files are skipped, changed and removed files are
+        reflected """
+        self.assertEqual(['TA'], contacts_db.build_db(self.data_dir, self.db))
+        self.assertEqual([], contacts_db.build_db(self.data_dir, self.db))
+
+        changed = dict(AGENCY, departments=AGENCY['departments'][:1])
+        scraper.save_agency_data('TA', changed, data_directory=self.data_dir)
+        self.assertEqual(['TA'], contacts_db.build_db(self.data_dir, self.db))
+        conn = contacts_db.connect(self.db)
+        count = conn.execute('SELECT COUNT(*) FROM departments').fetchone()[0]
+        self.assertEqual(1, count)
+        conn.close()
+
+        os.remove(scraper.agency_yaml_filename(self.data_dir, 'TA'))
+        contacts_db.build_db(self.data_dir, self.db)
+        conn = contacts_db.connect(self.db)
+        self.assertEqual(None, contacts_db.load_agency(conn, 'TA'))
+        count = conn.execute('SELECT COUNT(*) FROM emails').fetchone()[0]
+        self.assertEqual(0, count)
+        conn.close()
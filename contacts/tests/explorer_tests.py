@@ -0,0 +1,48 @@
+import io
+from unittest import TestCase
+
+import explorer
+
+
+AGENCIES = [
+    ('TA', {'departments': [
+        {'name': 'One', 'request_form': 'http://ta.gov/form'},
+        {'name': 'Two', 'request_form': ''},
+    ]}),
+    ('TB', {'departments': [
+        {'name': 'Three', 'website': 'http://tb.gov'},
+    ]}),
+]
+
+
+class ExplorerTests(TestCase):
+
+    def test_field_coverage(self):
+        """ All fields should be counted per agency and in total """
+        rows = explorer.field_coverage(AGENCIES)
+        by_key = dict(((r['agency'], r['field']), r) for r in rows)
+        self.assertEqual(
+            {'agency': 'TA', 'field': 'request_form', 'present': 1,
+             'missing': 1, 'total': 2},
+            by_key[('TA', 'request_form')])
+        self.assertEqual(0, by_key[('TB', 'request_form')]['present'])
+        self.assertEqual(
+            {'agency': 'ALL', 'field': 'name', 'present': 3, 'missing': 0,
+             'total': 3},
+            by_key[('ALL', 'name')])
+        self.assertEqual(1, by_key[('ALL', 'website')]['present'])
+
+    def test_field_coverage_filters(self):
+        rows = explorer.field_coverage(
+            AGENCIES, agency_filter=['TB'], field_filter=['request_form'])
+        self.assertEqual(
+            [('TB', 'request_form', 0), ('ALL', 'request_form', 0)],
+            [(r['agency'], r['field'], r['present']) for r in rows])
+
+    def test_write_csv(self):
+        out = io.StringIO()
+        explorer.write_csv(explorer.field_coverage(
+            AGENCIES, field_filter=['website']), out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual('agency,field,present,missing,total', lines[0])
+        self.assertEqual('ALL,website,1,2,3', lines[-1])
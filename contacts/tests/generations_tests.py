@@ -0,0 +1,86 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+import yaml
+
+import generations
+from scraper import save_agency_data
+
+
+def write_agency_command(abbr, name):
+    """ A stage that saves an agency into the generation being built """
+    script = ("import scraper; scraper.save_agency_data(%r, {'name': %r})"
+              % (abbr, name))
+    return '"%s" -c "%s"' % (sys.executable, script)
+
+
+class GenerationsTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        self.generations_dir = os.path.join(self.tmp, 'generations')
+        self.link = os.path.join(self.tmp, 'current')
+        save_agency_data('TA', {'name': 'A'}, self.data_dir)
+        save_agency_data('TB', {'name': 'B'}, self.data_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def build(self, commands):
+        return generations.build(commands, self.generations_dir, self.link,
+                                 source=None if os.path.exists(self.link)
+                                 else self.data_dir)
+
+    def load(self, abbr):
+        with open(os.path.join(self.link, abbr + '.yaml')) as f:
+            return yaml.load(f)
+
+    def test_new_generation_links_files(self):
+        path = generations.new_generation(self.data_dir, self.generations_dir)
+        self.assertEqual(['0001'], generations.generation_names(
+            self.generations_dir))
+        self.assertTrue(os.path.samefile(
+            os.path.join(self.data_dir, 'TA.yaml'),
+            os.path.join(path, 'TA.yaml')))
+
+        # Saving into the new generation leaves the old file alone
+        save_agency_data('TA', {'name': 'New A'}, path)
+        with open(os.path.join(self.data_dir, 'TA.yaml')) as f:
+            self.assertEqual({'name': 'A'}, yaml.load(f))
+
+    def test_build_and_rollback(self):
+        first = self.build([write_agency_command('TA', 'A1')])
+        self.assertEqual({'name': 'A1'}, self.load('TA'))
+        second = self.build([write_agency_command('TB', 'B2')])
+        self.assertEqual('0002', generations.current_generation(self.link))
+        self.assertEqual({'name': 'A1'}, self.load('TA'))
+        self.assertEqual({'name': 'B2'}, self.load('TB'))
+        self.assertTrue(os.path.samefile(os.path.join(first, 'TA.yaml'),
+                                         os.path.join(second, 'TA.yaml')))
+
+        generations.rollback(self.generations_dir, self.link)
+        self.assertEqual({'name': 'B'}, self.load('TB'))
+        with self.assertRaises(ValueError):
+            generations.rollback(self.generations_dir, self.link)
+
+    def test_failed_build_is_not_published(self):
+        self.build([write_agency_command('TA', 'A1')])
+        with self.assertRaises(subprocess.CalledProcessError):
+            self.build([write_agency_command('TA', 'A2'), 'exit 1'])
+        self.assertEqual({'name': 'A1'}, self.load('TA'))
+        self.assertEqual(['0001'], generations.generation_names(
+            self.generations_dir))
+
+    def test_prune(self):
+        for name in ['A1', 'A2', 'A3']:
+            self.build([write_agency_command('TA', name)])
+        generations.rollback(self.generations_dir, self.link)
+        self.assertEqual(['0001'], generations.prune(
+            1, self.generations_dir, self.link))
+        self.assertEqual(['0002', '0003'], generations.generation_names(
+            self.generations_dir))
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import history
+from scraper import save_agency_data
+import sharding
+
+
+def agency(phone, zip_code='20001'):
+    return {
+        'name': 'Test Agency',
+        'phone': phone,
+        'departments': [
+            {'name': 'One', 'address': {'street': '1 Main St',
+                                        'zip': zip_code}},
+        ]
+    }
+
+
+class HistoryTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        self.conn = history.connect(os.path.join(self.tmp, 'history.sqlite'))
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def record(self, label):
+        return history.record_build(self.conn, self.data_dir, label=label)
+
+    def test_reconstruct(self):
+        versions = {}
+        for number in range(25):
+            data = agency('202-555-%04d' % (number // 2))
+            save_agency_data('TA', data, self.data_dir)
+            versions[self.record(str(number))] = data
+        save_agency_data('TB', {'name': 'B'}, self.data_dir)
+        last = self.record('with TB')
+
+        for build, data in versions.items():
+            self.assertEqual(data, history.agency_at(self.conn, 'TA', build))
+        self.assertIsNone(history.agency_at(self.conn, 'TB', last - 1))
+        self.assertEqual({'TA': versions[last - 1], 'TB': {'name': 'B'}},
+                         history.dataset_at(self.conn))
+
+        # Only changed builds store changes, with keyframes to bound the
+        # work of rebuilding an old version
+        changed = self.conn.execute(
+            'SELECT COUNT(DISTINCT build) FROM changes').fetchone()[0]
+        self.assertEqual(12, changed)
+        self.assertEqual([1, 21], [row[0] for row in self.conn.execute(
+            "SELECT build FROM keyframes WHERE agency = 'TA' ORDER BY build")])
+
+    def test_field_history(self):
+        save_agency_data('TA', agency('202-555-0000'), self.data_dir)
+        self.record('first')
+        save_agency_data('TA', agency('202-555-0001'), self.data_dir)
+        self.record('new phone')
+        save_agency_data('TA', agency('202-555-0001', '20002'), self.data_dir)
+        self.record('new zip')
+        data = agency('202-555-0001', '20002')
+        data['departments'] = []
+        save_agency_data('TA', data, self.data_dir)
+        self.record('no departments')
+
+        self.assertEqual(
+            [('new phone', '202-555-0000', '202-555-0001')],
+            [(row['label'], old, new) for row, old, new in
+             history.field_history(self.conn, 'TA', None, ['phone'])])
+        self.assertEqual(
+            [('new zip', '20001', '20002'), ('no departments', '20002', None)],
+            [(row['label'], old, new) for row, old, new in
+             history.field_history(self.conn, 'TA', 'One',
+                                   ['address', 'zip'])])
+        self.assertEqual(
+            ['new zip', 'no departments'],
+            [row['label'] for row, old, new in
+             history.field_history(self.conn, 'TA', 'One', ['address'])])
+
+    def test_export(self):
+        save_agency_data('TA', agency('202-555-0000'), self.data_dir)
+        first = self.record('first')
+        save_agency_data('TA', agency('202-555-0001'), self.data_dir)
+        self.record('second')
+
+        export_dir = os.path.join(self.tmp, 'export')
+        history.export(self.conn, first, export_dir)
+        self.assertEqual(agency('202-555-0000'), sharding.load_path(
+            os.path.join(export_dir, 'TA.yaml')))
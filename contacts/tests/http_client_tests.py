@@ -0,0 +1,174 @@
+import tempfile
+from unittest import TestCase
+
+from mock import Mock, patch
+import requests
+
+import http_client
+
+
+def response(status_code, headers=None):
+    r = Mock()
+    r.status_code = status_code
+    r.headers = headers or {}
+    return r
+
+
+class HttpClientTests(TestCase):
+
+    def setUp(self):
+        self.session = Mock()
+        # A clock that only moves when the client sleeps
+        self.now = 0
+
+        def sleep(seconds):
+            self.now += seconds
+        patcher = patch('http_client.time.sleep', side_effect=sleep)
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch('http_client.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = http_client.CircuitBreaker()
+        patcher = patch('http_client.BREAKER', self.breaker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_defaults(self):
+        self.session.request.return_value = response(200)
+        http_client.get('http://a.gov/', session=self.session, verify=False)
+        self.session.request.assert_called_once_with(
+            'GET', 'http://a.gov/', verify=False,
+            timeout=(http_client.CONNECT_TIMEOUT, http_client.READ_TIMEOUT))
+        self.assertEqual(
+            'gzip, deflate',
+            http_client.shared_session().headers['Accept-Encoding'])
+        self.assertIs(http_client.shared_session(),
+                      http_client.shared_session())
+
+    def test_retries_with_backoff(self):
+        self.session.request.side_effect = [
+            response(503), requests.exceptions.ConnectionError(),
+            response(200)]
+        r = http_client.get('http://a.gov/', session=self.session)
+        self.assertEqual(200, r.status_code)
+        self.assertEqual(3, self.session.request.call_count)
+        first, second = [c[0][0] for c in self.sleep.call_args_list]
+        self.assertTrue(0 <= first <= http_client.BACKOFF)
+        self.assertTrue(0 <= second <= 2 * http_client.BACKOFF)
+
+    def test_gives_up(self):
+        self.session.request.return_value = response(500)
+        r = http_client.get('http://a.gov/', session=self.session)
+        self.assertEqual(500, r.status_code)
+        self.assertEqual(http_client.RETRIES + 1,
+                         self.session.request.call_count)
+
+        self.session.request.side_effect = requests.exceptions.Timeout()
+        with self.assertRaises(requests.exceptions.Timeout):
+            http_client.get('http://b.gov/', session=self.session)
+
+        # Neither errors that won't go away nor other statuses are retried
+        self.session.request.reset_mock()
+        self.session.request.side_effect = requests.exceptions.SSLError()
+        with self.assertRaises(requests.exceptions.SSLError):
+            http_client.get('http://c.gov/', session=self.session)
+        self.session.request.side_effect = None
+        self.session.request.return_value = response(404)
+        http_client.get('http://d.gov/', session=self.session)
+        self.assertEqual(2, self.session.request.call_count)
+
+    def test_deadline(self):
+        self.session.request.return_value = response(
+            429, {'Retry-After': '60'})
+        r = http_client.get('http://a.gov/', session=self.session,
+                            deadline=100)
+        self.assertEqual(429, r.status_code)
+        self.assertEqual([((60,),)], self.sleep.call_args_list)
+
+    def test_client(self):
+        self.session.request.return_value = response(200)
+        client = http_client.Client(self.session)
+        client.head('http://a.gov/')
+        self.assertEqual('HEAD', self.session.request.call_args[0][0])
+        self.assertTrue(self.session.request.call_args[1]['allow_redirects'])
+
+    def test_circuit_breaker(self):
+        self.session.request.side_effect = requests.exceptions.ConnectionError
+        # The retries of one request are one failure
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            http_client.get('http://dead.gov/', session=self.session,
+                            breaker=self.breaker)
+        self.assertEqual(http_client.RETRIES + 1,
+                         self.session.request.call_count)
+        for attempt in range(http_client.MIN_REQUESTS - 1):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                http_client.get('http://dead.gov/', session=self.session,
+                                retries=0, breaker=self.breaker)
+        self.assertEqual(http_client.RETRIES + http_client.MIN_REQUESTS,
+                         self.session.request.call_count)
+        self.session.request.reset_mock()
+
+        # Other hosts are unaffected
+        self.session.request.side_effect = None
+        self.session.request.return_value = response(200)
+        http_client.get('http://a.gov/', session=self.session,
+                        breaker=self.breaker)
+
+        with self.assertRaises(http_client.HostSkipped):
+            http_client.get('http://dead.gov/page', session=self.session,
+                            breaker=self.breaker)
+        self.assertEqual(1, self.session.request.call_count)
+        self.assertEqual({'dead.gov': {'urls': ['http://dead.gov/page'],
+                                       'latency': None}},
+                         self.breaker.report())
+
+        # Requests without a breaker are sent anyway
+        http_client.get('http://dead.gov/page', session=self.session)
+        self.assertEqual(2, self.session.request.call_count)
+
+        # After cooling off the host is tried again
+        self.now += http_client.COOLDOWN
+        http_client.get('http://dead.gov/page', session=self.session,
+                        breaker=self.breaker)
+        self.assertEqual(3, self.session.request.call_count)
+
+    def test_local_errors(self):
+        """ Errors in the request, not the host, never open a circuit """
+        for error in [requests.exceptions.MissingSchema,
+                      requests.exceptions.InvalidURL]:
+            self.session.request.side_effect = error
+            for attempt in range(http_client.MIN_REQUESTS + 1):
+                for url in ['ta.gov/foia', 'http://ta.gov/foia']:
+                    with self.assertRaises(error):
+                        http_client.get(url, session=self.session,
+                                        breaker=self.breaker)
+        self.assertEqual({}, self.breaker.outcomes)
+        self.assertEqual({}, self.breaker.open_until)
+
+    def test_slow_hosts(self):
+        def slow_request(*args, **kwargs):
+            self.now += http_client.SLOW_SECONDS + 1
+            return response(200)
+        self.session.request.side_effect = slow_request
+        for attempt in range(http_client.MIN_REQUESTS):
+            http_client.get('http://slow.gov/', session=self.session,
+                            breaker=self.breaker)
+        with self.assertRaises(http_client.HostSkipped):
+            http_client.get('http://slow.gov/', session=self.session,
+                            breaker=self.breaker)
+
+    def test_save_skipped(self):
+        self.breaker.skipped = {'dead.gov': ['http://dead.gov/b',
+                                             'http://dead.gov/a']}
+        with tempfile.NamedTemporaryFile(suffix='.json') as f:
+            self.breaker.save_skipped(f.name)
+            self.assertEqual(['http://dead.gov/a', 'http://dead.gov/b'],
+                             http_client.skipped_urls(f.name))
+
+    def test_read_capped(self):
+        r = Mock()
+        r.iter_content.return_value = iter([b'a' * 10, b'b' * 10, b'c' * 10])
+        self.assertEqual(b'a' * 10 + b'b' * 5, http_client.read_capped(r, 15))
+        self.assertEqual([b'c' * 10], list(r.iter_content.return_value))
+        r.close.assert_called_once_with()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import keyword_index
+import scraper
+
+
+class KeywordIndexTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        scraper.save_agency_data('DHS', {
+            'name': 'Department of Homeland Security',
+            'keywords': ['Immigration', 'Organization and functions'],
+            'departments': [
+                {'name': 'U.S. Citizenship & Immigration Services',
+                 'keywords': ['Immigration', 'Passports and visas']},
+                {'name': 'Transportation Security Administration',
+                 'description': 'Secures travel, including immigration '
+                                'checkpoints at airports.'},
+            ]}, data_directory=self.data_dir)
+        scraper.save_agency_data('NASA', {
+            'name': 'National Aeronautics and Space Administration',
+            'common_requests': ['Space shuttle records'],
+            'departments': []}, data_directory=self.data_dir)
+        self.index = keyword_index.build_index(
+            keyword_index.documents(self.data_dir))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_tokenize(self):
+        self.assertEqual(
+            ['passports', 'visas'],
+            keyword_index.tokenize('Passports and the Visas'))
+
+    def test_query_ranking(self):
+        """ Keyword and name matches outrank description matches """
+        results = keyword_index.query(self.index, 'immigration')
+        self.assertEqual(
+            ['U.S. Citizenship & Immigration Services',
+             'Department of Homeland Security',
+             'Transportation Security Administration'],
+            [doc['name'] for _, doc in results])
+        self.assertEqual(
+            {'agency': 'DHS',
+             'department': 'U.S. Citizenship & Immigration Services',
+             'name': 'U.S. Citizenship & Immigration Services'},
+            results[0][1])
+
+    def test_query_common_requests(self):
+        results = keyword_index.query(self.index, 'shuttle', k=1)
+        self.assertEqual('NASA', results[0][1]['agency'])
+        self.assertEqual([], keyword_index.query(self.index, 'the'))
+
+    def test_save_load_and_benchmark(self):
+        filename = os.path.join(self.tmp, 'keyword_index.json')
+        keyword_index.save_index(self.index, filename)
+        index = keyword_index.load_index(filename)
+        self.assertEqual(
+            keyword_index.query(self.index, 'visas'),
+            keyword_index.query(index, 'visas'))
+
+        queries = keyword_index.benchmark_queries(self.data_dir)
+        self.assertEqual(
+            ['Immigration', 'Organization and functions',
+             'Passports and visas', 'Space shuttle records'], queries)
+        stats = keyword_index.benchmark(index, queries)
+        self.assertEqual(4, stats['queries'])
+        self.assertTrue(stats['max_us'] >= stats['median_us'])
@@ -1,8 +1,16 @@
 import layer_with_usa_contacts as usa_layer
 import os
+import shutil
+import tempfile
 
 from unittest import TestCase
 
+from mock import patch
+
+import provenance
+from scraper import save_agency_data
+from sharding import load_path, path_agency
+
 
 class USALayerTests(TestCase):
 
@@ -178,3 +186,101 @@ class USALayerTests(TestCase):
                 'usa_id' in patched_yaml[0].get('departments')[0])
             self.assertTrue(
                 'description' in patched_yaml[0].get('departments')[0])
+
+
+def contact(usa_id, name, description):
+    return {'Id': usa_id, 'Name': name, 'Description': description,
+            'Language': 'en'}
+
+
+class SyncTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        save_agency_data('TA', {
+            'name': 'Test Agency', 'departments': [{'name': 'Office One'}]},
+            self.tmp)
+        save_agency_data('OA', {
+            'name': 'Other Agency', 'departments': [{'name': 'Office Two'}]},
+            self.tmp)
+        self.conn = usa_layer.connect_snapshot(':memory:')
+        self.contacts = [contact(1, 'Test Agency', 'A'),
+                         contact(2, 'Office Two', 'B')]
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.tmp)
+
+    def sync(self):
+        """ Sync and write the patched files, returning them """
+        synced = {}
+        data = usa_layer.transform_json_data(self.contacts)
+        rows, removed, filenames = usa_layer.plan_sync(
+            self.conn, self.contacts, self.tmp)
+        for filename in filenames:
+            patched = usa_layer.patch_agency(
+                load_path(filename), data, removed)
+            usa_layer.write_yaml(filename, patched)
+            synced[path_agency(filename)] = patched
+        usa_layer.sync_done(self.conn, rows, filenames)
+        return synced
+
+    def test_sync_yamls(self):
+        synced = self.sync()
+        self.assertEqual(['OA', 'TA'], sorted(synced))
+        self.assertEqual(2, synced['OA']['departments'][0]['usa_id'])
+
+        # Nothing changed, nothing is patched
+        self.assertEqual({}, self.sync())
+
+        # Only the agency with the changed contact is
+        self.contacts[1] = contact(2, 'Office Two', 'C')
+        synced = self.sync()
+        self.assertEqual(['OA'], list(synced))
+        self.assertEqual('C', synced['OA']['departments'][0]['description'])
+
+        # Added contacts and files changed since are patched too
+        self.contacts.append(contact(3, 'Office One', 'D'))
+        save_agency_data('OA', {
+            'name': 'Other Agency', 'departments': [{'name': 'Office Two'}]},
+            self.tmp)
+        synced = self.sync()
+        self.assertEqual(['OA', 'TA'], sorted(synced))
+        self.assertEqual(3, synced['TA']['departments'][0]['usa_id'])
+
+        # Removed contacts' ids are dropped
+        del self.contacts[0]
+        synced = self.sync()
+        self.assertEqual(['TA'], list(synced))
+        self.assertNotIn('usa_id', synced['TA'])
+
+    def test_layer_updates_commit(self):
+        """ Changes stay pending until layers.py has written them """
+        def updates():
+            return sorted(abb for abb, original, updated
+                          in usa_layer.layer_updates())
+
+        with patch('layer_with_usa_contacts.get_contacts',
+                   return_value=self.contacts), \
+                patch('layer_with_usa_contacts.DATA_DIRECTORY', self.tmp), \
+                patch('layer_with_usa_contacts.connect_snapshot',
+                      return_value=self.conn), \
+                patch('provenance.connect',
+                      return_value=provenance.connect(':memory:')):
+            self.assertEqual(['OA', 'TA'], updates())
+            # The apply was aborted: nothing was written or committed
+            self.assertEqual(['OA', 'TA'], updates())
+            usa_layer.commit()
+            self.assertEqual([], updates())
+            usa_layer.commit()
+
+    def test_snapshot_changes(self):
+        self.contacts[0]['Synonym'] = ['Agency Test']
+        changes, names, rows = usa_layer.snapshot_changes(
+            self.conn, self.contacts + [dict(contact(4, 'Spanish', 'E'),
+                                             Language='sp')])
+        self.assertEqual({'added': ['1', '2'], 'changed': [], 'removed': []},
+                         changes)
+        self.assertEqual(set(['Test Agency', 'Agency Test', 'Office Two']),
+                         names)
+        self.assertEqual(['1', '2'], [row[0] for row in rows])
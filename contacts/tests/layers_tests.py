@@ -0,0 +1,95 @@
+from copy import deepcopy
+import os
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+
+import yaml
+
+import layers
+from scraper import save_agency_data
+
+
+AGENCY = {
+    'name': 'Test Agency',
+    'departments': [
+        {'name': 'One', 'phone': '202-555-1111'},
+        {'name': 'Two'},
+    ]
+}
+
+
+def fake_layer(owned_fields, update):
+    """ A layer owning `owned_fields` that applies `update` to a copy of
+    AGENCY """
+    def layer_updates():
+        data = deepcopy(AGENCY)
+        update(data)
+        yield 'TA', AGENCY, data
+    return SimpleNamespace(OWNED_FIELDS=owned_fields,
+                           layer_updates=layer_updates)
+
+
+def add_keywords(data):
+    data['keywords'] = ['a']
+    data['departments'][1]['keywords'] = ['b']
+
+
+def add_reading_rooms(data):
+    data['departments'][1]['reading_rooms'] = [['Library', 'http://a.gov']]
+
+
+class LayersTests(TestCase):
+
+    def test_field_owners(self):
+        self.assertEqual(
+            'layer_with_usa_contacts',
+            layers.field_owners(layers.LAYERS)['usa_id'])
+        with self.assertRaises(ValueError):
+            layers.field_owners({
+                'a': fake_layer(('keywords',), add_keywords),
+                'b': fake_layer(('keywords',), add_keywords)})
+
+    def test_layer_patch(self):
+        module = fake_layer(('keywords',), add_keywords)
+        patch = layers.layer_patch('a', ('keywords',), module.layer_updates())
+        self.assertEqual([None, 'Two'],
+                         [c['department'] for c in patch['TA']])
+        with self.assertRaises(ValueError):
+            layers.layer_patch('a', ('reading_rooms',),
+                               module.layer_updates())
+
+    def test_merged_layers(self):
+        """ Layers run concurrently don't overwrite each other's fields """
+        tmp = tempfile.mkdtemp()
+        try:
+            save_agency_data('TA', AGENCY, tmp)
+            patches = layers.collect_patches({
+                'keywords': fake_layer(('keywords',), add_keywords),
+                'reading_rooms': fake_layer(('reading_rooms',),
+                                            add_reading_rooms),
+                'nothing': fake_layer(('usa_id',), lambda data: None),
+            })
+            self.assertEqual({}, patches['nothing'])
+            changeset_file = os.path.join(tmp, 'changeset.jsonl')
+            layers.apply_patches(layers.merge_patches(patches), tmp,
+                                 changeset_file)
+
+            with open(os.path.join(tmp, 'TA.yaml')) as f:
+                data = yaml.load(f)
+            expected = deepcopy(AGENCY)
+            add_keywords(expected)
+            add_reading_rooms(expected)
+            self.assertEqual(expected, data)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_commit_layers(self):
+        committed = []
+        module = fake_layer(('keywords',), add_keywords)
+        module.commit = lambda: committed.append('keywords')
+        layers.commit_layers({
+            'keywords': module,
+            'nothing': fake_layer(('usa_id',), lambda data: None)})
+        self.assertEqual(['keywords'], committed)
@@ -0,0 +1,66 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import patch
+
+import micro_benchmarks
+from scraper import save_agency_data
+
+
+class MicroBenchmarksTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_run_benchmarks(self):
+        save_agency_data('TA', {
+            'name': 'Test Agency', 'departments': [
+                {'name': 'Office One', 'phone': '555-111-2222'}]}, self.tmp)
+        results = micro_benchmarks.run_benchmarks(
+            ['clean_name', 'clean_phone_number', 'yaml_load'], self.tmp,
+            min_seconds=0.001, repeat=2)
+        self.assertEqual(['clean_name', 'clean_phone_number', 'yaml_load'],
+                         sorted(results))
+        self.assertEqual(2, results['clean_name']['inputs'])
+        self.assertEqual(1, results['clean_phone_number']['inputs'])
+        self.assertTrue(results['yaml_load']['best_us'] <=
+                        results['yaml_load']['median_us'])
+
+        # Benchmarks whose inputs are missing are skipped
+        with patch('micro_benchmarks.os.path.exists', return_value=False):
+            self.assertEqual({}, micro_benchmarks.run_benchmarks(
+                ['patch_dict'], self.tmp))
+
+    def test_save_and_compare(self):
+        with patch('micro_benchmarks.time.time', side_effect=[1, 2]):
+            for commit in ['aaa', 'bbb']:
+                micro_benchmarks.save_results(
+                    {'clean_name': {'best_us': 10}}, commit, self.tmp)
+        self.assertEqual(
+            'bbb', micro_benchmarks.latest_results('ccc', self.tmp)['commit'])
+        self.assertEqual(
+            'aaa', micro_benchmarks.latest_results('bbb', self.tmp)['commit'])
+        baseline = micro_benchmarks.load_results('aaa', self.tmp)
+
+        results = {'clean_name': {'best_us': 11},
+                   'parse_agency': {'best_us': 12},
+                   'yaml_load': {'best_us': 5}}
+        baseline['benchmarks'].update({'parse_agency': {'best_us': 10}})
+        self.assertEqual(
+            [('clean_name', 1.1, False), ('parse_agency', 1.2, False)],
+            micro_benchmarks.compare(baseline['benchmarks'], results))
+        # An explicit threshold applies to every benchmark
+        self.assertEqual(
+            [('clean_name', 1.1, True), ('parse_agency', 1.2, True)],
+            micro_benchmarks.compare(baseline['benchmarks'], results, 1.05))
+        results['parse_agency']['best_us'] = 14
+        self.assertEqual(
+            [('clean_name', 1.1, False), ('parse_agency', 1.4, True)],
+            micro_benchmarks.compare(baseline['benchmarks'], results))
+        self.assertEqual(
+            [('clean_name', 1.1, False), ('parse_agency', 1.4, False)],
+            micro_benchmarks.compare(baseline['benchmarks'], results, 2.0))
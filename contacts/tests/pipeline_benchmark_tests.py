@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mock import Mock
+
+import http_client
+import pipeline_benchmark
+import stand_in
+
+
+class PipelineBenchmarkTests(TestCase):
+
+    def test_run_stage(self):
+        server = Mock()
+        server.stats.side_effect = [
+            {'requests': 1, 'bytes': 10, 'errors': 0},
+            {'requests': 4, 'bytes': 50, 'errors': 1}]
+        result = pipeline_benchmark.run_stage('stage', Mock(), server)
+        self.assertEqual(
+            ('stage', 3, 40, 1, None),
+            (result['stage'], result['requests'], result['bytes'],
+             result['errors'], result['error']))
+
+        # Failures are reported
+        server.stats.side_effect = [{'requests': 0}, {'requests': 0}]
+        result = pipeline_benchmark.run_stage(
+            'stage', Mock(side_effect=ValueError('bad')), server)
+        self.assertEqual('ValueError: bad', result['error'])
+
+    def test_run_pipeline(self):
+        """ Recorded fixtures are served from the scratch directory """
+        directory = os.path.relpath(tempfile.mkdtemp(dir=os.curdir))
+        self.addCleanup(shutil.rmtree, directory)
+        fixtures = stand_in.Fixtures(directory)
+        fixtures.add(stand_in.XLS_URL, b'recorded')
+        server = stand_in.StandIn(('localhost', 0), fixtures,
+                                  stand_in.Site(directory)).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        bodies = []
+        breaker = http_client.BREAKER
+        results = pipeline_benchmark.run_pipeline(server, [
+            ('xls', lambda: bodies.append(
+                http_client.get(stand_in.XLS_URL).content))])
+        self.assertEqual([b'recorded'], bodies)
+        self.assertEqual((1, 8, None), (results[0]['requests'],
+                                        results[0]['bytes'],
+                                        results[0]['error']))
+        self.assertIs(breaker, http_client.BREAKER)
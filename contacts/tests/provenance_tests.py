@@ -0,0 +1,117 @@
+from unittest import TestCase
+
+from mock import patch
+
+import http_client
+import layer_with_reading_room
+import provenance
+
+
+DAY = provenance.DAY
+AGENCY = {
+    'name': 'Test Agency',
+    'website': 'http://example.gov/',
+    'departments': [
+        {'name': 'One', 'phone': '202-555-1111'},
+        {'name': 'Two', 'website': 'http://two.example.gov/'},
+    ]
+}
+
+
+class ProvenanceTests(TestCase):
+
+    def setUp(self):
+        self.conn = provenance.connect(':memory:')
+
+    def test_record_agency(self):
+        provenance.record_agency(self.conn, 'TA', AGENCY, 'scraper',
+                                 source_digest='abc', fetched_at=10)
+        row = provenance.lookup(self.conn, 'TA', 'One', 'phone')
+        self.assertEqual(('scraper', 10, 'abc'),
+                         (row['source'], row['fetched_at'],
+                          row['source_digest']))
+        self.assertIsNotNone(provenance.lookup(self.conn, 'TA', None,
+                                               'website'))
+        self.assertIsNone(provenance.lookup(self.conn, 'TA', None, 'name'))
+        self.assertIsNone(provenance.lookup(self.conn, 'TA', None,
+                                            'departments'))
+
+        # A later source takes over the fields it produced
+        provenance.record(self.conn, 'TA', 'One', ['phone'], 'layer_with_csv',
+                          fetched_at=20)
+        self.assertEqual('layer_with_csv', provenance.lookup(
+            self.conn, 'TA', 'One', 'phone')['source'])
+
+    def test_is_stale(self):
+        provenance.record(self.conn, 'TA', None, ['reading_rooms'],
+                          'layer_with_reading_room', fetched_at=0)
+        ttl = provenance.SOURCE_TTLS['layer_with_reading_room']
+        self.assertFalse(provenance.is_stale(
+            self.conn, 'TA', None, 'reading_rooms',
+            'layer_with_reading_room', now=ttl))
+        self.assertTrue(provenance.is_stale(
+            self.conn, 'TA', None, 'reading_rooms',
+            'layer_with_reading_room', now=ttl + 1))
+        # Never fetched, or fetched from elsewhere
+        self.assertTrue(provenance.is_stale(
+            self.conn, 'TA', 'One', 'reading_rooms',
+            'layer_with_reading_room', now=1))
+        self.assertTrue(provenance.is_stale(
+            self.conn, 'TA', None, 'reading_rooms', 'scraper', now=1))
+
+    def test_agency_is_stale(self):
+        self.assertTrue(provenance.agency_is_stale(self.conn, 'TA',
+                                                   'scraper'))
+        provenance.record(self.conn, 'TA', None, ['website'], 'scraper',
+                          fetched_at=0)
+        provenance.record(self.conn, 'TA', 'One', ['phone'], 'scraper',
+                          fetched_at=5 * DAY)
+        self.assertFalse(provenance.agency_is_stale(
+            self.conn, 'TA', 'scraper', now=31 * DAY))
+        self.assertTrue(provenance.agency_is_stale(
+            self.conn, 'TA', 'scraper', now=36 * DAY))
+
+    def test_stale_fields(self):
+        provenance.record(self.conn, 'TA', None, ['usa_id', 'description'],
+                          'layer_with_usa_contacts', fetched_at=0)
+        provenance.record(self.conn, 'TA', 'One', ['usa_id'],
+                          'layer_with_usa_contacts', fetched_at=5 * DAY)
+        rows = provenance.stale_fields(self.conn, 'layer_with_usa_contacts',
+                                       now=10 * DAY)
+        self.assertEqual([('TA', '', 'description'), ('TA', '', 'usa_id')],
+                         [tuple(row)[:3] for row in rows])
+
+    @patch('layer_with_reading_room.read_yaml_file')
+    @patch('layer_with_reading_room.process')
+    def test_reading_room_refresh(self, process, read_yaml_file):
+        """ Only records whose reading rooms are stale are looked up """
+        read_yaml_file.return_value = AGENCY
+        process.return_value = None
+        provenance.record(self.conn, 'TA', 'One', ['reading_rooms'],
+                          layer_with_reading_room.SOURCE)
+
+        data = layer_with_reading_room.reading_room(
+            'TA', self.conn, refresh=True)
+        self.assertEqual(AGENCY, data)
+        self.assertEqual(['Test Agency', 'Two'],
+                         [c[0][0]['name'] for c in process.call_args_list])
+        self.assertFalse(provenance.is_stale(
+            self.conn, 'TA', 'Two', 'reading_rooms',
+            layer_with_reading_room.SOURCE))
+
+        process.reset_mock()
+        layer_with_reading_room.reading_room('TA', self.conn)
+        self.assertEqual(3, process.call_count)
+
+    @patch('layer_with_reading_room.read_yaml_file')
+    @patch('layer_with_reading_room.process')
+    def test_reading_room_skipped_host(self, process, read_yaml_file):
+        """ Lookups on skipped hosts aren't recorded, so are retried """
+        read_yaml_file.return_value = AGENCY
+        process.side_effect = http_client.HostSkipped()
+        data = layer_with_reading_room.reading_room(
+            'TA', self.conn, refresh=True)
+        self.assertEqual(AGENCY, data)
+        self.assertTrue(provenance.is_stale(
+            self.conn, 'TA', 'One', 'reading_rooms',
+            layer_with_reading_room.SOURCE))
@@ -1,8 +1,12 @@
+import io
+import sqlite3
 from unittest import TestCase
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import requests
+import urllib3
 
+import http_client
 import layer_with_reading_room as reading
 
 
@@ -21,9 +25,17 @@ class MockResponse():
     def __init__(self):
         f = MockHistory()
         self.history = [f]
-        self.content = ''
+        self.content = b''
         self.status_code = 200
         self.url = 'http://newurl.gov'
+        self.headers = {'Content-Type': 'text/html'}
+
+    def iter_content(self, chunk_size):
+        return [self.content[i:i + chunk_size]
+                for i in range(0, len(self.content), chunk_size)]
+
+    def close(self):
+        pass
 
 
 class ReadingRoomTests(TestCase):
@@ -86,7 +98,7 @@ class ReadingRoomTests(TestCase):
             None,
             reading.get_absolute_url(l, 'http://fbi.gov/rr'))
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.head')
     def test_update_links(self, req):
         mock_resp = MockResponse()
         mock_resp.url = 'http://www.amtrak.com/foia/'
@@ -130,7 +142,7 @@ class ReadingRoomTests(TestCase):
         uniques = reading.uniquefy(links)
         self.assertEqual(len(uniques), 1)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.head')
     def test_unique_links_redirect_exception_handling(self, req):
         req.side_effect = requests.exceptions.TooManyRedirects()
 
@@ -138,21 +150,21 @@ class ReadingRoomTests(TestCase):
         uniques = reading.unique_links(links)
         self.assertEqual([], uniques)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.head')
     def test_unique_links_connection_error(self, req):
         req.side_effect = requests.exceptions.ConnectionError
         links = [['text one', 'http://testone.gov/resources/foialibrary/']]
         uniques = reading.unique_links(links)
         self.assertEqual([], uniques)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.head')
     def test_unique_links_redirect(self, req):
         req.return_value = MockResponse()
         links = [['text one', 'http://testone.gov/resources/foialibrary/']]
         uniques = reading.unique_links(links)
         self.assertEqual([['text one', 'http://newurl.gov']], uniques)
 
-    @patch('layer_with_reading_room.requests.get')
+    @patch('layer_with_reading_room.http_client.head')
     def test_unique_links_redirect_301(self, req):
         fake_response = MockResponse()
         fake_response.history[0].status_code = 302
@@ -166,4 +178,171 @@ class ReadingRoomTests(TestCase):
         scraper.return_value = None
         fake_response = MockResponse()
         reading.reading_room_links(fake_response)
-        scraper.assert_called_once_with('', 'http://newurl.gov')
+        scraper.assert_called_once_with(b'', 'http://newurl.gov')
+
+    @patch('layer_with_reading_room.http_client.head')
+    @patch('layer_with_reading_room.http_client.get')
+    def test_skipped_hosts(self, req, head):
+        """ Links and websites on skipped hosts are left as they are """
+        req.side_effect = head.side_effect = http_client.HostSkipped()
+        links = [['text one', 'http://testone.gov/resources/foialibrary/']]
+        self.assertEqual(links, reading.unique_links(links))
+        with self.assertRaises(http_client.HostSkipped):
+            reading.process({'website': 'http://testone.gov/'})
+
+    def test_normalize_url(self):
+        self.assertEqual('http://gsa.gov/foia',
+                         reading.normalize_url(' HTTP://GSA.gov/foia/#top'))
+        self.assertEqual('http://gsa.gov', reading.normalize_url(
+            'http://gsa.gov/'))
+
+    @patch('layer_with_reading_room.http_client.head')
+    @patch('layer_with_reading_room.http_client.get')
+    def test_fetch_memo(self, req, head):
+        """ Each distinct URL is only fetched once per memo """
+        response = MockResponse()
+        response.content = b'<a href="/foia/library">FOIA Library</a>'
+        response.url = 'http://gsa.gov/'
+        req.return_value = response
+        memo = reading.FetchMemo()
+        for website in ['http://gsa.gov/', 'http://GSA.gov', 'http://gsa.gov']:
+            self.assertEqual(
+                [['FOIA Library', 'http://gsa.gov/foia/library']],
+                reading.process({'website': website}, memo))
+        # One request for the sitemap, which isn't there, and one for the
+        # page
+        self.assertEqual(2, req.call_count)
+
+        head.return_value = response
+        links = [['one', 'http://gsa.gov/foia/library'],
+                 ['two', 'http://gsa.gov/foia/library/']]
+        reading.unique_links(links, memo)
+        reading.unique_links(links, memo)
+        self.assertEqual(1, head.call_count)
+
+    @patch('layer_with_reading_room.http_client.get')
+    def test_bounded_fetch(self, req):
+        """ Pages are read up to MAX_PAGE_BYTES, and only if they're HTML """
+        response = MockResponse()
+        link = b'<a href="/foia/vault">FOIA Library and Reading Room</a>'
+        response.content = link + b' ' * reading.MAX_PAGE_BYTES + link
+        req.return_value = response
+        self.assertEqual(
+            [['FOIA Library and Reading Room',
+              'http://newurl.gov/foia/vault']],
+            reading.process({'website': 'http://newurl.gov'}))
+        self.assertTrue(req.call_args[1]['stream'])
+
+        response.headers['Content-Type'] = 'application/pdf'
+        self.assertIsNone(reading.process({'website': 'http://newurl.gov'}))
+
+    @patch('layer_with_reading_room.http_client.get')
+    def test_body_errors(self, req):
+        """ Errors reading a page's body leave it without links """
+        response = MockResponse()
+        response.iter_content = Mock(
+            side_effect=requests.exceptions.ChunkedEncodingError())
+        response.close = Mock()
+        req.return_value = response
+        self.assertIsNone(reading.website_links('http://newurl.gov'))
+        response.close.assert_called_with()
+
+    @patch('layer_with_reading_room.http_client.get')
+    @patch('layer_with_reading_room.http_client.head')
+    def test_link_cache(self, head, get):
+        """ Links are only checked again once their result is stale, with
+        a conditional request, and with GET if HEAD is refused """
+        cache = sqlite3.connect(':memory:')
+        cache.row_factory = sqlite3.Row
+        cache.executescript(reading.LINK_SCHEMA)
+        response = MockResponse()
+        response.headers = {'ETag': '"v1"'}
+        head.return_value = response
+        url = 'http://testone.gov/library'
+
+        self.assertEqual('http://newurl.gov',
+                         reading.validate_link(url, cache, now=0))
+        self.assertEqual('http://newurl.gov', reading.validate_link(
+            url, cache, now=reading.LINK_TTL - 1))
+        self.assertEqual(1, head.call_count)
+
+        response.status_code = 304
+        response.url = url
+        self.assertEqual('http://newurl.gov', reading.validate_link(
+            url, cache, now=reading.LINK_TTL))
+        self.assertEqual({'If-None-Match': '"v1"'},
+                         head.call_args[1]['headers'])
+        self.assertEqual(0, get.call_count)
+
+        response.status_code = 405
+        get_response = MockResponse()
+        get_response.status_code = 404
+        get.return_value = get_response
+        self.assertIsNone(reading.validate_link(
+            url, cache, now=3 * reading.LINK_TTL))
+        self.assertTrue(get.call_args[1]['stream'])
+        self.assertIsNone(reading.validate_link(
+            url, cache, now=3 * reading.LINK_TTL + 1))
+        self.assertEqual(1, get.call_count)
+
+    @patch('layer_with_reading_room.http_client.get')
+    def test_sitemap(self, req):
+        """ Reading rooms come from the domain's sitemap when it lists some
+        under the website, and from the website's links otherwise """
+        sitemap = MockResponse()
+        sitemap.headers = {'Content-Type': 'application/xml'}
+        sitemap.raw = io.BytesIO(b"""<?xml version="1.0" encoding="UTF-8"?>
+            <urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+              <url><loc>http://www.gsa.gov/about</loc></url>
+              <url><loc>http://www.gsa.gov/foia/reading-room/</loc></url>
+              <url><loc>http://www.gsa.gov/foia/certification-vault</loc></url>
+              <url><loc>http://www.gsa.gov/oig/FOIA_Library.html</loc></url>
+              <url><loc>http://www.other.gov/reading-room</loc></url>
+            </urlset>""")
+        page = MockResponse()
+        page.content = b'<a href="/oig/foia/vault">The Vault</a>'
+        page.url = 'http://www.gsa.gov/oig/foia'
+        req.side_effect = lambda url, **kwargs: \
+            sitemap if url.endswith('sitemap.xml') else page
+
+        memo = reading.FetchMemo()
+        self.assertEqual(
+            [['Reading Room', 'http://www.gsa.gov/foia/reading-room/'],
+             ['Foia Library', 'http://www.gsa.gov/oig/FOIA_Library.html']],
+            reading.process({'website': 'http://www.gsa.gov/'}, memo))
+        self.assertEqual(
+            [['Reading Room', 'http://www.gsa.gov/foia/reading-room/']],
+            reading.process({'website': 'www.gsa.gov/foia'}, memo))
+        self.assertEqual(
+            [['The Vault', 'http://www.gsa.gov/oig/foia/vault']],
+            reading.process({'website': 'http://www.gsa.gov/oig/foia'},
+                            memo))
+        self.assertEqual(
+            ['http://www.gsa.gov/sitemap.xml', 'http://www.gsa.gov/oig/foia'],
+            [c[0][0] for c in req.call_args_list])
+
+    @patch('layer_with_reading_room.http_client.get')
+    def test_sitemap_errors(self, req):
+        """ A sitemap that fails partway through, or lists too many reading
+        rooms, is passed over for the website's links """
+        class FailingStream(io.BytesIO):
+            def read(self, size=-1):
+                raise urllib3.exceptions.ProtocolError('truncated')
+
+        sitemap = MockResponse()
+        sitemap.headers = {'Content-Type': 'application/xml'}
+        sitemap.raw = FailingStream()
+        page = MockResponse()
+        page.content = b'<a href="/foia/vault">The Vault</a>'
+        page.url = 'http://www.gsa.gov/'
+        req.side_effect = lambda url, **kwargs: \
+            sitemap if url.endswith('sitemap.xml') else page
+        self.assertEqual([['The Vault', 'http://www.gsa.gov/foia/vault']],
+                         reading.process({'website': 'http://www.gsa.gov/'}))
+
+        urls = ''.join('<url><loc>http://www.gsa.gov/%s/reading-room</loc>'
+                       '</url>' % i
+                       for i in range(reading.MAX_SITEMAP_LINKS + 1))
+        sitemap.raw = io.BytesIO(('<urlset>%s</urlset>' % urls).encode())
+        self.assertEqual([['The Vault', 'http://www.gsa.gov/foia/vault']],
+                         reading.process({'website': 'http://www.gsa.gov/'}))
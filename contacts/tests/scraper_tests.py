@@ -192,6 +192,19 @@ class ScraperTests(TestCase):
         f.close()
         self.assertEqual({'name': 'Test Agency'}, test_data)
 
+    def test_save_agencies(self):
+        """ One provenance connection is shared by all the agencies """
+        with patch('scraper.AGENCIES', ['A', 'B']), \
+                patch('scraper.provenance.connect') as connect, \
+                patch('scraper.provenance.agency_is_stale',
+                      return_value=False) as agency_is_stale:
+            scraper.save_agencies(refresh=True)
+        connect.assert_called_once_with()
+        connect.return_value.close.assert_called_once_with()
+        self.assertEqual(
+            [connect.return_value] * 2,
+            [c[0][0] for c in agency_is_stale.call_args_list])
+
     def test_agency_description(self):
         """Description should be pulled out and BRs should be converted"""
         html = """
@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import yaml
+
+import bundle
+from scraper import save_agency_data
+import sharding
+import validate_data
+import yaml_stream
+
+
+AGENCY = {
+    'name': 'Test Agency',
+    'keywords': ['one'],
+    'departments': [
+        {'name': 'Office One', 'website': 'http://one.ta.gov/'},
+        {'name': 'Office Two', 'emails': ['two@ta.gov']},
+        {'name': 'Office-Two', 'top_level': True},
+    ]
+}
+
+
+class ShardingTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        save_agency_data('TA', AGENCY, self.tmp)
+        save_agency_data('TB', {'name': 'B', 'departments': []}, self.tmp)
+        self.directory = os.path.join(self.tmp, 'TA')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_department_filenames(self):
+        filenames = sharding.department_filenames(AGENCY['departments'])
+        self.assertEqual(['office-one.yaml', 'office-two.yaml'],
+                         filenames[:2])
+        self.assertTrue(filenames[2].startswith('office-two-'))
+
+        # Every department gets its own file, however many share a name
+        filenames = sharding.department_filenames([{'name': 'X'}] * 3)
+        self.assertEqual(3, len(set(filenames)))
+        self.assertEqual('x.yaml', filenames[0])
+
+    def test_shard_and_unshard(self):
+        with open(self.directory + '.yaml') as f:
+            text = f.read()
+        sharding.shard(self.tmp, 'TA')
+        self.assertFalse(os.path.exists(self.directory + '.yaml'))
+        self.assertEqual(self.directory,
+                         sharding.agency_path(self.tmp, 'TA'))
+        self.assertEqual(4, len(os.listdir(self.directory)))
+        self.assertEqual(AGENCY, sharding.load_path(self.directory))
+        self.assertEqual(['TA', 'TB'], [
+            sharding.path_agency(p) for p in sharding.agency_paths(self.tmp)])
+
+        sharding.unshard(self.tmp, 'TA')
+        self.assertFalse(os.path.exists(self.directory))
+        with open(self.directory + '.yaml') as f:
+            self.assertEqual(text, f.read())
+
+    def test_save_writes_changed_departments(self):
+        sharding.shard(self.tmp, 'TA')
+        mtimes = dict((name, os.stat(os.path.join(self.directory, name))
+                       .st_mtime_ns) for name in os.listdir(self.directory))
+
+        data = sharding.load_path(self.directory)
+        data['departments'][0]['website'] = 'https://one.ta.gov/'
+        del data['departments'][2]
+        self.assertEqual(2, sharding.save_sharded(self.directory, data))
+
+        changed = [name for name in os.listdir(self.directory)
+                   if os.stat(os.path.join(self.directory, name))
+                   .st_mtime_ns != mtimes[name]]
+        self.assertEqual(['agency.yaml', 'office-one.yaml'], sorted(changed))
+        self.assertEqual(3, len(os.listdir(self.directory)))
+        with open(os.path.join(self.directory, 'office-one.yaml')) as f:
+            self.assertEqual('https://one.ta.gov/', yaml.load(f)['website'])
+
+        # save_agency_data keeps the layout the agency already has
+        save_agency_data('TA', AGENCY, self.tmp)
+        self.assertEqual(AGENCY, sharding.load_path(self.directory))
+
+    def test_loaders(self):
+        """ Readers see the same data in either layout """
+        agencies = bundle.load_agencies(self.tmp)
+        records = list(yaml_stream.records(self.directory + '.yaml'))
+        sharding.shard(self.tmp, 'TA')
+        self.assertEqual(agencies, bundle.load_agencies(self.tmp))
+        self.assertEqual(records, list(yaml_stream.records(self.directory)))
+        self.assertEqual(
+            [('Office One', {'website': 'http://one.ta.gov/'}),
+             ('Office Two', {}), ('Office-Two', {}), (None, {})],
+            list(yaml_stream.records(self.directory, ['website'])))
+        self.assertEqual([], validate_data.validate_file(
+            (self.directory, None)))
@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import scraper
+import snapshot
+
+
+class SnapshotTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        data_dir = os.path.join(self.tmp, 'data')
+        self.filename = os.path.join(self.tmp, 'contacts.snapshot')
+        self.doj = {
+            'name': 'Department of Justice',
+            'departments': [{'name': 'Office %s' % i, 'top_level': i == 0}
+                            for i in range(12)]}
+        scraper.save_agency_data('DOJ', self.doj, data_directory=data_dir)
+        scraper.save_agency_data('U.S. DOL', {
+            'name': 'Department of Labor',
+            'departments': [{'name': 'Job Corps'}]}, data_directory=data_dir)
+        scraper.save_agency_data('ABMC', {
+            'name': 'American Battle Monuments Commission',
+            'departments': []}, data_directory=data_dir)
+        self.count = snapshot.build_snapshot(data_dir, self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_lookups(self):
+        self.assertEqual(16, self.count)
+        with snapshot.Snapshot(self.filename) as snap:
+            self.assertEqual(self.doj['departments'][7],
+                             snap.department('DOJ', 7))
+            self.assertEqual({'name': 'Department of Justice'},
+                             snap.agency('DOJ'))
+            self.assertEqual({'name': 'Job Corps'},
+                             snap.department('U.S. DOL', 0))
+            self.assertEqual(12, snap.department_count('DOJ'))
+            self.assertEqual(0, snap.department_count('ABMC'))
+            self.assertEqual(0, snap.department_count('NASA'))
+            self.assertEqual(None, snap.department('DOJ', 12))
+            self.assertEqual(None, snap.agency('NASA'))
+
+    def test_view(self):
+        """ Views are onto the mapped file, not copies, and are released
+        when the block ends """
+        snap = snapshot.Snapshot(self.filename)
+        with snap.view('DOJ', 3) as view:
+            self.assertTrue(isinstance(view, memoryview))
+            self.assertEqual(self.doj['departments'][3],
+                             json.loads(str(view, 'utf-8')))
+        with snap.view('NASA') as view:
+            self.assertEqual(None, view)
+        snap.close()
+
+    def test_raw(self):
+        """ Raw records are kept after the snapshot is closed """
+        with snapshot.Snapshot(self.filename) as snap:
+            raw = snap.raw('DOJ', 3)
+        self.assertTrue(isinstance(raw, bytes))
+        self.assertEqual(self.doj['departments'][3],
+                         json.loads(raw.decode('utf-8')))
+
+    def test_rejects_other_files(self):
+        bad = os.path.join(self.tmp, 'bad.snapshot')
+        with open(bad, 'wb') as f:
+            f.write(b'NOTASNAPSHOT' * 2)
+        self.assertRaises(ValueError, snapshot.Snapshot, bad)
+        with open(bad, 'wb') as f:
+            f.write(b'FOIA')
+        self.assertRaises(ValueError, snapshot.Snapshot, bad)
+        self.assertRaises(ValueError, snapshot.agency_key, 'X' * 33)
@@ -0,0 +1,103 @@
+import shutil
+import tempfile
+from unittest import TestCase
+
+from bs4 import BeautifulSoup
+from mock import patch
+
+import http_client
+import scraper
+import stand_in
+
+
+AGENCY = {
+    'name': 'Test Agency',
+    'description': 'About us',
+    'usa_id': 7,
+    'departments': [
+        {'name': 'Headquarters', 'phone': '555-111-2222',
+         'emails': ['foia@ta.gov'], 'website': 'http://ta.gov/',
+         'reading_rooms': [['FOIA Library', 'http://ta.gov/library']],
+         'keywords': ['Testing'],
+         'address': {'address_lines': ['FOIA Office'], 'street': '1 Main St',
+                     'city': 'Washington', 'state': 'DC', 'zip': '20001'},
+         'public_liaison': {'name': 'Jane Smith', 'phone': ['555-333-4444']}},
+        {'name': 'Branch'},
+    ]
+}
+
+
+class StandInTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        scraper.save_agency_data('TA', AGENCY, self.tmp)
+        self.fixtures = stand_in.Fixtures(self.tmp + '/fixtures')
+        self.fixtures.add('https://www.federalregister.gov/recorded?a=1',
+                          'recorded')
+        self.server = stand_in.StandIn(
+            ('localhost', 0), self.fixtures, stand_in.Site(self.tmp)).start()
+        http_client.use_stand_in(self.server.address)
+        patcher = patch('http_client.BREAKER', http_client.CircuitBreaker())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        http_client.use_stand_in(None)
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.tmp)
+
+    def test_fixture_key(self):
+        self.assertEqual(
+            'http://www.foia.gov/foia/FoiaMakeRequest?agency=TA',
+            stand_in.fixture_key(scraper.agency_url('TA')))
+        self.assertEqual('http://a.gov/?a=1&b=2',
+                         stand_in.fixture_key('http://a.gov/?b=2&a=1#top'))
+
+    def test_agency_page(self):
+        """ Generated pages read back as the data they came from """
+        data = scraper.parse_agency('TA', BeautifulSoup(
+            stand_in.agency_page(AGENCY), 'html.parser'))
+        self.assertEqual('About us', data['description'])
+        headquarters = data['departments'][0]
+        for field in ['phone', 'emails', 'website', 'address',
+                      'public_liaison']:
+            self.assertEqual(AGENCY['departments'][0][field],
+                             headquarters[field])
+        self.assertEqual('Branch', data['departments'][1]['name'])
+
+    def test_serve(self):
+        url = scraper.agency_url('TA')
+        response = http_client.get(url)
+        self.assertEqual(200, response.status_code)
+        self.assertIn('Test Agency', response.text)
+        # The URL asked for is kept
+        self.assertEqual(url, response.url)
+
+        self.assertEqual(
+            [{'Id': 7, 'Name': 'Test Agency', 'Description': 'About us',
+              'Language': 'en'}],
+            http_client.get(stand_in.USA_CONTACTS_API).json()['Contact'])
+
+        # Recorded pages are served, for other queries too
+        for url in ['https://www.federalregister.gov/recorded?a=1',
+                    'https://www.federalregister.gov/recorded?a=2']:
+            self.assertEqual('recorded', http_client.get(url).text)
+
+        response = http_client.get('http://ta.gov/anything')
+        self.assertIn('href="http://ta.gov/library"', response.text)
+        self.assertEqual(
+            404, http_client.get('http://ta.gov/sitemap.xml').status_code)
+        self.assertEqual(
+            404, http_client.head('http://other.gov/').status_code)
+
+        stats = self.server.stats()
+        self.assertEqual(7, stats['requests'])
+        self.assertEqual(0, stats['errors'])
+
+    def test_errors(self):
+        self.server.error_rate = 1
+        response = http_client.get('http://ta.gov/', retries=0)
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(1, self.server.stats()['errors'])
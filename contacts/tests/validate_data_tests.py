@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+import scraper
+import validate_data
+
+
+GOOD_DEPARTMENT = {
+    'name': 'Office One',
+    'address': {'street': '1 Main St', 'city': 'Arlington', 'state': 'VA',
+                'zip': '22201'},
+    'phone': '202-555-1111 x123',
+    'fax': '+1 202-555-2222',
+    'public_liaison': {'phone': ['202-555-3333 (TTY)']},
+    'website': 'http://test.gov/foia',
+    'reading_rooms': [['Reading Room', 'https://test.gov/rr']],
+}
+
+
+class ValidateDataTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp, 'data')
+        self.manual_dir = os.path.join(self.tmp, 'manual_data')
+        self.cache = os.path.join(self.tmp, 'cache.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_check_record(self):
+        """ Well formed records produce no problems """
+        self.assertEqual(
+            [], list(validate_data.check_record('x', GOOD_DEPARTMENT)))
+
+        bad = dict(GOOD_DEPARTMENT, phone='555-1111',
+                   address={'street': '1 Main St', 'state': 'Virginia',
+                            'zip': '2220'},
+                   website='www.test.gov',
+                   misc={'Hotline': {'phone': ['(202) 555-1111']}})
+        problems = list(validate_data.check_record('x', bad))
+        self.assertEqual([
+            "x: malformed phone '555-1111'",
+            "x: malformed Hotline '(202) 555-1111'",
+            "x: malformed website 'www.test.gov'",
+            'x: address missing city',
+            "x: malformed state 'Virginia'",
+            "x: malformed zip '2220'"], problems)
+
+    def test_validate_all(self):
+        """ Duplicates and manual data names are checked; results are cached
+        by digest """
+        agency = {'name': 'Test Agency',
+                  'departments': [GOOD_DEPARTMENT, GOOD_DEPARTMENT]}
+        scraper.save_agency_data('TA', agency, data_directory=self.data_dir)
+        manual = {'name': 'Test Agency',
+                  'departments': [{'name': 'Office Two'}]}
+        scraper.save_agency_data('TA', manual,
+                                 data_directory=self.manual_dir)
+
+        results = validate_data.validate_all(
+            self.data_dir, self.manual_dir, self.cache, workers=1)
+        data_file = os.path.join(self.data_dir, 'TA.yaml')
+        manual_file = os.path.join(self.manual_dir, 'TA.yaml')
+        self.assertEqual(
+            ['%s: duplicate department Office One' % data_file],
+            results[data_file])
+        self.assertEqual(
+            ['%s: department Office Two not in %s' % (manual_file, data_file)],
+            results[manual_file])
+
+        with patch('validate_data.ProcessPoolExecutor') as executor:
+            cached = validate_data.validate_all(
+                self.data_dir, self.manual_dir, self.cache)
+            self.assertFalse(executor.called)
+        self.assertEqual(results, cached)
+
+        # Changing the data file invalidates the manual file too
+        agency['departments'].append(dict(GOOD_DEPARTMENT, name='Office Two'))
+        scraper.save_agency_data('TA', agency, data_directory=self.data_dir)
+        results = validate_data.validate_all(
+            self.data_dir, self.manual_dir, self.cache, workers=1)
+        self.assertEqual([], results[manual_file])
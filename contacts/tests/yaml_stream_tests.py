@@ -0,0 +1,61 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import explorer
+from scraper import save_agency_data
+import yaml_stream
+
+
+AGENCY = {
+    'name': 'Test Agency',
+    'website': 'http://ta.gov/',
+    'keywords': ['one', 'two'],
+    'departments': [
+        {'name': 'One', 'website': 'http://one.ta.gov/',
+         'address': {'street': '1 Main St', 'zip': '20001'},
+         'reading_rooms': [['Library', 'http://one.ta.gov/library']],
+         'top_level': True},
+        {'name': 'Two', 'request_time_stats': {'2012': {'simple_mean': '5'}},
+         'emails': []},
+    ]
+}
+
+
+class YamlStreamTests(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        save_agency_data('TA', AGENCY, self.tmp)
+        self.filename = os.path.join(self.tmp, 'TA.yaml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_records(self):
+        """ Without fields, records match what yaml.load gives """
+        agency = dict(AGENCY)
+        del agency['departments']
+        self.assertEqual(
+            [('One', AGENCY['departments'][0]),
+             ('Two', AGENCY['departments'][1]),
+             (None, agency)],
+            list(yaml_stream.records(self.filename)))
+
+    def test_fields(self):
+        self.assertEqual(
+            [('One', {'website': 'http://one.ta.gov/'}), ('Two', {}),
+             (None, {'website': 'http://ta.gov/'})],
+            list(yaml_stream.records(self.filename, ['website'])))
+        self.assertEqual(
+            [{'name': 'One', 'top_level': True}, {'name': 'Two'}],
+            list(yaml_stream.departments(self.filename,
+                                         ['name', 'top_level'])))
+
+    def test_explorer(self):
+        agencies = explorer.agencies_from_yaml(self.tmp, fields=['website'])
+        self.assertEqual(
+            [('TA', 'website', 1, 1), ('ALL', 'website', 1, 1)],
+            [(r['agency'], r['field'], r['present'], r['missing'])
+             for r in explorer.field_coverage(agencies)])
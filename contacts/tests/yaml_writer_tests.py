@@ -0,0 +1,64 @@
+from glob import glob
+import os
+from unittest import TestCase
+
+import yaml
+
+import yaml_writer
+
+
+def pyyaml_dump(data):
+    return yaml.dump(data, default_flow_style=False, allow_unicode=True)
+
+
+class YamlWriterTests(TestCase):
+
+    def test_round_trip(self):
+        """ Every file in data/ is written back byte for byte """
+        filenames = glob("data" + os.sep + "*.yaml")
+        self.assertTrue(filenames)
+        for filename in filenames:
+            with open(filename) as f:
+                text = f.read()
+            self.assertEqual(text, yaml_writer.dump(yaml.load(text)),
+                             filename)
+
+    def test_scalar_styles(self):
+        data = {
+            'plain': 'Department of Justice',
+            'number': '2012',
+            'boolean': 'true',
+            'empty': '',
+            'indicator': '- item',
+            'quote': "it's: here",
+            'trailing': 'space ',
+            'lines': 'one\ntwo',
+            'control': 'tab\there \x00',
+            'unicode': 'Administración',
+            'flag': True,
+            'nothing': [],
+            'blank': {},
+        }
+        self.assertEqual(pyyaml_dump(data), yaml_writer.dump(data))
+
+    def test_wrapping(self):
+        words = ' '.join(['word'] * 40)
+        data = {
+            'description': words,
+            'departments': [
+                {'name': 'One', 'description': words,
+                 'misc': {words[:150]: {'phone': ['202-555-1111']},
+                          'Office\nof Two': {'name': "O'Neil " + words}}},
+            ],
+            'reading_rooms': [['Library ' + words, 'http://a.gov/'],
+                              ['Vault', 'http://a.gov/vault']],
+            'quoted': '"' + words + '"',
+        }
+        self.assertEqual(pyyaml_dump(data), yaml_writer.dump(data))
+
+    def test_fallback(self):
+        """ Data it doesn't know is handed to yaml.dump """
+        shared = ['a']
+        for data in [{'count': 3}, {'one': shared, 'two': shared},
+                     {1: 'a'}, ['a']]:
+            self.assertEqual(pyyaml_dump(data), yaml_writer.dump(data))
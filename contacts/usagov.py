@@ -2,7 +2,7 @@ import argparse
 import json
 import os
 
-import requests
+import http_client
 
 
 def setup_data_dir():
@@ -20,7 +20,7 @@ def grab_and_save_data():
     '''
 
     url = 'http://www.usa.gov/api/USAGovAPI/contacts.json/contacts'
-    r = requests.get(url)
+    r = http_client.get(url)
 
     data = r.json()['Contact']
 
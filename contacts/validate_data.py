@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+
+"""
+Checks every file in data/ and manual_data/ against the shape we expect of
+the contacts data: phone formats, complete addresses, well formed URLs and
+no duplicate departments. Files are validated in a process pool and the
+results are cached by file digest, so reruns only look at changed files.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+import json
+import logging
+import os
+import re
+import sys
+from urllib.parse import urlparse
+
+import yaml
+
+from scraper import DATA_DIRECTORY
+from sharding import agency_path, agency_paths, load_path, path_digest
+
+
+CACHE_FILENAME = 'validation_cache.json'
+# Bump when the rules below change so cached results are discarded
+RULES_VERSION = 1
+
+PHONE_FORMAT = re.compile(
+    r'^(\+\d+ )?\d{3}-\d{3}-\d{4}( x\d{1,5})?( \(TTY\))?$')
+STATE_FORMAT = re.compile(r'^[A-Z]{2}$')
+ZIP_FORMAT = re.compile(r'^\d{5}(-\d{4})?$')
+ADDRESS_FIELDS = ('street', 'city', 'state', 'zip')
+CONTACT_FIELDS = ('public_liaison', 'service_center', 'foia_officer')
+URL_FIELDS = ('website', 'request_form')
+
+
+def check_phone(where, field, number):
+    if not PHONE_FORMAT.match(str(number)):
+        yield '%s: malformed %s %r' % (where, field, number)
+
+
+def check_phones(where, data):
+    for field in ('phone', 'fax'):
+        if field in data:
+            for problem in check_phone(where, field, data[field]):
+                yield problem
+    contacts = [(field, data[field]) for field in CONTACT_FIELDS
+                if field in data]
+    contacts.extend(sorted((data.get('misc') or {}).items()))
+    for field, contact in contacts:
+        for number in (contact or {}).get('phone', []):
+            for problem in check_phone(where, field, number):
+                yield problem
+
+
+def check_address(where, address):
+    for field in ADDRESS_FIELDS:
+        if not address.get(field):
+            yield '%s: address missing %s' % (where, field)
+    if address.get('state') and not STATE_FORMAT.match(address['state']):
+        yield '%s: malformed state %r' % (where, address['state'])
+    if address.get('zip') and not ZIP_FORMAT.match(str(address['zip'])):
+        yield '%s: malformed zip %r' % (where, address['zip'])
+
+
+def check_url(where, field, url):
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https') or not parsed.netloc \
+            or re.search(r'\s', url):
+        yield '%s: malformed %s %r' % (where, field, url)
+
+
+def check_urls(where, data):
+    for field in URL_FIELDS:
+        if data.get(field):
+            for problem in check_url(where, field, data[field]):
+                yield problem
+    for reading_room in data.get('reading_rooms', []):
+        for problem in check_url(where, 'reading room', reading_room[-1]):
+            yield problem
+
+
+def check_record(where, data):
+    """ All of the checks for a single agency or department """
+    for check in (check_phones, check_urls):
+        for problem in check(where, data):
+            yield problem
+    if 'address' in data:
+        for problem in check_address(where, data['address']):
+            yield problem
+
+
+def duplicate_names(departments):
+    seen, dups = set(), []
+    for department in departments:
+        name = department.get('name')
+        if name in seen:
+            dups.append(name)
+        seen.add(name)
+    return dups
+
+
+def validate_data_file(filename):
+    """ Validate a file, or a sharded agency's directory, from data/ """
+    data = load_path(filename)
+    problems = list(check_record(filename, data))
+    departments = data.get('departments', [])
+    for department in departments:
+        where = '%s [%s]' % (filename, department.get('name'))
+        problems.extend(check_record(where, department))
+    for name in duplicate_names(departments):
+        problems.append('%s: duplicate department %s' % (filename, name))
+    return problems
+
+
+def validate_manual_file(filename, data_filename):
+    """ Validate a file from manual_data/; its agency and department names
+    must match those of its counterpart in data/ """
+    with open(filename) as f:
+        manual = yaml.load(f) or {}
+    if not os.path.exists(data_filename):
+        return ['%s: no counterpart %s' % (filename, data_filename)]
+    data = load_path(data_filename)
+
+    problems = []
+    if manual.get('name') and manual['name'] != data['name']:
+        problems.append('%s: agency name %s not in %s' % (
+            filename, manual['name'], data_filename))
+    names = set(d['name'] for d in data.get('departments', []))
+    manual_departments = manual.get('departments', [])
+    for department in manual_departments:
+        if department['name'] not in names:
+            problems.append('%s: department %s not in %s' % (
+                filename, department['name'], data_filename))
+        where = '%s [%s]' % (filename, department['name'])
+        problems.extend(check_record(where, department))
+    problems.extend(check_record(filename, manual))
+    for name in duplicate_names(manual_departments):
+        problems.append('%s: duplicate department %s' % (filename, name))
+    return problems
+
+
+def validate_file(job):
+    """ Run in a worker process. `job` is (filename, data counterpart), the
+    counterpart being None for files in data/ """
+    filename, data_filename = job
+    if data_filename:
+        return validate_manual_file(filename, data_filename)
+    return validate_data_file(filename)
+
+
+def cache_key(job):
+    filename, data_filename = job
+    key = [str(RULES_VERSION), filename, path_digest(filename)]
+    if data_filename and os.path.exists(data_filename):
+        key.append(path_digest(data_filename))
+    return ':'.join(key)
+
+
+def load_cache(cache_filename):
+    if os.path.isfile(cache_filename):
+        with open(cache_filename) as f:
+            return json.load(f)
+    return {}
+
+
+def save_cache(cache, cache_filename):
+    with open(cache_filename, 'w') as f:
+        json.dump(cache, f, indent=0, sort_keys=True)
+
+
+def validation_jobs(data_directory=DATA_DIRECTORY,
+                    manual_data_directory='manual_data'):
+    jobs = [(filename, None) for filename in agency_paths(data_directory)]
+    for filename in sorted(glob(manual_data_directory + os.sep + '*.yaml')):
+        data_filename = agency_path(
+            data_directory, os.path.basename(filename)[:-len('.yaml')])
+        jobs.append((filename, data_filename))
+    return jobs
+
+
+def validate_all(data_directory=DATA_DIRECTORY,
+                 manual_data_directory='manual_data',
+                 cache_filename=CACHE_FILENAME, workers=None):
+    """ Validate everything, reusing cached results for unchanged files.
+    Returns {filename: [problems]} """
+    cache = load_cache(cache_filename)
+    jobs = validation_jobs(data_directory, manual_data_directory)
+    keys = dict((job, cache_key(job)) for job in jobs)
+    todo = [job for job in jobs if keys[job] not in cache]
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for job, problems in zip(todo, executor.map(validate_file, todo)):
+                cache[keys[job]] = problems
+        # Only keep entries for the current files
+        cache = dict((keys[job], cache[keys[job]]) for job in jobs)
+        save_cache(cache, cache_filename)
+    return dict((job[0], cache[keys[job]]) for job in jobs)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    results = validate_all()
+    count = 0
+    for filename in sorted(results):
+        for problem in results[filename]:
+            logging.warning(problem)
+            count += 1
+    logging.info("Files checked: %s", len(results))
+    logging.info("Problems: %s", count)
+    sys.exit(1 if count else 0)
@@ -0,0 +1,193 @@
+"""
+Reads agency YAML files one department at a time. Rather than building the
+whole document, the file is read as a stream of parser events and only the
+requested fields of each department are turned into Python objects; the
+rest are skipped. Memory use stays flat however many files are scanned.
+
+    for department in yaml_stream.departments('data/DOJ.yaml',
+                                              ['name', 'website']):
+        ...
+"""
+
+import os
+
+import yaml
+from yaml.constructor import SafeConstructor
+from yaml.resolver import Resolver
+
+import sharding
+
+
+_resolver = Resolver()
+# libyaml's parser, when PyYAML was built with it, emits the same events
+Loader = getattr(yaml, 'CLoader', yaml.Loader)
+
+
+def compose(events, event, anchors):
+    """ The node starting with `event`, reading the rest of it from
+    `events`, as yaml's Composer would build it """
+    if isinstance(event, yaml.AliasEvent):
+        return anchors[event.anchor]
+    tag = event.tag
+    if isinstance(event, yaml.ScalarEvent):
+        if tag is None or tag == '!':
+            tag = _resolver.resolve(yaml.ScalarNode, event.value,
+                                    event.implicit)
+        node = yaml.ScalarNode(tag, event.value, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        if tag is None or tag == '!':
+            tag = _resolver.resolve(yaml.SequenceNode, None, event.implicit)
+        node = yaml.SequenceNode(tag, [], flow_style=event.flow_style)
+        for item in events:
+            if isinstance(item, yaml.SequenceEndEvent):
+                break
+            node.value.append(compose(events, item, anchors))
+    else:
+        if tag is None or tag == '!':
+            tag = _resolver.resolve(yaml.MappingNode, None, event.implicit)
+        node = yaml.MappingNode(tag, [], flow_style=event.flow_style)
+        for key in events:
+            if isinstance(key, yaml.MappingEndEvent):
+                break
+            key_node = compose(events, key, anchors)
+            node.value.append(
+                (key_node, compose(events, next(events), anchors)))
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+    return node
+
+
+def skip(events, event):
+    """ Read past the node starting with `event` """
+    depth = 0
+    while True:
+        if isinstance(event, yaml.CollectionStartEvent):
+            depth += 1
+        elif isinstance(event, yaml.CollectionEndEvent):
+            depth -= 1
+        if depth == 0:
+            return
+        event = next(events)
+
+
+def mapping_items(events):
+    """ Yield (key, first event of the value) for the mapping whose start
+    event was just read. Each value must be composed or skipped before
+    asking for the next item. """
+    for event in events:
+        if isinstance(event, yaml.MappingEndEvent):
+            return
+        if not isinstance(event, yaml.ScalarEvent):
+            raise ValueError('unexpected key %s' % event)
+        yield event.value, next(events)
+
+
+class Reader(object):
+    """ Builds the requested fields out of an event stream """
+
+    def __init__(self, events, fields):
+        self.events = events
+        self.fields = fields
+        self.anchors = {}
+        self.constructor = SafeConstructor()
+
+    def value(self, event):
+        node = compose(self.events, event, self.anchors)
+        return self.constructor.construct_document(node)
+
+    def wanted(self, key):
+        return self.fields is None or key in self.fields
+
+    def record(self):
+        """ A department, with only the wanted fields """
+        record = {}
+        for key, event in mapping_items(self.events):
+            if self.wanted(key):
+                record[key] = self.value(event)
+            else:
+                skip(self.events, event)
+        return record
+
+    def departments(self, event):
+        if not isinstance(event, yaml.SequenceStartEvent):
+            skip(self.events, event)
+            return
+        for event in self.events:
+            if isinstance(event, yaml.SequenceEndEvent):
+                return
+            yield self.record()
+
+
+def department_file(filename, wanted):
+    """ A department of a sharded agency, from its own file """
+    with open(filename) as f:
+        events = yaml.parse(f, Loader=Loader)
+        for event in events:
+            if isinstance(event, yaml.MappingStartEvent):
+                return Reader(events, wanted).record()
+    return {}
+
+
+def read_sharded(directory, fields, agency):
+    """ `read` for an agency stored one department per file """
+    wanted = None if fields is None else set(fields) | set(['name'])
+    manifest = sharding.load_file(os.path.join(directory, sharding.MANIFEST))
+    for filename in manifest.pop('departments', None) or []:
+        department = department_file(os.path.join(directory, filename),
+                                     wanted)
+        name = department.get('name')
+        if fields is not None and 'name' not in fields:
+            department.pop('name', None)
+        yield name, department
+    if agency:
+        yield None, dict((key, value) for key, value in manifest.items()
+                         if fields is None or key in fields)
+
+
+def read(filename, fields, agency):
+    """ Yield (department name, department) for each department, followed,
+    if `agency`, by (None, agency) """
+    if os.path.isdir(filename):
+        for item in read_sharded(filename, fields, agency):
+            yield item
+        return
+    wanted = None if fields is None else set(fields) | set(['name'])
+    with open(filename) as f:
+        events = yaml.parse(f, Loader=Loader)
+        for event in events:
+            if isinstance(event, yaml.MappingStartEvent):
+                break
+        else:
+            return
+        reader = Reader(events, wanted)
+        agency_data = {}
+        for key, event in mapping_items(events):
+            if key == 'departments':
+                for department in reader.departments(event):
+                    name = department.get('name')
+                    if fields is not None and 'name' not in fields:
+                        department.pop('name', None)
+                    yield name, department
+            elif agency and reader.wanted(key):
+                agency_data[key] = reader.value(event)
+            else:
+                skip(events, event)
+        if agency:
+            if fields is not None and 'name' not in fields:
+                agency_data.pop('name', None)
+            yield None, agency_data
+
+
+def records(filename, fields=None):
+    """ Yield each department of the agency in `filename` and then the
+    agency itself, with only `fields` (by default, all fields but the
+    agency's departments). Both are yielded as (department name, record),
+    the name being None for the agency. """
+    return read(filename, fields, True)
+
+
+def departments(filename, fields=None):
+    """ Yield each department of the agency in `filename`, with only
+    `fields` """
+    for name, department in read(filename, fields, False):
+        yield department
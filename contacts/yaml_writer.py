@@ -0,0 +1,415 @@
+"""
+Writes the contacts data as YAML, producing exactly what
+
+    yaml.dump(data, default_flow_style=False, allow_unicode=True)
+
+produces (sorted keys, block style, long strings wrapped at 80 columns)
+several times faster. It follows PyYAML's emitter rules but only knows the
+shapes found in data/: mappings with string keys, lists, strings and
+booleans. Anything else is handed to yaml.dump.
+"""
+
+import re
+
+import yaml
+from yaml.resolver import Resolver
+
+
+BEST_WIDTH = 80
+BEST_INDENT = 2
+BREAKS = '\n\x85\u2028\u2029'
+STR_TAG = 'tag:yaml.org,2002:str'
+
+ESCAPE_REPLACEMENTS = {
+    '\0': '0',
+    '\x07': 'a',
+    '\x08': 'b',
+    '\x09': 't',
+    '\x0A': 'n',
+    '\x0B': 'v',
+    '\x0C': 'f',
+    '\x0D': 'r',
+    '\x1B': 'e',
+    '\"': '\"',
+    '\\': '\\',
+    '\x85': 'N',
+    '\xA0': '_',
+    '\u2028': 'L',
+    '\u2029': 'P',
+}
+
+# Strings that are written plain in block context however they are wrapped,
+# found without analyzing them character by character
+PLAIN = re.compile(r"[A-Za-z0-9(][A-Za-z0-9 ().,/'&;_@+=%$*!?~\"-]*\Z")
+
+# Analyses and scalar styles, keyed by string
+_analyses = {}
+_styles = {}
+_resolver = Resolver()
+
+
+class Unsupported(Exception):
+    """ The data has something this writer doesn't handle """
+
+
+def analyze_scalar(scalar):
+    """ PyYAML's Emitter.analyze_scalar (with allow_unicode), returning
+    (multiline, allow block plain, allow single quoted) """
+    if not scalar:
+        return False, True, True
+
+    block_indicators = False
+    line_breaks = False
+    special_characters = False
+    leading_space = leading_break = False
+    trailing_space = trailing_break = False
+    break_space = space_break = False
+
+    if scalar.startswith('---') or scalar.startswith('...'):
+        block_indicators = True
+
+    preceded_by_whitespace = True
+    followed_by_whitespace = (len(scalar) == 1 or
+                              scalar[1] in '\0 \t\r\n\x85\u2028\u2029')
+    previous_space = previous_break = False
+
+    index = 0
+    while index < len(scalar):
+        ch = scalar[index]
+        if index == 0:
+            if ch in '#,[]{}&*!|>\'\"%@`':
+                block_indicators = True
+            if ch in '?:' and followed_by_whitespace:
+                block_indicators = True
+            if ch == '-' and followed_by_whitespace:
+                block_indicators = True
+        else:
+            if ch == ':' and followed_by_whitespace:
+                block_indicators = True
+            if ch == '#' and preceded_by_whitespace:
+                block_indicators = True
+
+        if ch in BREAKS:
+            line_breaks = True
+        if not (ch == '\n' or '\x20' <= ch <= '\x7E'):
+            if not ((ch == '\x85' or '\xA0' <= ch <= '\ud7ff'
+                     or '\ue000' <= ch <= '\ufffd'
+                     or '\U00010000' <= ch < '\U0010ffff')
+                    and ch != '\ufeff'):
+                special_characters = True
+
+        if ch == ' ':
+            if index == 0:
+                leading_space = True
+            if index == len(scalar) - 1:
+                trailing_space = True
+            if previous_break:
+                break_space = True
+            previous_space, previous_break = True, False
+        elif ch in BREAKS:
+            if index == 0:
+                leading_break = True
+            if index == len(scalar) - 1:
+                trailing_break = True
+            if previous_space:
+                space_break = True
+            previous_space, previous_break = False, True
+        else:
+            previous_space = previous_break = False
+
+        index += 1
+        preceded_by_whitespace = (ch in '\0 \t\r\n\x85\u2028\u2029')
+        followed_by_whitespace = (
+            index + 1 >= len(scalar) or
+            scalar[index + 1] in '\0 \t\r\n\x85\u2028\u2029')
+
+    allow_block_plain = allow_single_quoted = True
+    if leading_space or leading_break or trailing_space or trailing_break:
+        allow_block_plain = False
+    if break_space or space_break or special_characters:
+        allow_block_plain = allow_single_quoted = False
+    if line_breaks or block_indicators:
+        allow_block_plain = False
+    return line_breaks, allow_block_plain, allow_single_quoted
+
+
+def analysis(value):
+    if value not in _analyses:
+        if PLAIN.match(value) and value[-1] != ' ':
+            _analyses[value] = (False, True, True)
+        else:
+            _analyses[value] = analyze_scalar(value)
+    return _analyses[value]
+
+
+def simple_key(key):
+    """ Whether a mapping key is written as `key:` rather than `? key`.
+    PyYAML counts the length of the key's tag, !!str, towards the limit. """
+    return bool(key) and len(key) + len('!!str') < 128 \
+        and not analysis(key)[0]
+
+
+def scalar_style(value, simple_key):
+    """ '' for plain, "'" or '"', as PyYAML would choose for a string """
+    key = (value, simple_key)
+    if key not in _styles:
+        multiline, allow_plain, allow_single = analysis(value)
+        implicit = _resolver.resolve(
+            yaml.ScalarNode, value, (True, False)) == STR_TAG
+        if implicit and allow_plain and not (
+                simple_key and (not value or multiline)):
+            style = ''
+        elif allow_single and not (simple_key and multiline):
+            style = "'"
+        else:
+            style = '"'
+        _styles[key] = style
+    return _styles[key]
+
+
+class Writer(object):
+    """ The parts of PyYAML's Emitter state used by block style output """
+
+    def __init__(self):
+        self.parts = []
+        self.column = 0
+        self.whitespace = True
+        self.indention = True
+        self.indent = None
+        self.indents = []
+
+    def text(self):
+        return ''.join(self.parts)
+
+    def write(self, data):
+        self.parts.append(data)
+        self.column += len(data)
+
+    def increase_indent(self, flow=False, indentless=False):
+        self.indents.append(self.indent)
+        if self.indent is None:
+            self.indent = BEST_INDENT if flow else 0
+        elif not indentless:
+            self.indent += BEST_INDENT
+
+    def write_indicator(self, indicator, need_whitespace, whitespace=False,
+                        indention=False):
+        if self.whitespace or not need_whitespace:
+            self.write(indicator)
+        else:
+            self.write(' ' + indicator)
+        self.whitespace = whitespace
+        self.indention = self.indention and indention
+
+    def write_indent(self):
+        indent = self.indent or 0
+        if not self.indention or self.column > indent \
+                or (self.column == indent and not self.whitespace):
+            self.write_line_break()
+        if self.column < indent:
+            self.whitespace = True
+            self.write(' ' * (indent - self.column))
+
+    def write_line_break(self, data='\n'):
+        self.whitespace = True
+        self.indention = True
+        self.parts.append(data)
+        self.column = 0
+
+    def node(self, value, mapping=False):
+        if isinstance(value, str):
+            self.scalar(value, False)
+        elif isinstance(value, bool):
+            self.increase_indent(flow=True)
+            self.write_plain('true' if value else 'false', False)
+            self.indent = self.indents.pop()
+        elif isinstance(value, dict):
+            if value:
+                self.block_mapping(value)
+            else:
+                self.write_indicator('{', True, whitespace=True)
+                self.write_indicator('}', False)
+        elif isinstance(value, list):
+            if value:
+                self.block_sequence(value, mapping)
+            else:
+                self.write_indicator('[', True, whitespace=True)
+                self.write_indicator(']', False)
+        else:
+            raise Unsupported(type(value))
+
+    def block_mapping(self, value):
+        self.increase_indent()
+        for key in sorted(value):
+            if not isinstance(key, str):
+                raise Unsupported('key %r' % key)
+            self.write_indent()
+            if simple_key(key):
+                self.scalar(key, True)
+                self.write_indicator(':', False)
+            else:
+                self.write_indicator('?', True, indention=True)
+                self.scalar(key, False)
+                self.write_indent()
+                self.write_indicator(':', True, indention=True)
+            self.node(value[key], mapping=True)
+        self.indent = self.indents.pop()
+
+    def block_sequence(self, value, mapping):
+        self.increase_indent(indentless=mapping and not self.indention)
+        for item in value:
+            self.write_indent()
+            self.write_indicator('-', True, indention=True)
+            self.node(item)
+        self.indent = self.indents.pop()
+
+    def scalar(self, value, simple_key):
+        style = scalar_style(value, simple_key)
+        self.increase_indent(flow=True)
+        if style == '':
+            self.write_plain(value, not simple_key)
+        elif style == "'":
+            self.write_single_quoted(value, not simple_key)
+        else:
+            self.write_double_quoted(value, not simple_key)
+        self.indent = self.indents.pop()
+
+    def write_plain(self, text, split):
+        if not text:
+            return
+        if not self.whitespace:
+            self.write(' ')
+        self.whitespace = False
+        self.indention = False
+        # Plain scalars never have line breaks, and are only wrapped at a
+        # single space once past the width
+        if not split or self.column + len(text) <= BEST_WIDTH \
+                or ' ' not in text:
+            self.write(text)
+            return
+        spaces = False
+        start = end = 0
+        while end <= len(text):
+            ch = text[end] if end < len(text) else None
+            if spaces:
+                if ch != ' ':
+                    if start + 1 == end and self.column > BEST_WIDTH:
+                        self.write_indent()
+                        self.whitespace = False
+                        self.indention = False
+                    else:
+                        self.write(text[start:end])
+                    start = end
+            elif ch is None or ch == ' ':
+                self.write(text[start:end])
+                start = end
+            spaces = (ch == ' ')
+            end += 1
+
+    def write_single_quoted(self, text, split):
+        self.write_indicator("'", True)
+        if "'" not in text and (not split or ' ' not in text or
+                                self.column + len(text) <= BEST_WIDTH) \
+                and not any(ch in text for ch in BREAKS):
+            self.write(text)
+            self.write_indicator("'", False)
+            return
+        spaces = breaks = False
+        start = end = 0
+        while end <= len(text):
+            ch = text[end] if end < len(text) else None
+            if spaces:
+                if ch is None or ch != ' ':
+                    if start + 1 == end and self.column > BEST_WIDTH \
+                            and split and start != 0 and end != len(text):
+                        self.write_indent()
+                    else:
+                        self.write(text[start:end])
+                    start = end
+            elif breaks:
+                if ch is None or ch not in BREAKS:
+                    if text[start] == '\n':
+                        self.write_line_break()
+                    for br in text[start:end]:
+                        if br == '\n':
+                            self.write_line_break()
+                        else:
+                            self.write_line_break(br)
+                    self.write_indent()
+                    start = end
+            else:
+                if ch is None or ch in ' ' + BREAKS or ch == "'":
+                    if start < end:
+                        self.write(text[start:end])
+                        start = end
+            if ch == "'":
+                self.write("''")
+                start = end + 1
+            if ch is not None:
+                spaces = (ch == ' ')
+                breaks = (ch in BREAKS)
+            end += 1
+        self.write_indicator("'", False)
+
+    def write_double_quoted(self, text, split):
+        self.write_indicator('"', True)
+        start = end = 0
+        while end <= len(text):
+            ch = text[end] if end < len(text) else None
+            if ch is None or ch in '"\\\x85\u2028\u2029\ufeff' \
+                    or not ('\x20' <= ch <= '\x7E'
+                            or '\xA0' <= ch <= '\ud7ff'
+                            or '\ue000' <= ch <= '\ufffd'):
+                if start < end:
+                    self.write(text[start:end])
+                    start = end
+                if ch is not None:
+                    if ch in ESCAPE_REPLACEMENTS:
+                        data = '\\' + ESCAPE_REPLACEMENTS[ch]
+                    elif ch <= '\xFF':
+                        data = '\\x%02X' % ord(ch)
+                    elif ch <= '\uffff':
+                        data = '\\u%04X' % ord(ch)
+                    else:
+                        data = '\\U%08X' % ord(ch)
+                    self.write(data)
+                    start = end + 1
+            if 0 < end < len(text) - 1 and (ch == ' ' or start >= end) \
+                    and self.column + (end - start) > BEST_WIDTH and split:
+                data = text[start:end] + '\\'
+                if start < end:
+                    start = end
+                self.write(data)
+                self.write_indent()
+                self.whitespace = False
+                self.indention = False
+                if text[start] == ' ':
+                    self.write('\\')
+            end += 1
+        self.write_indicator('"', False)
+
+
+def check_shared(value, seen):
+    """ yaml.dump writes anchors and aliases for lists or dicts that appear
+    more than once """
+    if isinstance(value, (dict, list)):
+        if id(value) in seen:
+            raise Unsupported('shared %s' % type(value))
+        seen.add(id(value))
+        for item in (value.values() if isinstance(value, dict) else value):
+            check_shared(item, seen)
+
+
+def dump(data):
+    """ The same as yaml.dump(data, default_flow_style=False,
+    allow_unicode=True) """
+    try:
+        if not isinstance(data, dict):
+            raise Unsupported(type(data))
+        check_shared(data, set())
+        writer = Writer()
+        writer.node(data)
+        writer.write_indent()
+        return writer.text()
+    except Unsupported:
+        return yaml.dump(data, default_flow_style=False, allow_unicode=True)